@@ -0,0 +1,520 @@
+# async_app.py
+# Асинхронний (ASGI) режим обслуговування вебхука.
+# Важкі обробники (експертна відповідь, переклад пересланих новин, завантаження відео)
+# працюють на AsyncOpenAI, AsyncTeleBot, aiohttp та asyncpg без окремого потоку на кожен виклик.
+# Решта логіки перевикористовується з main.py; Flask-режим (gunicorn main:app) залишається запасним.
+#
+# Запуск: uvicorn async_app:app --host 0.0.0.0 --port 8080
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+
+import aiohttp
+import asyncpg
+import openai
+import telebot
+from telebot.async_telebot import AsyncTeleBot
+
+os.environ["BOT_PROCESS"] = "async" # The webhook is set up in AsyncWebhookApp.startup, not on import
+from main import (
+    Config, OpenAIService, TranslationCache, translation_cache, escape_markdown_v2, format_expert_answer,
+    build_forwarded_caption, find_bot_mention, is_social_media_link,
+    VideoTooLargeError, format_video_too_large, normalize_social_url, remember_uploaded_video,
+    register_update, get_update_chat_key, process_telegram_update,
+    handle_swear_words, handle_social_media_link, handle_bot_mention_command, handle_reply_to_bot_message,
+    handle_private_chat_message, handle_new_chat_members, social_downloader, social_video_cache, bot_identity,
+    conversation_context, start_webhook_service
+)
+
+
+# === Async Database Manager ===
+class AsyncDatabaseManager:
+    """asyncpg-backed subset of DatabaseManager used on the async hot path."""
+    def __init__(self, database_url, min_size=1, max_size=10):
+        self.database_url = database_url
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self.message_listeners = [] # Same contract as DatabaseManager.message_listeners
+
+    async def connect(self):
+        try:
+            self._pool = await asyncpg.create_pool(self.database_url, min_size=self.min_size, max_size=self.max_size)
+            logging.info(f"[{datetime.now()}] AsyncDB: Connection pool created (min {self.min_size}, max {self.max_size}).")
+        except Exception as e:
+            logging.critical(f"[{datetime.now()}] AsyncDB: Failed to create connection pool: {e}", exc_info=True)
+            self._pool = None
+
+    async def close(self):
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
+
+    async def save_message(self, telegram_message_id, user_id, username, message_content, message_date, chat_id_to_save, is_bot_message=False, bot_message_type=None, reply_to_message_id=None):
+        """Saves message information to the database (same upsert as DatabaseManager.save_message)."""
+        message_content_str = str(message_content) if message_content is not None else 'No content'
+        row = (telegram_message_id, user_id, username, message_content_str, message_date, is_bot_message, chat_id_to_save, bot_message_type, reply_to_message_id)
+        for listener in self.message_listeners:
+            try:
+                listener(row)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] AsyncDB: Message listener failed: {e}", exc_info=True)
+
+        if not self._pool:
+            logging.warning(f"[{datetime.now()}] AsyncDB: save_message has no connection pool. Message not saved.")
+            return
+        try:
+            await self._pool.execute(
+                """INSERT INTO messages (telegram_message_id, user_id, username, message, timestamp, is_bot, chat_id, bot_message_type, reply_to_message_id)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                   ON CONFLICT (telegram_message_id) DO UPDATE SET
+                       user_id = EXCLUDED.user_id,
+                       username = EXCLUDED.username,
+                       message = EXCLUDED.message,
+                       timestamp = EXCLUDED.timestamp,
+                       is_bot = EXCLUDED.is_bot,
+                       chat_id = EXCLUDED.chat_id,
+                       bot_message_type = EXCLUDED.bot_message_type,
+                       reply_to_message_id = COALESCE(EXCLUDED.reply_to_message_id, messages.reply_to_message_id);""",
+                *row
+            )
+            logging.info(f"[{datetime.now()}] AsyncDB: Message from User ID: {user_id} (Bot: {is_bot_message}, Type: {bot_message_type}) saved (Telegram ID: {telegram_message_id}).")
+        except asyncpg.PostgresError as e:
+            logging.error(f"[{datetime.now()}] AsyncDB: Error saving message: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncDB: Unexpected error in save_message: {e}", exc_info=True)
+
+
+# === Async OpenAI Service ===
+class AsyncOpenAIService(OpenAIService):
+    """OpenAIService with coroutine versions of the calls made while handling updates."""
+    def __init__(self, client, db, translation_cache=None):
+        super().__init__(client, translation_cache)
+        self.db = db
+        self._translations_in_flight = {} # cache_key -> asyncio.Task shared by concurrent callers
+
+    async def get_expert_answer(self, chat_id, current_query_text, reply_to_message_id=None, current_message_id=None):
+        logging.info(f"[{datetime.now()}] AsyncOpenAI: Generating expert answer for chat {chat_id}: '{current_query_text[:50]}...'")
+        # Same token-budgeted context as the sync path; its tail is in memory, so the thread hop is usually DB-free
+        raw_history = await asyncio.to_thread(conversation_context.build, chat_id, reply_to_message_id=reply_to_message_id, exclude_message_id=current_message_id)
+        messages_for_openai = self._build_expert_messages(raw_history, current_query_text)
+        try:
+            response = await self.client.chat.completions.create(
+                model="gpt-4.1-nano",
+                messages=messages_for_openai,
+                max_tokens=180,
+                temperature=0.8
+            )
+            return response.choices[0].message.content
+        except openai.APIError as e:
+            logging.error(f"[{datetime.now()}] AsyncOpenAI: API Error during expert answer generation: {e}", exc_info=True)
+            return f"Expert on break. Questions too complex. Reason: {e}. Try simplifying, if you can."
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncOpenAI: Unexpected error during expert answer generation: {e}", exc_info=True)
+            return f"Something went wrong getting expert opinion. Perhaps your question was too silly for me. Reason: {e}."
+
+    async def _request_translation_async(self, text, target_language):
+        response = await self.client.chat.completions.create(
+            model=self.translation_model,
+            messages=[
+                {"role": "system", "content": self.translator_system_prompt(target_language)},
+                {"role": "user", "content": text}
+            ],
+            max_tokens=500
+        )
+        return response.choices[0].message.content
+
+    async def _translate_and_cache(self, cache_key, text, target_language):
+        cached = await asyncio.to_thread(self.translation_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        translated_text = await self._request_translation_async(text, target_language)
+        await asyncio.to_thread(self.translation_cache.put, cache_key, target_language, self.translation_model, translated_text)
+        return translated_text
+
+    async def translate_text(self, text, target_language="українську"):
+        logging.info(f"[{datetime.now()}] AsyncOpenAI: Attempting to translate text: '{text[:50]}...' to {target_language}")
+        try:
+            if not self.translation_cache:
+                return await self._request_translation_async(text, target_language)
+            cache_key = TranslationCache.make_key(self.translation_model, self.translator_system_prompt(target_language), text)
+            cached = self.translation_cache.peek(cache_key)
+            if cached is not None:
+                return cached
+            # Single-flight within the event loop: concurrent forwards of the same post await one task
+            task = self._translations_in_flight.get(cache_key)
+            if task is None:
+                task = asyncio.ensure_future(self._translate_and_cache(cache_key, text, target_language))
+                self._translations_in_flight[cache_key] = task
+                task.add_done_callback(lambda _: self._translations_in_flight.pop(cache_key, None))
+            return await asyncio.shield(task)
+        except openai.APIError as e:
+            logging.error(f"[{datetime.now()}] AsyncOpenAI: API Error during translation: {e}", exc_info=True)
+            return f"Failed to translate text due to an error: {e}"
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncOpenAI: Unexpected error during text translation: {e}", exc_info=True)
+            return f"Несподівана помилка при перекладі: {e}"
+
+
+# === Bot Identity ===
+async def get_bot_user(identity):
+    """Cached bot user for the event loop: a due getMe refresh runs in a worker thread instead of blocking the loop."""
+    if identity.needs_refresh():
+        return await asyncio.to_thread(identity.get)
+    return identity.cached()
+
+
+# === Async Telegram Message Sender ===
+class AsyncTelegramMessageSender:
+    def __init__(self, bot_instance, db, bot_identity_instance):
+        self.bot = bot_instance
+        self.db = db
+        self.bot_identity = bot_identity_instance
+
+    async def send_and_save_message(self, chat_id, text, parse_mode=None, bot_message_type=None, telegram_message_id_to_reply=None, media_type=None, media_file=None, on_sent=None):
+        """Async counterpart of TelegramMessageSender.send_and_save_message."""
+        try:
+            reply_parameters = None
+            if telegram_message_id_to_reply:
+                reply_parameters = telebot.types.ReplyParameters(message_id=telegram_message_id_to_reply, chat_id=chat_id, allow_sending_without_reply=True)
+
+            if media_type == 'video' and media_file:
+                sent_message = await self.bot.send_video(chat_id, media_file, caption=text, parse_mode=parse_mode, reply_parameters=reply_parameters)
+            elif media_type == 'photo' and media_file:
+                sent_message = await self.bot.send_photo(chat_id, media_file, caption=text, parse_mode=parse_mode, reply_parameters=reply_parameters)
+            else:
+                sent_message = await self.bot.send_message(chat_id, text, parse_mode=parse_mode, reply_parameters=reply_parameters)
+
+            logging.info(f"[{datetime.now()}] AsyncSender: Повідомлення надіслано до чату {chat_id}, message_id: {sent_message.message_id}, тип: {bot_message_type}")
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncSender: Помилка при відправці повідомлення: {e}", exc_info=True)
+            return None
+
+        # Same as TelegramMessageSender: once sent, bookkeeping failures never turn into None
+        try:
+            if on_sent:
+                await asyncio.to_thread(on_sent, sent_message)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncSender: Помилка в on_sent для message_id {sent_message.message_id}: {e}", exc_info=True)
+        try:
+            sent_user = sent_message.from_user or await get_bot_user(self.bot_identity)
+            if sent_user is None:
+                logging.warning(f"[{datetime.now()}] AsyncSender: Bot identity unknown, message {sent_message.message_id} in chat {chat_id} is not saved.")
+                return sent_message.message_id
+            await self.db.save_message(
+                telegram_message_id=sent_message.message_id,
+                user_id=sent_user.id,
+                username=sent_user.username,
+                message_content=text,
+                message_date=datetime.utcnow(),
+                chat_id_to_save=chat_id,
+                is_bot_message=True,
+                bot_message_type=bot_message_type,
+                reply_to_message_id=telegram_message_id_to_reply
+            )
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] AsyncSender: Помилка при збереженні надісланого повідомлення {sent_message.message_id}: {e}", exc_info=True)
+        return sent_message.message_id
+
+
+# --- Global Async Instances (sessions are opened on ASGI startup) ---
+async_bot = AsyncTeleBot(Config.TELEGRAM_BOT_TOKEN)
+async_db_manager = AsyncDatabaseManager(Config.DATABASE_URL, min_size=Config.DB_POOL_MIN_CONNECTIONS, max_size=Config.DB_POOL_MAX_CONNECTIONS)
+async_db_manager.message_listeners.append(conversation_context.record)
+async_openai_service = AsyncOpenAIService(openai.AsyncOpenAI(api_key=Config.OPENAI_API_KEY), async_db_manager, translation_cache)
+async_telegram_sender = AsyncTelegramMessageSender(async_bot, async_db_manager, bot_identity)
+http_session = None # aiohttp.ClientSession, created on startup
+
+
+# === Async Handlers ===
+async def download_social_video_url_async(url):
+    """Resolves a social media link to a direct video URL via RapidAPI (async counterpart of SocialDownloader.download_video)."""
+    logging.info(f"[{datetime.now()}] AsyncSocialDownloader: Attempting to download video from URL: {url}")
+    try:
+        async with http_session.post(social_downloader.api_url, json={"url": url}, headers=social_downloader.headers, timeout=aiohttp.ClientTimeout(total=60)) as response:
+            if response.status == 404: return "Video not found or private."
+            if response.status == 400: return "Invalid link or API request error."
+            if response.status >= 300:
+                return f"Error from RapidAPI: {response.status} - {await response.text()}"
+            data = await response.json(content_type=None)
+        return social_downloader.select_video_url(url, data)
+    except asyncio.TimeoutError as e:
+        logging.error(f"[{datetime.now()}] AsyncSocialDownloader: Request to RapidAPI timed out: {e}", exc_info=True)
+        return "Request to video service timed out."
+    except aiohttp.ClientError as e:
+        logging.error(f"[{datetime.now()}] AsyncSocialDownloader: Connection error to RapidAPI: {e}", exc_info=True)
+        return "Connection error to video download service."
+
+async def fetch_video_file_async(video_url, max_bytes, chunk_size):
+    """Async counterpart of SocialDownloader.fetch_video_file: early size cutoff, spooled to a temp file."""
+    async with http_session.get(video_url, timeout=aiohttp.ClientTimeout(total=60)) as video_resp:
+        video_resp.raise_for_status()
+        if video_resp.content_length is not None and video_resp.content_length > max_bytes:
+            raise VideoTooLargeError(video_resp.content_length)
+
+        video_file = tempfile.NamedTemporaryFile(prefix="video-", suffix=".mp4")
+        try:
+            downloaded = 0
+            async for chunk in video_resp.content.iter_chunked(chunk_size):
+                downloaded += len(chunk)
+                if downloaded > max_bytes:
+                    raise VideoTooLargeError()
+                video_file.write(chunk)
+            video_file.flush()
+            video_file.seek(0)
+            return video_file
+        except BaseException:
+            video_file.close()
+            raise
+
+async def handle_social_media_link_async(chat_id, user_id, effective_message_content, telegram_message_id, chat_type):
+    """Async counterpart of handle_social_media_link."""
+    if not (chat_type in ['group', 'supergroup'] or (chat_type == 'private' and user_id == Config.OWNER_TELEGRAM_USER_ID)):
+        # The sync handler answers with the permission-denied message
+        await asyncio.to_thread(handle_social_media_link, chat_id, user_id, effective_message_content, telegram_message_id, chat_type)
+        return
+
+    await async_bot.send_chat_action(chat_id, "upload_video")
+    source_url = normalize_social_url(effective_message_content)
+
+    # Повторне посилання: надсилаємо вже завантажений у Telegram file_id
+    cached_file_id = await asyncio.to_thread(social_video_cache.get_file_id, source_url)
+    if cached_file_id:
+        if await async_telegram_sender.send_and_save_message(
+            chat_id, "", parse_mode="MarkdownV2",
+            bot_message_type='video_upload', telegram_message_id_to_reply=telegram_message_id,
+            media_type='video', media_file=cached_file_id
+        ):
+            logging.info(f"[{datetime.now()}] AsyncWebhook: Video for {source_url} served from cached file_id.")
+            return
+        await asyncio.to_thread(social_video_cache.invalidate, source_url, telegram_file_id=True)
+
+    result = await asyncio.to_thread(social_video_cache.get_resolved_url, source_url)
+    if not result:
+        result = await download_social_video_url_async(effective_message_content.strip())
+        if result and result.startswith("http"):
+            await asyncio.to_thread(social_video_cache.store, source_url, resolved_url=result)
+    if not (result and result.startswith("http")):
+        bot_response = "Не вдалося обробити посилання на відео\\. Спробуйте інше\\."
+        await async_telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='video_link_error', telegram_message_id_to_reply=telegram_message_id)
+        return
+
+    try:
+        video_file = await fetch_video_file_async(result, Config.VIDEO_MAX_SIZE_MB * 1024 * 1024, Config.VIDEO_DOWNLOAD_CHUNK_SIZE)
+        with video_file:
+            await async_telegram_sender.send_and_save_message(
+                chat_id, "", parse_mode="MarkdownV2",
+                bot_message_type='video_upload', telegram_message_id_to_reply=telegram_message_id,
+                media_type='video', media_file=video_file, on_sent=remember_uploaded_video(source_url)
+            )
+    except VideoTooLargeError as e:
+        await async_telegram_sender.send_and_save_message(chat_id, format_video_too_large(e.size_bytes), parse_mode="MarkdownV2", bot_message_type='video_too_large', telegram_message_id_to_reply=telegram_message_id)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        await asyncio.to_thread(social_video_cache.invalidate, source_url, resolved_url=True)
+        bot_response = f"Не вдалося завантажити відео через помилку\\: {escape_markdown_v2(str(e))}\\. Перевірте посилання або спробуйте пізніше\\."
+        await async_telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='video_download_error', telegram_message_id_to_reply=telegram_message_id)
+    except Exception as e:
+        logging.error(f"[{datetime.now()}] AsyncWebhook: Unexpected error processing video: {e}", exc_info=True)
+        bot_response = "Виникла несподівана помилка при обробці відео\\."
+        await async_telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='video_processing_error', telegram_message_id_to_reply=telegram_message_id)
+
+async def handle_forwarded_message_async(message_data, chat_id, telegram_message_id, effective_message_content):
+    """Async counterpart of handle_forwarded_message."""
+    translated_text_from_ai = ""
+    if effective_message_content:
+        await async_bot.send_chat_action(chat_id, "typing")
+        translated_text_from_ai = await async_openai_service.translate_text(effective_message_content)
+
+    final_caption = build_forwarded_caption(message_data, translated_text_from_ai)
+
+    media_type, media_file, bot_message_type, confirmation = None, None, 'news_forward_text', "\U0001F504 Переклад новини відправлено у групу\\. Дякую\\!"
+    if message_data.get('video'):
+        media_type, media_file = 'video', message_data['video']['file_id']
+        bot_message_type, confirmation = 'news_forward_video', "\U0001F504 Переклад новини \\(з відео\\) відправлено у групу\\. Дякую\\!"
+    elif isinstance(message_data.get('photo'), list) and message_data['photo']:
+        media_type, media_file = 'photo', message_data['photo'][-1]['file_id']
+        bot_message_type, confirmation = 'news_forward_photo', "\U0001F504 Переклад новини \\(з зображенням\\) відправлено у групу\\. Дякую\\!"
+    elif not effective_message_content:
+        logging.warning(f"[{datetime.now()}] AsyncWebhook: Отримано переслане повідомлення без тексту/підпису та без медіа. Ігноруємо.")
+        bot_response_private = "Отримано переслане повідомлення без тексту та медіа\\. Нічого перекладати або пересилати\\."
+        await async_telegram_sender.send_and_save_message(chat_id, bot_response_private, parse_mode="MarkdownV2", bot_message_type='no_content_forward', telegram_message_id_to_reply=telegram_message_id)
+        return
+
+    sent_id = await async_telegram_sender.send_and_save_message(
+        Config.GROUP_REPORT_CHAT_ID, final_caption, parse_mode="MarkdownV2",
+        bot_message_type=bot_message_type, media_type=media_type, media_file=media_file
+    )
+    if sent_id:
+        await async_telegram_sender.send_and_save_message(chat_id, confirmation, parse_mode="MarkdownV2", bot_message_type='translation_confirmation', telegram_message_id_to_reply=telegram_message_id)
+    else:
+        error_msg = "Ой, щось пішло не так при перекладі або відправці новини\\. Спробуйте ще раз\\."
+        await async_telegram_sender.send_and_save_message(chat_id, error_msg, parse_mode="MarkdownV2", bot_message_type='translation_error', telegram_message_id_to_reply=telegram_message_id)
+
+async def handle_bot_mention_command_async(chat_id, user_id, command_or_query_part, telegram_message_id, chat_type, reply_to_message_id=None):
+    """Async counterpart of handle_bot_mention_command: expert answers run async, other commands use the sync handler."""
+    is_allowed = chat_type in ['group', 'supergroup'] or (chat_type == 'private' and user_id == Config.OWNER_TELEGRAM_USER_ID)
+    command_text_lower = command_or_query_part.lower()
+    is_expert_query = not (command_text_lower == "стислийоглядвже" or command_text_lower.startswith("заплануй_анонс") or command_text_lower.startswith("заплануй анонс"))
+    if not (is_allowed and is_expert_query):
+        await asyncio.to_thread(handle_bot_mention_command, chat_id, user_id, command_or_query_part, telegram_message_id, chat_type, reply_to_message_id)
+        return
+
+    await async_bot.send_chat_action(chat_id, "typing")
+    expert_answer_raw = await async_openai_service.get_expert_answer(chat_id, command_or_query_part, reply_to_message_id=reply_to_message_id, current_message_id=telegram_message_id)
+    await async_telegram_sender.send_and_save_message(chat_id, format_expert_answer(expert_answer_raw), parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id, bot_message_type='expert_opinion')
+
+async def process_update_async(update_data):
+    """Routes an update: heavy I/O handlers run natively async, the rest run on a worker thread via the sync handlers."""
+    message_data = update_data.get('message')
+    if not message_data:
+        await asyncio.to_thread(process_telegram_update, update_data)
+        return
+
+    chat_id = message_data['chat']['id']
+    chat_type = message_data['chat']['type']
+    user_id = message_data.get('from', {}).get('id')
+    username = message_data.get('from', {}).get('username')
+    telegram_message_id = message_data.get('message_id')
+    reply_to_message_id = (message_data.get('reply_to_message') or {}).get('message_id')
+    message_text = message_data.get('text')
+    effective_message_content = message_text if message_text is not None else message_data.get('caption')
+
+    logging.info(f"[{datetime.now()}] AsyncWebhook: Message detected. Chat ID: {chat_id}, User ID: {user_id}, Content: '{effective_message_content[:50] if effective_message_content else 'No content'}'")
+
+    await async_db_manager.save_message(
+        telegram_message_id=telegram_message_id,
+        user_id=user_id,
+        username=username,
+        message_content=effective_message_content,
+        message_date=datetime.utcfromtimestamp(message_data.get('date')),
+        chat_id_to_save=chat_id,
+        is_bot_message=False,
+        reply_to_message_id=reply_to_message_id
+    )
+    await asyncio.to_thread(handle_swear_words, chat_id, effective_message_content, telegram_message_id)
+
+    bot_user = await get_bot_user(bot_identity)
+    bot_username = bot_user.username.lower() if bot_user and bot_user.username else ""
+    is_bot_explicitly_mentioned_in_text, mention_query_part = find_bot_mention(message_data, effective_message_content, bot_username)
+
+    if chat_type == 'private' and ('forward_from_chat' in message_data or 'forward_from' in message_data):
+        await handle_forwarded_message_async(message_data, chat_id, telegram_message_id, effective_message_content)
+    elif is_social_media_link(effective_message_content):
+        await handle_social_media_link_async(chat_id, user_id, effective_message_content, telegram_message_id, chat_type)
+    elif is_bot_explicitly_mentioned_in_text:
+        await handle_bot_mention_command_async(chat_id, user_id, mention_query_part, telegram_message_id, chat_type, reply_to_message_id)
+    elif 'reply_to_message' in message_data:
+        await asyncio.to_thread(handle_reply_to_bot_message, message_data, chat_id, user_id, effective_message_content, telegram_message_id, chat_type)
+    elif effective_message_content and chat_type == 'private':
+        await asyncio.to_thread(handle_private_chat_message, chat_id, user_id, effective_message_content, telegram_message_id)
+    elif 'new_chat_members' in message_data:
+        await asyncio.to_thread(handle_new_chat_members, message_data, chat_id, telegram_message_id)
+    else:
+        logging.info(f"[{datetime.now()}] AsyncWebhook: Unhandled update or general text in GROUP chat. Full update: {update_data}")
+
+
+# === ASGI Application ===
+class AsyncWebhookApp:
+    """
+    Minimal ASGI app exposing the Telegram webhook.
+    Updates of the same chat are chained so they run in order; the total number
+    of updates in flight is capped by ASYNC_MAX_CONCURRENT_UPDATES.
+    """
+    def __init__(self, max_concurrent_updates):
+        self.max_concurrent_updates = max_concurrent_updates
+        self._semaphore = None # Created inside the running event loop
+        self._chat_tails = {} # chat_key -> last scheduled task for that chat
+
+    async def startup(self):
+        global http_session
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_updates)
+        # Same per-host limit as main.http_client; aiohttp keeps connections alive and decompresses by default
+        http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=Config.HTTP_MAX_CONCURRENCY_PER_HOST))
+        await async_db_manager.connect()
+        # Updates are processed on this event loop, so main's update worker threads are not started
+        await asyncio.to_thread(start_webhook_service, start_update_workers=False)
+        logging.info(f"[{datetime.now()}] AsyncWebhook: ASGI app started (max {self.max_concurrent_updates} updates in flight).")
+
+    async def shutdown(self):
+        pending = list(self._chat_tails.values())
+        if pending:
+            logging.info(f"[{datetime.now()}] AsyncWebhook: Waiting for {len(pending)} in-flight update chain(s) before shutdown.")
+            await asyncio.wait(pending, timeout=30)
+        if http_session:
+            await http_session.close()
+        await async_bot.close_session()
+        await async_db_manager.close()
+
+    async def _run_in_order(self, previous_task, update_data):
+        if previous_task:
+            await asyncio.wait([previous_task])
+        async with self._semaphore:
+            try:
+                await process_update_async(update_data)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] AsyncWebhook: Error during asynchronous update processing: {e}", exc_info=True)
+
+    def _schedule(self, update_data):
+        chat_key = get_update_chat_key(update_data)
+        task = asyncio.create_task(self._run_in_order(self._chat_tails.get(chat_key), update_data))
+        self._chat_tails[chat_key] = task
+
+        def _forget(finished_task):
+            if self._chat_tails.get(chat_key) is finished_task:
+                del self._chat_tails[chat_key]
+        task.add_done_callback(_forget)
+
+    async def _read_body(self, receive):
+        body = b""
+        while True:
+            event = await receive()
+            body += event.get("body", b"")
+            if not event.get("more_body"):
+                return body
+
+    async def _respond(self, send, status, text):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain; charset=utf-8")]})
+        await send({"type": "http.response.body", "body": text.encode("utf-8")})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                event = await receive()
+                if event["type"] == "lifespan.startup":
+                    await self.startup()
+                    await send({"type": "lifespan.startup.complete"})
+                elif event["type"] == "lifespan.shutdown":
+                    await self.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        if scope["method"] == "GET" and scope["path"] == "/":
+            await self._respond(send, 200, "Bot is running (async mode).")
+            return
+        if scope["method"] != "POST" or scope["path"] != Config.WEBHOOK_PATH:
+            await self._respond(send, 404, "Not found")
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"content-type") != b"application/json":
+            logging.warning(f"[{datetime.now()}] AsyncWebhook: Received POST request with incorrect content-type: {headers.get(b'content-type')}")
+            await self._respond(send, 403, "Forbidden")
+            return
+
+        body = await self._read_body(receive)
+        try:
+            update_data = json.loads(body.decode("utf-8"))
+            if register_update(update_data.get('update_id')):
+                self._schedule(update_data)
+        except json.JSONDecodeError as e:
+            logging.error(f"[{datetime.now()}] AsyncWebhook: JSON decoding error: {e}. Raw data: {body[:200]}...", exc_info=True)
+        await self._respond(send, 200, "ok") # Always return 'ok' quickly
+
+
+app = AsyncWebhookApp(Config.ASYNC_MAX_CONCURRENT_UPDATES)
@@ -0,0 +1,48 @@
+# backfill_daily_stats.py
+# Перераховує таблиці-зведення daily_user_stats та word_freq з історії повідомлень.
+# Потрібно запустити один раз після появи таблиці, або щоб виправити розбіжності.
+#
+# Використання:
+#   python backfill_daily_stats.py              # уся історія
+#   python backfill_daily_stats.py --days 7     # лише останні 7 днів (UTC)
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+os.environ["BOT_PROCESS"] = "cli" # Importing main must not touch the webhook or start background threads
+
+try:
+    from main import db_manager
+except ImportError as e:
+    logging.critical(f"[{datetime.now()}] CRITICAL: Failed to import necessary components from main.py: {e}")
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the daily_user_stats and word_freq rollups from the messages table.")
+    parser.add_argument("--days", type=int, default=None, help="Only rebuild the last N UTC days (default: all history).")
+    args = parser.parse_args()
+
+    start_date = datetime.utcnow().date() - timedelta(days=args.days - 1) if args.days else None
+    db_manager.create_tables()
+    written = db_manager.backfill_daily_user_stats(start_date)
+    if written is None:
+        logging.critical(f"[{datetime.now()}] Backfill: Failed to rebuild daily_user_stats.")
+        sys.exit(1)
+    logging.info(f"[{datetime.now()}] Backfill: daily_user_stats rebuilt, {written} row(s) written.")
+
+    written = db_manager.backfill_word_freq(start_date)
+    if written is None:
+        logging.critical(f"[{datetime.now()}] Backfill: Failed to rebuild word_freq.")
+        sys.exit(1)
+    logging.info(f"[{datetime.now()}] Backfill: word_freq rebuilt, {written} row(s) written.")
+
+
+if __name__ == "__main__":
+    main()
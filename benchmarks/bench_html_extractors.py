@@ -0,0 +1,103 @@
+# benchmarks/bench_html_extractors.py
+# Бенчмарк парсингу сторінок ранкового звіту: повне дерево BeautifulSoup (старий шлях) проти бекендів html_extractors.
+# Для кожного джерела показує час розбору та пікову пам'ять (tracemalloc) і перевіряє, що всі бекенди витягують однакове.
+# tracemalloc бачить лише алокації Python: пам'ять усередині libxml2 (lxml) та lexbor (selectolax) не враховується.
+# Запуск з кореня репозиторію: python benchmarks/bench_html_extractors.py
+# Оновити фікстури реальними сторінками: python benchmarks/bench_html_extractors.py --refresh
+
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_extractors import HTML_BACKENDS, HtmlExtractor
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# source -> (fixture file, live URL, extractor method)
+SOURCES = {
+    "weather": ("meteo_kiev.html", "https://meteo.ua/ua/34/kiev", lambda ex, html: ex.weather_degree(html)),
+    "news": ("pravda_home.html", "https://www.pravda.ua/", lambda ex, html: ex.top_news_titles(html, limit=3)),
+    "usd_rate": ("nbu_exchangerates.html", "https://bank.gov.ua/ua/markets/exchangerates", lambda ex, html: ex.official_rate(html, "USD")),
+    "btc_price": ("finance_btc.html", "https://finance.ua/ua/crypto/btc", lambda ex, html: ex.btc_price(html)),
+}
+
+
+def legacy_extract(source, html):
+    """The previous implementation from NewsWeatherService: full html.parser tree, then find()."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    if source == "weather":
+        temp = soup.find(class_="menu-basic__degree")
+        return temp.get_text(strip=True) if temp else None
+    if source == "news":
+        block = soup.find("div", {"data-vr-zone": "Popular by views"})
+        return [a.find("a").get_text(strip=True) for a in block.find_all("div", class_="article_popular", limit=3)]
+    if source == "usd_rate":
+        for row in soup.find_all("tr"):
+            code = row.find("td", {"data-label": "Код літерний"})
+            if code and code.get_text(strip=True) == "USD":
+                return row.find("td", {"data-label": "Офіційний курс"}).get_text(strip=True)
+        return None
+    if source == "btc_price":
+        container = soup.find("div", class_="MainInfostyles__Price-sc-1pcfgvi-16 gfcnFW")
+        trend = soup.find("div", class_="MainInfostyles__Trend-sc-1pcfgvi-17 hwJIFp")
+        return (''.join(container.stripped_strings), trend.get_text(strip=True) if trend else '') if container else None
+
+
+def refresh_fixtures():
+    import requests
+    for source, (fixture, url, _) in SOURCES.items():
+        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=30)
+        response.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, fixture), "wb") as f:
+            f.write(response.content)
+        print(f"{source}: saved {len(response.content) / 1024:.0f} KB from {url}")
+
+
+def measure(func, number):
+    seconds = timeit.timeit(func, number=number) / number
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extractor backends on saved pages.")
+    parser.add_argument("--refresh", action="store_true", help="download the live pages into benchmarks/fixtures first")
+    parser.add_argument("--number", type=int, default=20, help="parses per measurement")
+    args = parser.parse_args()
+
+    if args.refresh:
+        refresh_fixtures()
+
+    extractors = {}
+    for name, backend_class in HTML_BACKENDS.items():
+        try:
+            extractors[name] = HtmlExtractor(backend_class())
+        except ImportError as e:
+            print(f"(skipping {name}: {e})")
+
+    for source, (fixture, url, extract) in SOURCES.items():
+        with open(os.path.join(FIXTURES_DIR, fixture), "rb") as f:
+            html = f.read()
+        print(f"\n{source} ({fixture}, {len(html) / 1024:.0f} KB)")
+
+        expected = legacy_extract(source, html)
+        seconds, peak = measure(lambda: legacy_extract(source, html), args.number)
+        print(f"  {'legacy bs4':<14} {seconds * 1000:8.2f} ms  peak {peak / 1024:8.0f} KB  -> {expected!r}")
+
+        for name, extractor in extractors.items():
+            value = extract(extractor, html)
+            seconds, peak = measure(lambda: extract(extractor, html), args.number)
+            mismatch = "" if value == expected else "  MISMATCH"
+            print(f"  {name:<14} {seconds * 1000:8.2f} ms  peak {peak / 1024:8.0f} KB  -> {value!r}{mismatch}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# benchmarks/bench_swear_matcher.py
+# Мікробенчмарк: SwearWordMatcher проти старого циклу re.findall по кожному шаблону.
+# Запуск з кореня репозиторію: python benchmarks/bench_swear_matcher.py
+
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from swear_matcher import SWEAR_WORDS_REGEX_PATTERNS, SwearWordMatcher
+
+SAMPLE_WORDS = [
+    "привіт", "як", "справи", "сьогодні", "погода", "гарна", "новини", "курс", "долара",
+    "біткоїн", "зустріч", "завтра", "дякую", "дуже", "цікаво", "відео", "посилання",
+    "блять", "сука", "хуйло", "мудак", "бляха", "лох", "херу", "нахуя", "ідіот", "дебіл",
+]
+
+
+def legacy_count(text):
+    """The previous implementation from handle_swear_words."""
+    cleaned_message = re.sub(r'[^\w\s]', '', text.lower())
+    return sum(len(re.findall(pattern, cleaned_message)) for pattern in SWEAR_WORDS_REGEX_PATTERNS)
+
+
+def make_messages(count, words_per_message, seed=42):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(SAMPLE_WORDS) for _ in range(words_per_message)]
+        messages.append(" ".join(w.capitalize() + rng.choice(["", ",", "!", "..."]) for w in words))
+    return messages
+
+
+def main():
+    matcher = SwearWordMatcher(SWEAR_WORDS_REGEX_PATTERNS)
+    for words_per_message in (8, 40, 200):
+        messages = make_messages(500, words_per_message)
+        mismatches = sum(1 for m in messages if legacy_count(m) != matcher.count(m))
+        legacy = timeit.timeit(lambda: [legacy_count(m) for m in messages], number=5)
+        single = timeit.timeit(lambda: [matcher.count(m) for m in messages], number=5)
+        print(
+            f"{words_per_message:>4} words/msg: legacy {legacy * 1000 / 2500:.4f} ms/msg, "
+            f"single-pass {single * 1000 / 2500:.4f} ms/msg, speedup x{legacy / single:.1f}, mismatches {mismatches}"
+        )
+
+    example = "Блять, ну це ж бляха якийсь мудак! Сука..."
+    print(f"Breakdown for {example!r}: {dict(matcher.breakdown(example))}")
+
+
+if __name__ == "__main__":
+    main()
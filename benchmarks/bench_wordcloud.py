@@ -0,0 +1,85 @@
+# benchmarks/bench_wordcloud.py
+# Бенчмарк рендеру хмари слів: старий шлях через matplotlib (plt.figure/imshow/savefig) проти WordCloudRenderer,
+# який кодує WordCloud.to_image() одразу в PNG/WebP.
+# Показує час рендеру, пікову пам'ять (tracemalloc), розмір файлу та час першого імпорту бекенду.
+# tracemalloc бачить лише алокації Python: буфери numpy/Pillow частково не враховуються.
+# Запуск з кореня репозиторію: python benchmarks/bench_wordcloud.py
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wordcloud_renderer import WordCloudRenderer
+
+SAMPLE_WORDS = [
+    "привіт", "сьогодні", "погода", "гарна", "новини", "курс", "долара", "біткоїн", "зустріч",
+    "завтра", "дякую", "цікаво", "відео", "посилання", "робота", "проєкт", "вихідні", "футбол",
+    "концерт", "кава", "обід", "машина", "квартира", "відпустка", "телефон", "ноутбук", "фільм",
+]
+
+
+def make_texts(count, seed=42):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(SAMPLE_WORDS) for _ in range(rng.randint(3, 25))) for _ in range(count)]
+
+
+def legacy_render(texts):
+    """The previous implementation of generate_wordcloud_image."""
+    from wordcloud import WordCloud
+    import matplotlib.pyplot as plt
+    wordcloud = WordCloud(width=800, height=400, min_word_length=4, background_color="white").generate(" ".join(texts))
+    img = io.BytesIO()
+    plt.figure(figsize=(10, 5))
+    plt.imshow(wordcloud, interpolation="bilinear")
+    plt.axis("off")
+    plt.savefig(img, format="PNG")
+    plt.close()
+    img.seek(0)
+    return img
+
+
+def measure(func, number):
+    func() # Warm-up: imports, fonts
+    seconds = timeit.timeit(func, number=number) / number
+    tracemalloc.start()
+    output = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak, len(output.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wordcloud rendering paths.")
+    parser.add_argument("--messages", type=int, default=2000, help="messages in the synthetic day")
+    parser.add_argument("--number", type=int, default=5, help="renders per measurement")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    import wordcloud  # noqa: F401
+    print(f"import wordcloud: {(time.perf_counter() - started) * 1000:.0f} ms")
+    started = time.perf_counter()
+    import matplotlib.pyplot  # noqa: F401
+    print(f"import matplotlib.pyplot (legacy path only): {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    texts = make_texts(args.messages)
+    renderers = {
+        "legacy matplotlib 800x400 -> 1000x500": legacy_render,
+        "renderer PNG 800x400 (default)": WordCloudRenderer(image_format="PNG").render,
+        "renderer WEBP 800x400": WordCloudRenderer(image_format="WEBP").render,
+        "renderer PNG 1280x640 (opt-in)": WordCloudRenderer(width=1280, height=640, image_format="PNG").render,
+    }
+    print(f"\n{args.messages} messages, {args.number} renders each")
+    for name, render in renderers.items():
+        seconds, peak, size = measure(lambda: render(texts), args.number)
+        print(f"  {name:<40} {seconds * 1000:8.1f} ms  peak {peak / 1024:8.0f} KB  file {size / 1024:6.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+# html_extractors.py
+# Витягування даних зі сторінок для ранкового звіту (meteo.ua, pravda.ua, bank.gov.ua, finance.ua).
+# Селектори описані декларативно в SOURCE_SELECTORS, а парсер підключається як бекенд:
+# selectolax (найшвидший), lxml або BeautifulSoup з SoupStrainer (розбирає лише потрібну частину сторінки).
+# Модуль не має побічних ефектів при імпорті, тому його можна використовувати з бенчмарків.
+
+import logging
+from datetime import datetime
+
+
+class Selector:
+    """Tag + attributes + classes, rendered as CSS (selectolax, soupsieve) or XPath (lxml)."""
+    def __init__(self, tag=None, attrs=None, classes=()):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.classes = tuple(classes)
+        self.css = (tag or "") + "".join(f".{c}" for c in self.classes) + "".join(f'[{k}="{v}"]' for k, v in self.attrs.items())
+        predicates = [f'[contains(concat(" ", normalize-space(@class), " "), " {c} ")]' for c in self.classes]
+        predicates += [f'[@{k}="{v}"]' for k, v in self.attrs.items()]
+        self.xpath = ".//" + (tag or "*") + "".join(predicates)
+
+    def __repr__(self):
+        return f"Selector({self.css!r})"
+
+
+# "scope" is what the SoupStrainer backend keeps while parsing: (tag, attrs) as accepted by bs4.SoupStrainer.
+# A list as an attribute value matches any of its items.
+SOURCE_SELECTORS = {
+    "weather": {
+        "scope": (None, {"class": "menu-basic__degree"}),
+        "degree": Selector(classes=["menu-basic__degree"]),
+    },
+    "news": {
+        "scope": ("div", {"data-vr-zone": "Popular by views"}),
+        "block": Selector("div", {"data-vr-zone": "Popular by views"}),
+        "article": Selector("div", classes=["article_popular"]),
+        "title": Selector("a"),
+    },
+    "usd_rate": {
+        "scope": ("tr", {}),
+        "row": Selector("tr"),
+        "code": Selector("td", {"data-label": "Код літерний"}),
+        "rate": Selector("td", {"data-label": "Офіційний курс"}),
+    },
+    "btc_price": {
+        "scope": ("div", {"class": ["MainInfostyles__Price-sc-1pcfgvi-16 gfcnFW", "MainInfostyles__Trend-sc-1pcfgvi-17 hwJIFp"]}),
+        "price": Selector("div", classes=["MainInfostyles__Price-sc-1pcfgvi-16", "gfcnFW"]),
+        "trend": Selector("div", classes=["MainInfostyles__Trend-sc-1pcfgvi-17", "hwJIFp"]),
+    },
+}
+
+
+# === Parser Backends ===
+class SoupStrainerBackend:
+    """BeautifulSoup (html.parser) that only builds the subtree matched by the source scope."""
+    name = "soupstrainer"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, SoupStrainer
+        self._soup = BeautifulSoup
+        self._strainer = SoupStrainer
+
+    def parse(self, html, scope=None):
+        parse_only = self._strainer(scope[0], attrs=scope[1]) if scope else None
+        return self._soup(html, "html.parser", parse_only=parse_only)
+
+    def select(self, node, selector, limit=None):
+        return node.select(selector.css, limit=limit or 0)
+
+    def text(self, node):
+        return node.get_text(strip=True)
+
+
+class LxmlBackend:
+    """lxml.html (libxml2) with XPath selectors; no cssselect dependency needed."""
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        self._lxml_html = lxml.html
+
+    def parse(self, html, scope=None):
+        return self._lxml_html.document_fromstring(html)
+
+    def select(self, node, selector, limit=None):
+        found = node.xpath(selector.xpath)
+        return found[:limit] if limit else found
+
+    def text(self, node):
+        return "".join(part.strip() for part in node.itertext())
+
+
+class SelectolaxBackend:
+    """selectolax (lexbor) with CSS selectors."""
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def parse(self, html, scope=None):
+        return self._parser(html)
+
+    def select(self, node, selector, limit=None):
+        found = node.css(selector.css)
+        return found[:limit] if limit else found
+
+    def text(self, node):
+        return node.text(deep=True, separator="", strip=True)
+
+
+HTML_BACKENDS = {backend.name: backend for backend in (SelectolaxBackend, LxmlBackend, SoupStrainerBackend)}
+
+
+def get_html_backend(name="auto"):
+    """
+    Returns a backend instance by name. "auto" picks the fastest one that is installed
+    (selectolax, then lxml, then BeautifulSoup, which is always a dependency).
+    """
+    names = list(HTML_BACKENDS) if name == "auto" else [name]
+    for backend_name in names:
+        try:
+            return HTML_BACKENDS[backend_name]()
+        except ImportError as e:
+            logging.warning(f"[{datetime.now()}] HtmlExtractor: Backend '{backend_name}' is not available: {e}")
+    raise ImportError(f"No HTML parser backend available (requested: {name})")
+
+
+# === Extractors ===
+class HtmlExtractor:
+    """Per-source extraction on top of a parser backend. Every method returns None if the data is not on the page."""
+    def __init__(self, backend, selectors=None):
+        self.backend = backend
+        self.selectors = selectors or SOURCE_SELECTORS
+
+    def _first_text(self, node, selector):
+        found = self.backend.select(node, selector, limit=1)
+        return self.backend.text(found[0]) if found else None
+
+    def weather_degree(self, html):
+        spec = self.selectors["weather"]
+        return self._first_text(self.backend.parse(html, spec["scope"]), spec["degree"])
+
+    def top_news_titles(self, html, limit=3):
+        spec = self.selectors["news"]
+        doc = self.backend.parse(html, spec["scope"])
+        blocks = self.backend.select(doc, spec["block"], limit=1)
+        if not blocks:
+            return None
+        titles = []
+        for article in self.backend.select(blocks[0], spec["article"], limit=limit):
+            title = self._first_text(article, spec["title"])
+            if title is not None:
+                titles.append(title)
+        return titles
+
+    def official_rate(self, html, currency_code="USD"):
+        spec = self.selectors["usd_rate"]
+        doc = self.backend.parse(html, spec["scope"])
+        for row in self.backend.select(doc, spec["row"]):
+            if self._first_text(row, spec["code"]) == currency_code:
+                return self._first_text(row, spec["rate"])
+        return None
+
+    def btc_price(self, html):
+        """Returns (price, change); change is '' when the trend block is missing."""
+        spec = self.selectors["btc_price"]
+        doc = self.backend.parse(html, spec["scope"])
+        price = self._first_text(doc, spec["price"])
+        if price is None:
+            return None
+        return price, self._first_text(doc, spec["trend"]) or ""
@@ -2,15 +2,17 @@
 import logging
 import os
 import telebot
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 import psycopg2
-from datetime import datetime, timedelta, date as dt_date
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import psycopg2.extensions
+import psycopg2.extras
+from datetime import datetime, timedelta, timezone, date as dt_date
 import requests
-from bs4 import BeautifulSoup
-import io
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import threading
+import queue
+from collections import OrderedDict, deque
 import schedule
 import time
 import openai
@@ -19,6 +21,22 @@ import urllib.parse
 import re
 import sys
 import random
+import atexit
+import concurrent.futures
+import contextlib
+import glob
+import hashlib
+import heapq
+import select
+import tempfile
+from zoneinfo import ZoneInfo
+from swear_matcher import SWEAR_WORDS_REGEX_PATTERNS, SwearWordMatcher
+try:
+    import tiktoken
+except ImportError: # Optional: token counts fall back to a character-based estimate
+    tiktoken = None
+from html_extractors import HtmlExtractor, get_html_backend
+from wordcloud_renderer import UKRAINIAN_STOP_WORDS, WordCloudRenderer, WordFrequencyCounter, normalize_word
 
 # --- ПОЧАТКОВЕ НАЛАШТУВАННЯ ЛОГУВАННЯ ---
 logging.basicConfig(level=logging.INFO,
@@ -47,6 +65,110 @@ class Config:
     RAPIDAPI_KEY = os.environ.get("RAPIDAPI_KEY")
     RAPIDAPI_HOST = os.environ.get("RAPIDAPI_HOST")
     DATABASE_URL = os.environ.get("DATABASE_URL")
+    # What importing main starts: "web" (gunicorn main:app) sets the webhook and starts the update workers.
+    # scheduler_process.py, async_app.py and the one-shot CLIs set their own role and call the start functions they need.
+    PROCESS_ROLE = os.environ.get("BOT_PROCESS", "web")
+    # Database connection pool sizing (per process)
+    DB_POOL_MIN_CONNECTIONS = int(os.environ.get("DB_POOL_MIN_CONNECTIONS", 1))
+    DB_POOL_MAX_CONNECTIONS = int(os.environ.get("DB_POOL_MAX_CONNECTIONS", 10))
+    # Idle connections older than this are health-checked with SELECT 1 before reuse
+    DB_POOL_IDLE_CHECK_SECONDS = int(os.environ.get("DB_POOL_IDLE_CHECK_SECONDS", 30))
+    DB_POOL_CHECKOUT_TIMEOUT_SECONDS = int(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT_SECONDS", 30))
+    # Write-behind buffer for inserts into `messages`
+    MESSAGE_WRITE_BUFFER_ENABLED = os.environ.get("MESSAGE_WRITE_BUFFER_ENABLED", "true").lower() == "true"
+    MESSAGE_WRITE_BATCH_SIZE = int(os.environ.get("MESSAGE_WRITE_BATCH_SIZE", 100))
+    MESSAGE_WRITE_FLUSH_INTERVAL_MS = int(os.environ.get("MESSAGE_WRITE_FLUSH_INTERVAL_MS", 500))
+    MESSAGE_WRITE_MAX_PENDING = int(os.environ.get("MESSAGE_WRITE_MAX_PENDING", 10000))
+    # Rows that could not be written at shutdown are spilled here and replayed on next start
+    MESSAGE_WRITE_SPILL_DIR = os.environ.get("MESSAGE_WRITE_SPILL_DIR", "message_spill")
+    # Social video relay: Telegram bot upload limit and download chunk size
+    VIDEO_MAX_SIZE_MB = int(os.environ.get("VIDEO_MAX_SIZE_MB", 50))
+    VIDEO_DOWNLOAD_CHUNK_SIZE = int(os.environ.get("VIDEO_DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+    # Social video cache: RapidAPI media URLs expire on the CDN side, Telegram file_ids do not
+    VIDEO_RESOLVED_URL_TTL_SECONDS = int(os.environ.get("VIDEO_RESOLVED_URL_TTL_SECONDS", 3600))
+    VIDEO_CACHE_MEMORY_ENTRIES = int(os.environ.get("VIDEO_CACHE_MEMORY_ENTRIES", 1000))
+    # Translations of forwarded posts: in-process LRU size (the translation_cache table has no limit)
+    TRANSLATION_CACHE_MEMORY_ENTRIES = int(os.environ.get("TRANSLATION_CACHE_MEMORY_ENTRIES", 2000))
+    # Expert answers are streamed into a placeholder message that is edited as tokens arrive.
+    # Telegram allows roughly one edit per second in a private chat and 20 per minute in a group.
+    EXPERT_ANSWER_STREAMING = os.environ.get("EXPERT_ANSWER_STREAMING", "true").lower() == "true"
+    EXPERT_STREAM_EDIT_INTERVAL_SECONDS = float(os.environ.get("EXPERT_STREAM_EDIT_INTERVAL_SECONDS", 1.0))
+    EXPERT_STREAM_GROUP_EDIT_INTERVAL_SECONDS = float(os.environ.get("EXPERT_STREAM_GROUP_EDIT_INTERVAL_SECONDS", 3.0))
+    # Daily summary: days larger than one chunk are summarized map-reduce style
+    SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", 3000))
+    SUMMARY_CHUNK_SUMMARY_TOKENS = int(os.environ.get("SUMMARY_CHUNK_SUMMARY_TOKENS", 200))
+    SUMMARY_MAX_MESSAGE_TOKENS = int(os.environ.get("SUMMARY_MAX_MESSAGE_TOKENS", 300))
+    SUMMARY_MAX_PARALLEL_CHUNKS = int(os.environ.get("SUMMARY_MAX_PARALLEL_CHUNKS", 4))
+    # Rolling per-chat summary: fold new messages into the stored running summary every N messages
+    ROLLING_SUMMARY_EVERY_N_MESSAGES = int(os.environ.get("ROLLING_SUMMARY_EVERY_N_MESSAGES", 50))
+    ROLLING_SUMMARY_TOKENS = int(os.environ.get("ROLLING_SUMMARY_TOKENS", 400))
+    ROLLING_SUMMARY_POLL_MINUTES = int(os.environ.get("ROLLING_SUMMARY_POLL_MINUTES", 5))
+    # Rows are folded only once inserted this long ago, so a lower id committed late is not skipped
+    ROLLING_SUMMARY_SETTLE_SECONDS = int(os.environ.get("ROLLING_SUMMARY_SETTLE_SECONDS", 60))
+    # Expert answer context: token budget instead of a fixed row count, and the in-memory per-chat tail
+    CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1200))
+    CONTEXT_MAX_ENTRY_TOKENS = int(os.environ.get("CONTEXT_MAX_ENTRY_TOKENS", 200))
+    CONTEXT_MAX_REPLY_DEPTH = int(os.environ.get("CONTEXT_MAX_REPLY_DEPTH", 6))
+    CONTEXT_TAIL_SIZE = int(os.environ.get("CONTEXT_TAIL_SIZE", 50))
+    CONTEXT_TAIL_TTL_SECONDS = int(os.environ.get("CONTEXT_TAIL_TTL_SECONDS", 300))
+    # Scheduled facts are served from a pre-generated pool, refilled off-peak in batches
+    FACT_POOL_BATCH_SIZE = int(os.environ.get("FACT_POOL_BATCH_SIZE", 20))
+    FACT_POOL_MIN_AVAILABLE = int(os.environ.get("FACT_POOL_MIN_AVAILABLE", 8))
+    FACT_POOL_SIMILARITY_THRESHOLD = float(os.environ.get("FACT_POOL_SIMILARITY_THRESHOLD", 0.6))
+    FACT_POOL_REFILL_TIME_UTC = os.environ.get("FACT_POOL_REFILL_TIME_UTC", "01:30") # 04:30 Kyiv time
+    # Durable job queue used by scheduler_process.py (any number of worker processes)
+    JOB_WORKER_THREADS = int(os.environ.get("JOB_WORKER_THREADS", 4))
+    JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 5))
+    JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 900)) # A crashed worker's job is picked up again after this
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BASE_SECONDS = int(os.environ.get("JOB_RETRY_BASE_SECONDS", 60)) # Doubles with every attempt
+    JOB_CATCH_UP_HOURS = float(os.environ.get("JOB_CATCH_UP_HOURS", 3)) # Missed slots older than this (or from an earlier day) are skipped
+    # Announcements are sent on time from an in-memory heap woken by LISTEN/NOTIFY; the DB is re-read this often as a safety net
+    ANNOUNCEMENT_RESYNC_SECONDS = int(os.environ.get("ANNOUNCEMENT_RESYNC_SECONDS", 300))
+    # Scheduled reports fanned out to every chat in chat_subscriptions (see subscriptions.py)
+    DEFAULT_SUBSCRIPTION_TIMEZONE = os.environ.get("DEFAULT_SUBSCRIPTION_TIMEZONE", "Europe/Kyiv")
+    FANOUT_MAX_PARALLEL_CHATS = int(os.environ.get("FANOUT_MAX_PARALLEL_CHATS", 8))
+    # Telegram allows about 30 messages/s per bot, 1 message/s per chat and 20 messages/min per group
+    TELEGRAM_GLOBAL_MESSAGES_PER_SECOND = float(os.environ.get("TELEGRAM_GLOBAL_MESSAGES_PER_SECOND", 25))
+    TELEGRAM_PRIVATE_CHAT_INTERVAL_SECONDS = float(os.environ.get("TELEGRAM_PRIVATE_CHAT_INTERVAL_SECONDS", 1.0))
+    TELEGRAM_GROUP_CHAT_INTERVAL_SECONDS = float(os.environ.get("TELEGRAM_GROUP_CHAT_INTERVAL_SECONDS", 3.0))
+    # Morning report sources: per-source cache TTLs and how long the report waits for a slow source
+    WEATHER_CACHE_TTL_SECONDS = int(os.environ.get("WEATHER_CACHE_TTL_SECONDS", 30 * 60))
+    # Well under a day: the report runs at the same time daily, so a 24h TTL could still serve yesterday's NBU rate
+    USD_RATE_CACHE_TTL_SECONDS = int(os.environ.get("USD_RATE_CACHE_TTL_SECONDS", 3 * 60 * 60))
+    BTC_PRICE_CACHE_TTL_SECONDS = int(os.environ.get("BTC_PRICE_CACHE_TTL_SECONDS", 60))
+    NEWS_CACHE_TTL_SECONDS = int(os.environ.get("NEWS_CACHE_TTL_SECONDS", 15 * 60))
+    REPORT_SOURCES_TIMEOUT_SECONDS = float(os.environ.get("REPORT_SOURCES_TIMEOUT_SECONDS", 12))
+    # HTML parser for the scrapers: auto | selectolax | lxml | soupstrainer (see html_extractors.py)
+    HTML_PARSER_BACKEND = os.environ.get("HTML_PARSER_BACKEND", "auto")
+    # Daily report wordcloud, PNG or WEBP. 800x400 keeps the render faster than the old matplotlib path;
+    # larger canvases (long side capped at 1280, Telegram's photo size) are opt-in and cost render time
+    WORDCLOUD_WIDTH = int(os.environ.get("WORDCLOUD_WIDTH", 800))
+    WORDCLOUD_HEIGHT = int(os.environ.get("WORDCLOUD_HEIGHT", 400))
+    WORDCLOUD_IMAGE_FORMAT = os.environ.get("WORDCLOUD_IMAGE_FORMAT", "PNG")
+    WORDCLOUD_FONT_PATH = os.environ.get("WORDCLOUD_FONT_PATH") # Defaults to the font bundled with wordcloud
+    WORDCLOUD_MASK_PATH = os.environ.get("WORDCLOUD_MASK_PATH")
+    WORDCLOUD_MAX_DISTINCT_WORDS = int(os.environ.get("WORDCLOUD_MAX_DISTINCT_WORDS", 5000))
+    WORDCLOUD_CURSOR_ITERSIZE = int(os.environ.get("WORDCLOUD_CURSOR_ITERSIZE", 5000))
+    WORDCLOUD_STOP_WORDS = [word.strip() for word in os.environ.get("WORDCLOUD_STOP_WORDS", "content").split(",") if word.strip()]
+    WORDCLOUD_MAX_WORDS = int(os.environ.get("WORDCLOUD_MAX_WORDS", 200)) # Words drawn; multi-day clouds read only these from word_freq
+    # Shared outbound HTTP client: keep-alive pools, retries with jittered backoff, per-host concurrency
+    HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 20))
+    HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 10))
+    HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", 3))
+    HTTP_BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", 0.5))
+    HTTP_MAX_CONCURRENCY_PER_HOST = int(os.environ.get("HTTP_MAX_CONCURRENCY_PER_HOST", 4))
+    HTTP_MAX_RETRY_AFTER_SECONDS = float(os.environ.get("HTTP_MAX_RETRY_AFTER_SECONDS", 10)) # Longer Retry-After waits are cut to this
+    # Webhook update processing: fixed worker count and bounded backlog
+    UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", 8))
+    UPDATE_QUEUE_MAX_SIZE = int(os.environ.get("UPDATE_QUEUE_MAX_SIZE", 500))
+    # How long webhook() waits for room in a full backlog before asking Telegram to redeliver
+    UPDATE_SUBMIT_TIMEOUT_SECONDS = float(os.environ.get("UPDATE_SUBMIT_TIMEOUT_SECONDS", 5))
+    # Async (ASGI) serving mode, see async_app.py: cap on updates processed concurrently
+    ASYNC_MAX_CONCURRENT_UPDATES = int(os.environ.get("ASYNC_MAX_CONCURRENT_UPDATES", 1000))
+    # Cached bot identity (getMe): periodic refresh and minimum delay between retries after a failure
+    BOT_IDENTITY_TTL_SECONDS = int(os.environ.get("BOT_IDENTITY_TTL_SECONDS", 3600))
+    BOT_IDENTITY_RETRY_SECONDS = int(os.environ.get("BOT_IDENTITY_RETRY_SECONDS", 30))
 
     @classmethod
     def validate(cls):
@@ -64,9 +186,66 @@ Config.validate()
 
 # --- Global Instances (initialized once) ---
 bot = telebot.TeleBot(Config.TELEGRAM_BOT_TOKEN)
+
+
+# --- Bot Identity Cache ---
+class BotIdentity:
+    """
+    Caches the bot's own user (getMe) so handlers do not make a Telegram round-trip per message.
+    The value is refreshed every `ttl_seconds`; if a refresh fails the last known identity
+    is kept, and when nothing is cached yet retries are spaced by `retry_seconds`.
+    """
+    def __init__(self, bot_instance, ttl_seconds=3600, retry_seconds=30):
+        self.bot = bot_instance
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._user = None
+        self._loaded_at = 0.0
+        self._last_attempt_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Fetches getMe from Telegram. Returns the cached user (possibly stale or None) on failure."""
+        with self._lock:
+            self._last_attempt_at = time.monotonic()
+            try:
+                self._user = self.bot.get_me()
+                self._loaded_at = self._last_attempt_at
+                logging.info(f"[{datetime.now()}] BotIdentity: Loaded bot identity @{self._user.username} (ID: {self._user.id}).")
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] BotIdentity: Failed to load bot identity: {e}", exc_info=True)
+            return self._user
+
+    def needs_refresh(self):
+        """True when get() would call getMe: the identity is expired or missing and no attempt was made recently."""
+        now = time.monotonic()
+        if self._user is not None and now - self._loaded_at < self.ttl_seconds:
+            return False
+        return now - self._last_attempt_at >= self.retry_seconds
+
+    def cached(self):
+        """Returns the cached bot user (possibly stale or None) without any network call."""
+        return self._user
+
+    def get(self):
+        """Returns the cached bot user, refreshing it when expired or missing (rate-limited after failures)."""
+        if self.needs_refresh():
+            return self.refresh()
+        return self._user
+
+    @property
+    def id(self):
+        user = self.get()
+        return user.id if user else None
+
+    @property
+    def username(self):
+        user = self.get()
+        return user.username if user else None
+
+
+bot_identity = BotIdentity(bot, ttl_seconds=Config.BOT_IDENTITY_TTL_SECONDS, retry_seconds=Config.BOT_IDENTITY_RETRY_SECONDS)
 openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
-# Global variable for database connection, managed by DatabaseManager
-db_connection_global = None
 
 # --- Idempotency Cache for Webhook Updates ---
 processed_updates = {}
@@ -83,17 +262,117 @@ def clean_processed_updates_cache():
         del processed_updates[update_id]
         logging.debug(f"[{datetime.now()}] Idempotency: Cleaned old entry for update_id {update_id}.")
 
+def register_update(update_id):
+    """Records an update_id in the idempotency cache. Returns False if it was already processed."""
+    if not update_id:
+        return True
+    if update_id in processed_updates:
+        logging.warning(f"[{datetime.now()}] Idempotency: Update with ID {update_id} already processed. Ignoring.")
+        return False
+    processed_updates[update_id] = time.time()
+    logging.info(f"[{datetime.now()}] Idempotency: Added update_id {update_id} to processed cache.")
+    return True
+
 # Function to run the cache cleaner in a loop
 def run_cleaner_job():
     while True:
         clean_processed_updates_cache()
         time.sleep(IDEMPOTENCY_WINDOW_SECONDS / 2) # Run twice as often as the window size, e.g., every 30 seconds for a 60-second window
 
-# Start cache cleaning in a separate thread
-cleaner_thread = threading.Thread(target=run_cleaner_job)
-cleaner_thread.daemon = True # Allow the main program to exit even if this thread is still running
-cleaner_thread.start()
-logging.info(f"[{datetime.now()}] Idempotency: Cache cleaner thread started.")
+def start_cache_cleaner():
+    """Starts cache cleaning in a separate thread (webhook servers only)."""
+    cleaner_thread = threading.Thread(target=run_cleaner_job)
+    cleaner_thread.daemon = True # Allow the main program to exit even if this thread is still running
+    cleaner_thread.start()
+    logging.info(f"[{datetime.now()}] Idempotency: Cache cleaner thread started.")
+
+
+# === Update Dispatcher (bounded worker pool) ===
+class UpdateDispatcher:
+    """
+    Fixed-size worker pool for webhook updates.
+    Updates are queued per chat so that one chat is always processed in order,
+    while different chats are handled in parallel. The total backlog is bounded:
+    submit() blocks while it is full and returns False if no room frees up in time.
+    """
+    def __init__(self, handler, num_workers=8, max_pending=500, submit_timeout_seconds=5):
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        self.max_pending = max(1, max_pending)
+        self.submit_timeout_seconds = submit_timeout_seconds
+        self._chat_queues = {} # chat_key -> deque of pending items; present while the chat is queued or being processed
+        self._ready = queue.Queue() # chat keys whose head item is ready for a worker
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._stats = {
+            "submitted": 0,
+            "processed": 0,
+            "failed": 0,
+            "overflow_waits": 0,
+            "rejected": 0,
+            "max_pending_seen": 0
+        }
+
+    def start(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"update-worker-{i}")
+            worker.daemon = True
+            worker.start()
+        logging.info(f"[{datetime.now()}] Dispatcher: Started {self.num_workers} update workers (max backlog {self.max_pending}).")
+
+    def submit(self, chat_key, item):
+        """Queues an item behind earlier items of the same chat. Returns False if the backlog stayed full."""
+        with self._cond:
+            if self._pending >= self.max_pending:
+                self._stats["overflow_waits"] += 1
+                logging.warning(f"[{datetime.now()}] Dispatcher: Backlog full ({self._pending}/{self.max_pending}). Waiting up to {self.submit_timeout_seconds}s.")
+                if not self._cond.wait_for(lambda: self._pending < self.max_pending, timeout=self.submit_timeout_seconds):
+                    self._stats["rejected"] += 1
+                    logging.error(f"[{datetime.now()}] Dispatcher: Backlog still full, rejecting update for chat {chat_key}.")
+                    return False
+
+            self._pending += 1
+            self._stats["submitted"] += 1
+            self._stats["max_pending_seen"] = max(self._stats["max_pending_seen"], self._pending)
+            chat_queue = self._chat_queues.get(chat_key)
+            if chat_queue is None:
+                self._chat_queues[chat_key] = deque([item])
+                self._ready.put(chat_key)
+            else:
+                chat_queue.append(item) # The chat's worker will pick it up after the current item
+            return True
+
+    def _worker_loop(self):
+        while True:
+            chat_key = self._ready.get()
+            with self._cond:
+                item = self._chat_queues[chat_key][0]
+            try:
+                self.handler(item)
+                succeeded = True
+            except Exception as e:
+                succeeded = False
+                logging.error(f"[{datetime.now()}] Dispatcher: Unhandled error while processing update for chat {chat_key}: {e}", exc_info=True)
+            with self._cond:
+                self._stats["processed" if succeeded else "failed"] += 1
+                chat_queue = self._chat_queues[chat_key]
+                chat_queue.popleft()
+                self._pending -= 1
+                if chat_queue:
+                    self._ready.put(chat_key) # Requeue behind other chats for fairness
+                else:
+                    del self._chat_queues[chat_key]
+                self._cond.notify()
+
+    def stats(self):
+        """Returns a snapshot of dispatcher counters."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot["pending"] = self._pending
+            snapshot["active_chats"] = len(self._chat_queues)
+            snapshot["workers"] = self.num_workers
+            snapshot["max_pending"] = self.max_pending
+        return snapshot
 
 
 # === Utility Functions ===
@@ -118,46 +397,585 @@ def escape_markdown_v2(text):
         escaped_text = escaped_text.replace(char, f"\\{char}")
     return escaped_text
 
-# Regular expressions for swear words
-SWEAR_WORDS_REGEX_PATTERNS = [
-    r'\bбл[яя]ть\b', r'\bху[ййиюяе]\b', r'\bп[іие]зд[ауеоіиь]\b',
-    r'\b[їие]б[аеи][тть]\b', r'\bсук[ауоие]\b', r'\bнаху[йяею]\b',
-    r'\bдрищ[іауое]?\b', r'\bкурв[ауоие]\b', r'\bг[іи]мн[оауе]\b',
-    r'\bлайн[оауое]\b', r'\bпадл[оауе]\b', r'\bганд[оо]н[ауоие]?\b',
-    r'\bмуд[аа]к[ауоие]?\b', r'\bвирод[оо]к[ауоие]?\b', r'\bсвол[оо]т[ауоие]\b',
-    r'\bгнид[ауоие]\b', r'\b[іие]д[іи][оо]т[ауоие]?\b', r'\bбовдур[ауоие]?\b',
-    r'\bп[іи]дор[ауоие]?\b', r'\bху[ййи]л[оауе]\b', r'\bпут[іи]н[ауоие]?\b',
-    r'\bп[ее][тту]ш[аа]р[уоие]\b', r'\bху[ййи]н[яяею]\b', r'\bд[ии][бб][іи]л[ауоие]?\b',
-    r'\bдаун[ауоие]?\b', r'\b[їие]бал[оауое]\b', r'\bза[їие]б[аа]в[ауоие]?\b',
-    r'\bза[їие]бал[оауое]\b', r'\bп[іи]зд[ее]ць\b', r'\bєб[аи][тть]\b',
-    r'\bйо[ба]ний?\b', r'\bтрах[аеи][тть]\b', r'\bшмар[ауоие]\b',
-    r'\bдристун[ауоие]?\b', r'\bчмо[шн]?[ик]?\b', r'\bлох[ауоие]?\b',
-    r'\bмуд[іи]л[оауое]\b', r'\bгандош[ауоие]\b', r'\bхер[ауоие]?\b',
-    r'\b[ауоие]ху[ййиюяе]\b', r'\b[їие]бан[ауоие][ауоие]?\b',
-    r'\b[їие]буч[ийаео]\b', r'\bбляха\b'
+_token_encoding = None
+_token_encoding_retry_at = 0.0 # After a failed load, the estimate is used until this monotonic time
+TOKEN_ENCODING_RETRY_SECONDS = 600
+
+def _get_token_encoding():
+    """tiktoken encoding used by the gpt-4.1 models, or None if tiktoken is not available."""
+    global _token_encoding, _token_encoding_retry_at
+    if _token_encoding is None and tiktoken is not None and time.monotonic() >= _token_encoding_retry_at:
+        try:
+            _token_encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # count_tokens runs per message line: do not retry the BPE download on every call
+            _token_encoding_retry_at = time.monotonic() + TOKEN_ENCODING_RETRY_SECONDS
+            logging.warning(f"[{datetime.now()}] Tokens: Could not load tiktoken encoding, using estimate for {TOKEN_ENCODING_RETRY_SECONDS}s: {e}")
+            return None
+    return _token_encoding
+
+def count_tokens(text):
+    """Number of model tokens in `text` (about 3 characters per token for Ukrainian when estimating)."""
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 3 + 1
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts `text` to at most `max_tokens` tokens, marking the cut with an ellipsis."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_token_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens - 1]) + "…"
+    return text[:max(0, (max_tokens - 1) * 3)] + "…"
+
+# Swear-word patterns and the single-pass matcher live in swear_matcher.py
+swear_matcher = SwearWordMatcher(SWEAR_WORDS_REGEX_PATTERNS)
+
+
+# === Database Connection Pool ===
+class DatabaseConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+    Connections are only pinged when they have been idle longer than `idle_check_seconds`,
+    so busy threads do not pay an extra round-trip per query.
+    """
+    def __init__(self, connect_func, min_connections=1, max_connections=10, idle_check_seconds=30, checkout_timeout_seconds=30):
+        self._connect = connect_func
+        self.min_connections = max(0, min_connections)
+        self.max_connections = max(1, max_connections, self.min_connections)
+        self.idle_check_seconds = idle_check_seconds
+        self.checkout_timeout_seconds = checkout_timeout_seconds
+        self._idle = [] # Stack of (connection, returned_at) - most recently used on top
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._prefill()
+
+    def _prefill(self):
+        """Opens `min_connections` connections up front."""
+        for _ in range(self.min_connections):
+            conn = self._connect()
+            if conn is None:
+                logging.warning(f"[{datetime.now()}] DB Pool: Could not pre-open connection. Pool will connect lazily.")
+                break
+            self._idle.append((conn, time.monotonic()))
+        logging.info(f"[{datetime.now()}] DB Pool: Initialized with {len(self._idle)} idle connection(s), max {self.max_connections}.")
+
+    def _is_healthy(self, conn, idle_for):
+        """Checks an idle connection; recently used connections are trusted without a round-trip."""
+        if conn.closed:
+            return False
+        if idle_for < self.idle_check_seconds:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1") # Simple query to check connection health
+            cursor.close()
+            return True
+        except psycopg2.Error as e:
+            logging.warning(f"[{datetime.now()}] DB Pool: Idle connection stale or closed ({e}). Discarding.")
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Checks out a connection, blocking while all `max_connections` are in use. Returns None on failure."""
+        if not self._slots.acquire(timeout=self.checkout_timeout_seconds):
+            logging.error(f"[{datetime.now()}] DB Pool: Timed out after {self.checkout_timeout_seconds}s waiting for a free connection (max {self.max_connections}).")
+            return None
+
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                break
+            conn, returned_at = entry
+            if self._is_healthy(conn, time.monotonic() - returned_at):
+                logging.debug(f"[{datetime.now()}] DB Pool: Reusing pooled connection.")
+                return conn
+            self._discard(conn)
+
+        conn = self._connect()
+        if conn is None:
+            self._slots.release()
+        return conn
+
+    def putconn(self, conn):
+        """Returns a connection to the pool. Broken connections or ones left mid-transaction are closed."""
+        try:
+            if conn.closed:
+                return
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._discard(conn)
+                    return
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+# Upsert used for `messages`; "VALUES %s" is expanded by psycopg2.extras.execute_values for batches
+MESSAGE_UPSERT_SQL = """INSERT INTO messages (telegram_message_id, user_id, username, message, timestamp, is_bot, chat_id, bot_message_type, reply_to_message_id)
+                   VALUES %s
+                   ON CONFLICT (telegram_message_id) DO UPDATE SET
+                       user_id = EXCLUDED.user_id,
+                       username = EXCLUDED.username,
+                       message = EXCLUDED.message,
+                       timestamp = EXCLUDED.timestamp,
+                       is_bot = EXCLUDED.is_bot,
+                       chat_id = EXCLUDED.chat_id,
+                       bot_message_type = EXCLUDED.bot_message_type,
+                       reply_to_message_id = COALESCE(EXCLUDED.reply_to_message_id, messages.reply_to_message_id);"""
+
+
+# === Schema Migrations ===
+# Tokenizer shared by the word_freq trigger and its backfill; mirrors wordcloud_renderer.normalize_word
+# (lowercase, typographic apostrophes folded into ', leading/trailing apostrophes trimmed).
+WORD_FREQ_TOKENS_SQL = "SELECT btrim(token, '''') AS word FROM regexp_split_to_table(translate(lower({message}), '’ʼ`', ''''''''), '[^[:alnum:]_'']+') AS token"
+WORD_FREQ_WORD_FILTER_SQL = "char_length(w.word) >= 4 AND NOT EXISTS (SELECT 1 FROM word_freq_stop_words s WHERE s.word = w.word)"
+ANNOUNCEMENTS_CHANNEL = "scheduled_announcements" # LISTEN/NOTIFY channel for new announcements
+
+# Applied once each, in order, by DatabaseManager.run_migrations(); never edit an applied migration, add a new one.
+DB_MIGRATIONS_LOCK_ID = 727001 # Arbitrary key for pg_advisory_lock
+DB_MIGRATIONS = [
+    (1, "messages_legacy_columns", [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS telegram_message_id BIGINT;",
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS is_bot BOOLEAN DEFAULT FALSE;",
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS chat_id BIGINT;",
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS bot_message_type TEXT;",
+        # Old databases may lack the unique key (or hold duplicates that prevent it); do not fail the migration over it
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_index i
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+                WHERE i.indrelid = 'messages'::regclass AND i.indisunique AND i.indnatts = 1
+                  AND a.attname = 'telegram_message_id'
+            ) THEN
+                ALTER TABLE messages ADD CONSTRAINT unique_telegram_message_id UNIQUE (telegram_message_id);
+            END IF;
+        EXCEPTION WHEN unique_violation THEN
+            RAISE WARNING 'unique_telegram_message_id not created: duplicate telegram_message_id values exist';
+        END
+        $$;
+        """,
+    ]),
+    (2, "messages_chat_id_timestamp_idx", [
+        # get_recent_context_entries: WHERE chat_id = ? ORDER BY timestamp DESC LIMIT n; also get_wordcloud_frequencies
+        "CREATE INDEX IF NOT EXISTS messages_chat_id_timestamp_idx ON messages (chat_id, timestamp DESC);",
+    ]),
+    (3, "messages_user_timestamp_idx", [
+        # get_messages_for_summary: day range over non-bot messages
+        "CREATE INDEX IF NOT EXISTS messages_user_timestamp_idx ON messages (timestamp) WHERE is_bot = FALSE;",
+    ]),
+    (4, "social_video_cache", [
+        # Normalized source link -> resolved media URL (short-lived) and Telegram file_id (permanent)
+        """
+        CREATE TABLE IF NOT EXISTS social_video_cache (
+            source_url TEXT PRIMARY KEY,
+            resolved_url TEXT,
+            resolved_at TIMESTAMP WITH TIME ZONE,
+            telegram_file_id TEXT,
+            uploaded_at TIMESTAMP WITH TIME ZONE,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+    ]),
+    (5, "translation_cache", [
+        # cache_key = sha256 of model, system prompt (includes the target language) and source text
+        """
+        CREATE TABLE IF NOT EXISTS translation_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            target_language TEXT NOT NULL,
+            model TEXT NOT NULL,
+            translated_text TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            hits INTEGER NOT NULL DEFAULT 0
+        );
+        """,
+    ]),
+    (6, "summary_chunk_cache", [
+        # chunk_key = sha256 of model, chunk prompt and the chunk's message lines
+        """
+        CREATE TABLE IF NOT EXISTS summary_chunk_cache (
+            chunk_key CHAR(64) PRIMARY KEY,
+            summary_date DATE NOT NULL,
+            summary_text TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS summary_chunk_cache_date_idx ON summary_chunk_cache (summary_date);",
+    ]),
+    (7, "rolling_summaries", [
+        # Running summary of a chat's UTC day; messages with id <= last_message_id are already folded in
+        """
+        CREATE TABLE IF NOT EXISTS rolling_summaries (
+            chat_id BIGINT NOT NULL,
+            summary_date DATE NOT NULL,
+            summary_text TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            messages_folded INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, summary_date)
+        );
+        """,
+    ]),
+    (8, "messages_reply_to_message_id", [
+        # Lets the expert context follow the reply chain the user is answering
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS reply_to_message_id BIGINT;",
+    ]),
+    (9, "fact_pool", [
+        # Pre-generated facts; sent_at IS NULL means still available. Sent rows stay for deduplication.
+        """
+        CREATE TABLE IF NOT EXISTS fact_pool (
+            id SERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            fact TEXT NOT NULL,
+            normalized_fact TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        );
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS fact_pool_kind_normalized_idx ON fact_pool (kind, normalized_fact);",
+        "CREATE INDEX IF NOT EXISTS fact_pool_available_idx ON fact_pool (kind, id) WHERE sent_at IS NULL;",
+    ]),
+    (10, "word_freq", [
+        # Per chat/day word counts, kept up to date by a trigger like daily_user_stats (backfill_daily_stats.py fills history)
+        """
+        CREATE TABLE IF NOT EXISTS word_freq (
+            chat_id BIGINT NOT NULL,
+            day DATE NOT NULL,
+            word TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, day, word)
+        );
+        """,
+        # Filled from UKRAINIAN_STOP_WORDS + Config.WORDCLOUD_STOP_WORDS on every start, see _sync_word_freq_stop_words
+        "CREATE TABLE IF NOT EXISTS word_freq_stop_words (word TEXT PRIMARY KEY);",
+        f"""
+        CREATE OR REPLACE FUNCTION bump_word_freq() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.chat_id IS NOT NULL AND NOT COALESCE(NEW.is_bot, FALSE) AND NEW.message IS NOT NULL AND NEW.message !~* 'https?://' THEN
+                INSERT INTO word_freq (chat_id, day, word, count)
+                SELECT NEW.chat_id, (COALESCE(NEW.timestamp, now()) AT TIME ZONE 'UTC')::date, w.word, COUNT(*)
+                FROM ({WORD_FREQ_TOKENS_SQL.format(message="NEW.message")}) AS w
+                WHERE {WORD_FREQ_WORD_FILTER_SQL}
+                GROUP BY w.word
+                ON CONFLICT (chat_id, day, word) DO UPDATE SET count = word_freq.count + EXCLUDED.count;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS messages_word_freq ON messages;",
+        "CREATE TRIGGER messages_word_freq AFTER INSERT ON messages FOR EACH ROW EXECUTE FUNCTION bump_word_freq();",
+    ]),
+    (11, "job_queue", [
+        # Durable queue for scheduled jobs; (job_name, execution_date) matches scheduled_job_executions_v2,
+        # which still records completed runs. status: pending -> running -> done | failed | expired
+        """
+        CREATE TABLE IF NOT EXISTS job_queue (
+            id BIGSERIAL PRIMARY KEY,
+            job_name VARCHAR(255) NOT NULL,
+            handler VARCHAR(255) NOT NULL,
+            execution_date DATE NOT NULL,
+            run_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            expires_at TIMESTAMP WITH TIME ZONE,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            locked_by VARCHAR(255),
+            locked_until TIMESTAMP WITH TIME ZONE,
+            last_error TEXT,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP WITH TIME ZONE,
+            UNIQUE (job_name, execution_date)
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS job_queue_due_idx ON job_queue (run_at) WHERE status IN ('pending', 'running');",
+    ]),
+    (12, "scheduled_announcements_dispatch", [
+        # Unsent announcements by time (get_pending_announcements); sent rows never need to be scanned
+        "CREATE INDEX IF NOT EXISTS scheduled_announcements_pending_idx ON scheduled_announcements (schedule_datetime) WHERE sent = FALSE;",
+        # Wakes AnnouncementDispatcher listeners as soon as an announcement is added
+        f"""
+        CREATE OR REPLACE FUNCTION notify_scheduled_announcement() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{ANNOUNCEMENTS_CHANNEL}', json_build_object('id', NEW.id, 'at', extract(epoch FROM NEW.schedule_datetime))::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS scheduled_announcements_notify ON scheduled_announcements;",
+        "CREATE TRIGGER scheduled_announcements_notify AFTER INSERT ON scheduled_announcements FOR EACH ROW EXECUTE FUNCTION notify_scheduled_announcement();",
+    ]),
+    # Which chats get which scheduled report, at what local time (a chat may take one report at several times)
+    (13, "chat_subscriptions", [
+        """
+        CREATE TABLE IF NOT EXISTS chat_subscriptions (
+            chat_id BIGINT NOT NULL,
+            report_type VARCHAR(64) NOT NULL,
+            local_time TIME NOT NULL,
+            timezone VARCHAR(64) NOT NULL DEFAULT 'Europe/Kyiv',
+            enabled BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, report_type, local_time)
+        );
+        """,
+    ]),
+    (14, "messages_inserted_at", [
+        # Insert time (transaction start) for rolling summaries: ids are allocated at insert but become
+        # visible at commit, so only rows inserted ROLLING_SUMMARY_SETTLE_SECONDS ago are folded
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS inserted_at TIMESTAMP WITH TIME ZONE DEFAULT now();",
+    ]),
+    (15, "job_queue_slot_at", [
+        # The moment a run was planned for; fail_job moves run_at for retries, but a fan-out still needs its slot
+        "ALTER TABLE job_queue ADD COLUMN IF NOT EXISTS slot_at TIMESTAMP WITH TIME ZONE;",
+        "UPDATE job_queue SET slot_at = run_at WHERE slot_at IS NULL;",
+    ]),
+    (16, "daily_user_stats", [
+        # Messages per chat, UTC day and user, kept up to date by a trigger (backfill_daily_stats.py fills history).
+        # Databases that ran the pre-migration startup DDL already have all of this; every statement is idempotent.
+        """
+        CREATE TABLE IF NOT EXISTS daily_user_stats (
+            chat_id BIGINT NOT NULL,
+            stat_date DATE NOT NULL,
+            user_id BIGINT NOT NULL,
+            username VARCHAR(255),
+            is_bot BOOLEAN NOT NULL DEFAULT FALSE,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, stat_date, user_id)
+        );
+        """,
+        # AFTER INSERT row triggers do not fire when ON CONFLICT turns the insert into an update,
+        # so re-saving the same Telegram message is not counted twice.
+        """
+        CREATE OR REPLACE FUNCTION bump_daily_user_stats() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.chat_id IS NOT NULL THEN
+                INSERT INTO daily_user_stats (chat_id, stat_date, user_id, username, is_bot, message_count)
+                VALUES (NEW.chat_id, (COALESCE(NEW.timestamp, now()) AT TIME ZONE 'UTC')::date, NEW.user_id, NEW.username, COALESCE(NEW.is_bot, FALSE), 1)
+                ON CONFLICT (chat_id, stat_date, user_id) DO UPDATE SET
+                    message_count = daily_user_stats.message_count + 1,
+                    username = COALESCE(EXCLUDED.username, daily_user_stats.username);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """,
+        "DROP TRIGGER IF EXISTS messages_daily_user_stats ON messages;",
+        "CREATE TRIGGER messages_daily_user_stats AFTER INSERT ON messages FOR EACH ROW EXECUTE FUNCTION bump_daily_user_stats();",
+    ]),
 ]
 
+# EXPLAIN checks for the queries the migrations above are meant to speed up:
+# Words of a chat's non-bot messages of the day, split and filtered server-side: messages with links are skipped,
+# short words and stop words never leave the database. Params: chat_id, day_start, day_end, min_word_length, stop_words.
+WORDCLOUD_WORDS_SQL = """SELECT word
+                   FROM messages, regexp_split_to_table(lower(message), '[^[:alnum:]_'']+') AS word
+                   WHERE chat_id = %s AND timestamp >= %s AND timestamp < %s AND is_bot = FALSE AND message IS NOT NULL
+                     AND message !~* 'https?://'
+                     AND char_length(word) >= %s
+                     AND word <> ALL(%s)"""
+
+# name -> (expected index, SQL, params(chat_id, day_start, day_end))
+HOT_QUERY_PLAN_CHECKS = {
+    "recent_context_entries": (
+        "messages_chat_id_timestamp_idx",
+        "SELECT telegram_message_id, username, message, is_bot, reply_to_message_id FROM messages WHERE chat_id = %s AND message IS NOT NULL ORDER BY timestamp DESC LIMIT 50",
+        lambda chat_id, day_start, day_end: (chat_id,)
+    ),
+    "messages_for_summary": (
+        "messages_user_timestamp_idx",
+        "SELECT username, message FROM messages WHERE timestamp >= %s AND timestamp < %s AND is_bot = FALSE AND message IS NOT NULL ORDER BY timestamp ASC",
+        lambda chat_id, day_start, day_end: (day_start, day_end)
+    ),
+    "wordcloud_words": (
+        "messages_chat_id_timestamp_idx",
+        WORDCLOUD_WORDS_SQL,
+        lambda chat_id, day_start, day_end: (chat_id, day_start, day_end, 4, ["content"])
+    ),
+}
+
+
+# === Message Write-Behind Buffer ===
+class MessageWriteBuffer:
+    """
+    Collects `messages` rows and writes them in batches from a background thread,
+    every `flush_interval_ms` or as soon as `batch_size` rows are queued.
+    Rows that cannot be written (DB down at shutdown, or backlog above `max_pending`)
+    are spilled to JSON-lines files in `spill_dir` and replayed on the next start.
+    """
+    def __init__(self, db, batch_size=100, flush_interval_ms=500, max_pending=10000, spill_dir="message_spill"):
+        self.db = db
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_seconds = flush_interval_ms / 1000.0
+        self.max_pending = max(self.batch_size, max_pending)
+        self.spill_dir = spill_dir
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock() # One batch in flight at a time
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        self._replay_spill_files()
+        self._thread = threading.Thread(target=self._run, name="message-write-buffer")
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+        logging.info(f"[{datetime.now()}] WriteBuffer: Started (batch {self.batch_size} rows / {self.flush_interval_seconds * 1000:.0f} ms).")
+
+    def add(self, row):
+        with self._cond:
+            self._pending.append(row)
+            overflow = len(self._pending) > self.max_pending
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        if overflow:
+            self._spill_overflow()
+
+    def flush(self):
+        """Writes everything queued so far. Returns False if some rows are still pending."""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return True
+            try:
+                if self.db.save_messages_batch(batch):
+                    return True
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] WriteBuffer: Unexpected error saving {len(batch)} message(s): {e}", exc_info=True)
+            with self._cond:
+                self._pending = batch + self._pending # Keep order, retry on the next cycle
+            return False
+
+    def stop(self):
+        """Final flush on shutdown; anything that still cannot be written goes to the spill file."""
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify()
+        if not self.flush():
+            with self._cond:
+                rows, self._pending = self._pending, []
+            self._write_spill_file(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._pending) < self.batch_size:
+                    self._cond.wait(timeout=self.flush_interval_seconds)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                # One bad cycle must not kill the writer thread
+                logging.error(f"[{datetime.now()}] WriteBuffer: Flush failed: {e}", exc_info=True)
+
+    def _spill_overflow(self):
+        """Moves the oldest rows to disk when the DB has been unavailable for too long."""
+        with self._cond:
+            excess = len(self._pending) - self.max_pending
+            if excess <= 0:
+                return
+            rows, self._pending = self._pending[:excess], self._pending[excess:]
+        logging.warning(f"[{datetime.now()}] WriteBuffer: Backlog above {self.max_pending} rows, spilling {len(rows)} oldest row(s) to disk.")
+        self._write_spill_file(rows)
+
+    def _write_spill_file(self, rows):
+        if not rows:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = os.path.join(self.spill_dir, f"messages-{os.getpid()}-{time.time_ns()}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for row in rows:
+                    row = list(row)
+                    if isinstance(row[4], datetime):
+                        row[4] = row[4].isoformat()
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            logging.warning(f"[{datetime.now()}] WriteBuffer: Spilled {len(rows)} unsaved message(s) to {path}.")
+        except Exception as e:
+            logging.critical(f"[{datetime.now()}] WriteBuffer: Could not spill {len(rows)} message(s) to disk: {e}", exc_info=True)
+
+    def _replay_spill_files(self):
+        """Queues rows left by a previous run. Each file is claimed by renaming it, so only one worker replays it."""
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "messages-*.jsonl"))):
+            claimed_path = f"{path}.replaying-{os.getpid()}"
+            try:
+                os.rename(path, claimed_path)
+            except OSError:
+                continue # Another worker claimed it
+            try:
+                with open(claimed_path, encoding="utf-8") as f:
+                    rows = []
+                    for line in f:
+                        if line.strip():
+                            row = json.loads(line)
+                            row += [None] * (9 - len(row)) # Files written before reply_to_message_id existed
+                            if row[4]:
+                                row[4] = datetime.fromisoformat(row[4])
+                            rows.append(tuple(row))
+                with self._cond:
+                    self._pending.extend(rows)
+                os.remove(claimed_path)
+                logging.info(f"[{datetime.now()}] WriteBuffer: Replaying {len(rows)} message(s) from {path}.")
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] WriteBuffer: Could not replay spill file {claimed_path}: {e}", exc_info=True)
+
 
 # === Database Manager Class ===
 class DatabaseManager:
-    def __init__(self, database_url):
+    def __init__(self, database_url, min_connections=None, max_connections=None, idle_check_seconds=None, checkout_timeout_seconds=None):
         self.database_url = database_url
-        self._connection = None # Internal connection state
+        self.min_connections = min_connections if min_connections is not None else Config.DB_POOL_MIN_CONNECTIONS
+        self.max_connections = max_connections if max_connections is not None else Config.DB_POOL_MAX_CONNECTIONS
+        self.idle_check_seconds = idle_check_seconds if idle_check_seconds is not None else Config.DB_POOL_IDLE_CHECK_SECONDS
+        self.checkout_timeout_seconds = checkout_timeout_seconds if checkout_timeout_seconds is not None else Config.DB_POOL_CHECKOUT_TIMEOUT_SECONDS
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local() # Per-thread checked-out connection
+        self.write_buffer = None # Optional MessageWriteBuffer, see enable_write_buffer()
+        self.message_listeners = [] # Called with every saved message row, e.g. ConversationContextBuilder.record
+
+    def _get_pool(self):
+        """Lazily creates the connection pool (the URL may be overridden after instantiation, e.g. by scheduler_process)."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = DatabaseConnectionPool(
+                        self._connect,
+                        min_connections=self.min_connections,
+                        max_connections=self.max_connections,
+                        idle_check_seconds=self.idle_check_seconds,
+                        checkout_timeout_seconds=self.checkout_timeout_seconds
+                    )
+        return self._pool
 
-    def _get_connection(self, max_retries=5, retry_delay_seconds=5):
+    def _connect(self, max_retries=5, retry_delay_seconds=5):
         """Establishes and returns a new database connection with retries."""
-        # Use existing connection if healthy and not closed
-        if self._connection and not self._connection.closed:
-            try:
-                cursor = self._connection.cursor()
-                cursor.execute("SELECT 1") # Simple query to check connection health
-                cursor.close()
-                logging.debug(f"[{datetime.now()}] DB: Reusing existing healthy database connection.")
-                return self._connection
-            except psycopg2.OperationalError as e:
-                logging.warning(f"[{datetime.now()}] DB: Existing connection stale or closed ({e}). Attempting reconnect.")
-                self._connection = None # Invalidate stale connection
-
         url = urllib.parse.urlparse(self.database_url)
         conn_params = {
             "host": url.hostname,
@@ -176,7 +994,6 @@ class DatabaseManager:
                 conn = psycopg2.connect(**conn_params)
                 conn.autocommit = True
                 logging.info(f"[{datetime.now()}] DB: Successfully connected to database on attempt {attempt}.")
-                self._connection = conn # Store the healthy connection
                 return conn
             except psycopg2.OperationalError as e:
                 logging.error(f"[{datetime.now()}] DB: Database connection error on attempt {attempt}: {e}", exc_info=False)
@@ -187,16 +1004,52 @@ class DatabaseManager:
                     time.sleep(retry_delay_seconds)
                 else:
                     logging.critical(f"[{datetime.now()}] DB: Failed to connect to database after {max_retries} attempts.")
-                    self._connection = None
                     return None
             except Exception as e:
                 logging.critical(f"[{datetime.now()}] DB: Unexpected error during database connection on attempt {attempt}: {e}", exc_info=True)
-                self._connection = None
                 return None
         return None
 
+    def _get_connection(self):
+        """
+        Checks out a pooled connection for the current thread.
+        Nested calls from the same thread reuse the already checked-out connection;
+        every call must be paired with _release_connection().
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None and not held.closed:
+            self._local.depth += 1
+            return held
+
+        depth = 0
+        if held is not None:
+            # The connection died while checked out: hand it back so its pool slot is freed, then replace it.
+            # Outer callers still hold it, so the replacement inherits their depth.
+            depth = self._local.depth
+            self._local.conn = None
+            self._local.depth = 0
+            self._get_pool().putconn(held)
+
+        conn = self._get_pool().getconn()
+        if conn is None:
+            return None
+        self._local.conn = conn
+        self._local.depth = depth + 1
+        return conn
+
+    def _release_connection(self):
+        """Returns the current thread's connection to the pool once the outermost caller is done with it."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.depth -= 1
+        if self._local.depth <= 0:
+            self._local.conn = None
+            self._local.depth = 0
+            self._get_pool().putconn(conn)
+
     def _create_messages_table(self, cursor):
-        """Creates or updates the messages table."""
+        """Creates the messages table (base schema)."""
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS messages (
                 id SERIAL PRIMARY KEY,
@@ -210,30 +1063,7 @@ class DatabaseManager:
                 bot_message_type TEXT
             );
         """)
-        # Add columns if they don't exist
-        try:
-            cursor.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS telegram_message_id BIGINT;")
-            cursor.execute("ALTER TABLE messages ADD CONSTRAINT unique_telegram_message_id UNIQUE (telegram_message_id);")
-            logging.info("[DBManager] Додано UNIQUE Constraint на 'telegram_message_id'.")
-        except psycopg2.ProgrammingError as e:
-            if "already exists" in str(e) or "could not create unique index" in str(e):
-                logging.warning(f"[DBManager] UNIQUE Constraint на 'telegram_message_id' вже існує або не може бути створений через дублікати: {e}. Пропускаємо додавання.")
-                self._connection.rollback()
-            else:
-                raise
-        logging.info("[DBManager] Додано колонку 'telegram_message_id' до таблиці 'messages'.")
-
-        cursor.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS is_bot BOOLEAN DEFAULT FALSE;")
-        cursor.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS chat_id BIGINT;")
-        try:
-            cursor.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS bot_message_type TEXT;")
-            logging.info("[DBManager] Додано колонку 'bot_message_type' до таблиці 'messages'.")
-        except psycopg2.ProgrammingError as e:
-            if "column \"bot_message_type\" already exists" in str(e):
-                logging.info("[DBManager] Колонка 'bot_message_type' вже існує в таблиці 'messages'. Пропускаємо додавання.")
-                self._connection.rollback()
-            else:
-                raise
+        # Columns and indexes added later are applied by run_migrations()
 
     def _create_swear_counts_table(self, cursor):
         """Creates the swear_counts table."""
@@ -276,6 +1106,97 @@ class DatabaseManager:
             logging.error(f"[{datetime.now()}] DB: Unexpected error during scheduled_job_executions_v2 creation: {e}", exc_info=True)
             raise
 
+    def _sync_word_freq_stop_words(self, cursor):
+        """Replaces word_freq_stop_words with the current stop-word list in one transaction."""
+        stop_words = sorted(UKRAINIAN_STOP_WORDS | {normalize_word(word) for word in Config.WORDCLOUD_STOP_WORDS})
+        cursor.execute("BEGIN;")
+        try:
+            cursor.execute("DELETE FROM word_freq_stop_words;")
+            psycopg2.extras.execute_values(cursor, "INSERT INTO word_freq_stop_words (word) VALUES %s ON CONFLICT DO NOTHING;", [(word,) for word in stop_words])
+            cursor.execute("COMMIT;")
+        except psycopg2.Error:
+            cursor.execute("ROLLBACK;")
+            raise
+
+    def run_migrations(self, cursor):
+        """
+        Applies pending DB_MIGRATIONS in version order, each in its own transaction.
+        A Postgres advisory lock makes sure only one process (web or scheduler) migrates at a time.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cursor.execute("SELECT pg_advisory_lock(%s);", (DB_MIGRATIONS_LOCK_ID,))
+        try:
+            cursor.execute("SELECT version FROM schema_migrations;")
+            applied_versions = {row[0] for row in cursor.fetchall()}
+            for version, name, statements in DB_MIGRATIONS:
+                if version in applied_versions:
+                    continue
+                logging.info(f"[{datetime.now()}] DB: Applying migration {version} ({name})...")
+                cursor.execute("BEGIN;")
+                try:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+                    cursor.execute("COMMIT;")
+                except psycopg2.Error as e:
+                    cursor.execute("ROLLBACK;")
+                    logging.error(f"[{datetime.now()}] DB: Migration {version} ({name}) failed and was rolled back: {e}", exc_info=True)
+                    raise
+                logging.info(f"[{datetime.now()}] DB: Migration {version} ({name}) applied.")
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s);", (DB_MIGRATIONS_LOCK_ID,))
+
+    def explain_hot_queries(self):
+        """
+        Runs EXPLAIN for the hot `messages` queries and reports which indexes the planner picked.
+        Returns {query_name: {"indexes": [...], "expected": index_name, "uses_expected_index": bool}}.
+        Note: on small tables Postgres may legitimately prefer a sequential scan.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to explain hot queries.")
+            return {}
+
+        cur = None
+        results = {}
+        try:
+            cur = conn.cursor()
+            today = datetime.utcnow().date()
+            tomorrow = today + timedelta(days=1)
+            cur.execute("SELECT chat_id FROM messages WHERE chat_id IS NOT NULL ORDER BY id DESC LIMIT 1;")
+            row = cur.fetchone()
+            sample_chat_id = row[0] if row else Config.GROUP_REPORT_CHAT_ID
+            for query_name, (expected_index, sql, params) in HOT_QUERY_PLAN_CHECKS.items():
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params(sample_chat_id, today, tomorrow))
+                plan = cur.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                indexes = sorted(self._collect_plan_indexes(plan[0]["Plan"]))
+                results[query_name] = {"indexes": indexes, "expected": expected_index, "uses_expected_index": expected_index in indexes}
+                log = logging.info if expected_index in indexes else logging.warning
+                log(f"[{datetime.now()}] DB: Plan check '{query_name}': indexes used {indexes or 'none (seq scan)'}, expected '{expected_index}'.")
+            return results
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error explaining hot queries: {e}", exc_info=True)
+            return results
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    @classmethod
+    def _collect_plan_indexes(cls, plan_node):
+        indexes = set()
+        if "Index Name" in plan_node:
+            indexes.add(plan_node["Index Name"])
+        for child in plan_node.get("Plans", []):
+            indexes |= cls._collect_plan_indexes(child)
+        return indexes
+
     def create_tables(self):
         """
         Creates all necessary tables if they don't exist and adds missing columns.
@@ -290,8 +1211,10 @@ class DatabaseManager:
                 self._create_swear_counts_table(cursor)
                 self._create_scheduled_announcements_table(cursor)
                 self._create_scheduled_job_executions_table(cursor)
+                self.run_migrations(cursor)
+                self._sync_word_freq_stop_words(cursor)
                 conn.commit()
-                logging.info(f"[{datetime.now()}] DB: Tables 'messages', 'swear_counts', 'scheduled_announcements', 'scheduled_job_executions_v2' checked/created/updated successfully.")
+                logging.info(f"[{datetime.now()}] DB: Tables 'messages', 'swear_counts', 'scheduled_announcements', 'scheduled_job_executions_v2' and migrations checked/created/updated successfully.")
             else:
                 logging.warning(f"[{datetime.now()}] DB: Could not get DB connection to create/update tables. Database functionality will be limited.")
         except Exception as e:
@@ -299,12 +1222,27 @@ class DatabaseManager:
         finally:
             if cursor:
                 cursor.close()
+            if conn:
+                self._release_connection()
 
-    def save_message(self, telegram_message_id, user_id, username, message_content, message_date, chat_id_to_save, is_bot_message=False, bot_message_type=None):
+    def save_message(self, telegram_message_id, user_id, username, message_content, message_date, chat_id_to_save, is_bot_message=False, bot_message_type=None, reply_to_message_id=None):
         """
         Saves message information to the database.
         Now uses 'telegram_message_id' for mapping to Telegram messages.
+        When the write-behind buffer is enabled the row is queued and inserted in the next batch.
         """
+        message_content_str = str(message_content) if message_content is not None else 'No content'
+        row = (telegram_message_id, user_id, username, message_content_str, message_date, is_bot_message, chat_id_to_save, bot_message_type, reply_to_message_id)
+        for listener in self.message_listeners:
+            try:
+                listener(row)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] DB: Message listener failed: {e}", exc_info=True)
+
+        if self.write_buffer:
+            self.write_buffer.add(row)
+            return
+
         conn = self._get_connection()
         if not conn:
             logging.warning(f"[{datetime.now()}] DB: save_message did not get DB connection. Message not saved.")
@@ -313,23 +1251,10 @@ class DatabaseManager:
         cur = None
         try:
             cur = conn.cursor()
-            message_content_str = str(message_content) if message_content is not None else 'No content'
 
             logging.info(f"[{datetime.now()}] DB: Attempting to save message (Bot: {is_bot_message}, Type: {bot_message_type}) from User ID: {user_id}, Username: {username}, Chat ID: {chat_id_to_save}, Text: '{message_content_str[:50]}'")
 
-            cur.execute(
-                """INSERT INTO messages (telegram_message_id, user_id, username, message, timestamp, is_bot, chat_id, bot_message_type)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                   ON CONFLICT (telegram_message_id) DO UPDATE SET
-                       user_id = EXCLUDED.user_id,
-                       username = EXCLUDED.username,
-                       message = EXCLUDED.message,
-                       timestamp = EXCLUDED.timestamp,
-                       is_bot = EXCLUDED.is_bot,
-                       chat_id = EXCLUDED.chat_id,
-                       bot_message_type = EXCLUDED.bot_message_type;""",
-                (telegram_message_id, user_id, username, message_content_str, message_date, is_bot_message, chat_id_to_save, bot_message_type)
-            )
+            cur.execute(MESSAGE_UPSERT_SQL.replace("VALUES %s", "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"), row)
             conn.commit()
             logging.info(f"[{datetime.now()}] DB: Message from User ID: {user_id} (Bot: {is_bot_message}, Type: {bot_message_type}) successfully saved to DB (Telegram ID: {telegram_message_id}).")
 
@@ -344,9 +1269,73 @@ class DatabaseManager:
             if conn: conn.rollback()
         finally:
             if cur: cur.close()
+            self._release_connection()
+
+    def save_messages_batch(self, rows):
+        """
+        Upserts many message rows with one multi-row INSERT.
+        Returns True on success; on failure the caller keeps the rows for a retry.
+        """
+        # ON CONFLICT DO UPDATE cannot touch the same row twice in one statement: keep the latest row per message id
+        latest_rows = {}
+        for row in rows:
+            latest_rows[row[0] if row[0] is not None else id(row)] = row
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: save_messages_batch did not get DB connection. {len(rows)} message(s) kept for retry.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(cur, MESSAGE_UPSERT_SQL, list(latest_rows.values()), page_size=len(latest_rows))
+            conn.commit()
+            logging.info(f"[{datetime.now()}] DB: Batch-saved {len(latest_rows)} message(s).")
+            return True
+        except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+            # A bad row must not block the whole batch forever: write rows one by one and drop the failing ones
+            logging.error(f"[{datetime.now()}] DB: Batch rejected ({e}). Retrying {len(latest_rows)} message(s) row by row.")
+            if conn: conn.rollback()
+            for row in latest_rows.values():
+                try:
+                    psycopg2.extras.execute_values(cur, MESSAGE_UPSERT_SQL, [row])
+                except (psycopg2.IntegrityError, psycopg2.DataError) as row_error:
+                    logging.error(f"[{datetime.now()}] DB: Dropping unsavable message (Telegram ID: {row[0]}): {row_error}")
+                    conn.rollback()
+                except Exception as row_error:
+                    # Connection lost mid-fallback: hand the batch back (upserts are idempotent) instead of losing it
+                    logging.error(f"[{datetime.now()}] DB: Row-by-row save interrupted, {len(latest_rows)} message(s) kept for retry: {row_error}", exc_info=True)
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                    return False
+            return True
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error batch-saving messages (psycopg2): {e}", exc_info=True)
+            if conn: conn.rollback()
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in save_messages_batch: {e}", exc_info=True)
+            if conn: conn.rollback()
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def enable_write_buffer(self, batch_size, flush_interval_ms, max_pending, spill_dir):
+        """Turns on write-behind batching for save_message()."""
+        self.write_buffer = MessageWriteBuffer(self, batch_size, flush_interval_ms, max_pending, spill_dir)
+        self.write_buffer.start()
+
+    def _flush_pending_writes(self):
+        """Makes buffered messages visible before a read that depends on them."""
+        if self.write_buffer:
+            self.write_buffer.flush()
 
     def get_message_by_id(self, telegram_message_id):
         """Retrieves a message by its Telegram message_id, including bot_message_type."""
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
             logging.warning(f"[{datetime.now()}] DB: No connection to retrieve message by Telegram ID.")
@@ -356,7 +1345,7 @@ class DatabaseManager:
         try:
             cur = conn.cursor()
             cur.execute("""
-                SELECT id, user_id, username, message, timestamp, is_bot, chat_id, bot_message_type, telegram_message_id
+                SELECT id, user_id, username, message, timestamp, is_bot, chat_id, bot_message_type, telegram_message_id, reply_to_message_id
                 FROM messages
                 WHERE telegram_message_id = %s;
             """, (telegram_message_id,))
@@ -373,6 +1362,7 @@ class DatabaseManager:
             return None
         finally:
             if cur: cur.close()
+            self._release_connection()
 
     def increment_swear_count(self, chat_id, current_date, increment_by=1):
         """Increments the swear count for a given chat and date, returns new count."""
@@ -402,6 +1392,7 @@ class DatabaseManager:
             return 0
         finally:
             if cur: cur.close()
+            self._release_connection()
 
     def get_swear_count(self, chat_id, current_date):
         """Returns the current swear count for a given chat and date."""
@@ -419,6 +1410,7 @@ class DatabaseManager:
             return result[0] if result else 0
         finally:
             if cur: cur.close()
+            self._release_connection()
 
     def add_scheduled_announcement(self, chat_id, message_text, schedule_time_str):
         """Adds an announcement to the database for future scheduled sending."""
@@ -464,9 +1456,11 @@ class DatabaseManager:
             return f"Несподівана помилка при плануванні анонсу: {escape_markdown_v2(str(e))}"
         finally:
             if cur: cur.close()
+            self._release_connection()
 
     def get_messages_for_summary(self):
         """Retrieves messages for daily summary."""
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
             logging.warning(f"[{datetime.now()}] DB: No connection to get messages for summary.")
@@ -493,12 +1487,14 @@ class DatabaseManager:
             return []
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def get_recent_messages_for_context(self, chat_id, limit=10):
+    def get_recent_context_entries(self, chat_id, limit=50):
         """
-        Retrieves recent messages for conversation context.
-        For bot messages (is_bot=True), it will only return the message content, not "bot_username: message".
+        Retrieves the chat's most recent messages for conversation context, oldest first, as
+        {"telegram_message_id", "username", "message", "is_bot", "reply_to_message_id"} dicts.
         """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
             logging.warning(f"[{datetime.now()}] DB: No connection to get recent messages for context.")
@@ -508,7 +1504,7 @@ class DatabaseManager:
         try:
             cur = conn.cursor()
             cur.execute("""
-                SELECT username, message, is_bot
+                SELECT telegram_message_id, username, message, is_bot, reply_to_message_id
                 FROM messages
                 WHERE chat_id = %s AND message IS NOT NULL
                 ORDER BY timestamp DESC
@@ -516,32 +1512,26 @@ class DatabaseManager:
             """, (chat_id, limit))
             rows = cur.fetchall()
             logging.info(f"[{datetime.now()}] DB: Retrieved {len(rows)} recent messages for context.")
-
-            formatted_history = []
-            for username, message, is_bot_flag in reversed(rows): # Process in chronological order
-                if message is None:
-                    continue
-
-                if is_bot_flag:
-                    formatted_history.append({"role": "assistant", "content": message})
-                else:
-                    formatted_history.append({"role": "user", "content": f"{username if username else 'Unknown user'}: {message}"})
-
-            return formatted_history
+            return [
+                {"telegram_message_id": row[0], "username": row[1], "message": row[2], "is_bot": row[3], "reply_to_message_id": row[4]}
+                for row in reversed(rows) # Chronological order
+            ]
         except psycopg2.Error as e:
             logging.error(f"[{datetime.now()}] DB: Error getting recent messages for context: {e}", exc_info=True)
             return []
         except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_recent_messages_for_context: {e}", exc_info=True)
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_recent_context_entries: {e}", exc_info=True)
             return []
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def get_daily_stats(self):
+    def get_daily_stats(self, chat_id, stat_date=None):
         """
-        Retrieves daily message statistics for the report,
-        separating user messages from bot messages.
+        Retrieves daily message statistics for the report from the daily_user_stats rollup,
+        separating user messages from bot messages. Cost depends on the number of users, not messages.
         """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
             logging.warning(f"[{datetime.now()}] DB: No connection to get daily stats.")
@@ -550,24 +1540,18 @@ class DatabaseManager:
         cur = None
         try:
             cur = conn.cursor()
-            today = datetime.utcnow().date()
-            tomorrow = today + timedelta(days=1)
-
-            cur.execute("SELECT COUNT(*) FROM messages WHERE timestamp >= %s AND timestamp < %s", (today, tomorrow))
-            total_messages = cur.fetchone()[0]
+            stat_date = stat_date or datetime.utcnow().date()
 
             cur.execute("""
-                SELECT username, COUNT(*) FROM messages
-                WHERE timestamp >= %s AND timestamp < %s AND is_bot = FALSE
-                GROUP BY username ORDER BY COUNT(*) DESC LIMIT 5
-            """, (today, tomorrow))
-            top_users = cur.fetchall()
+                SELECT username, message_count, is_bot FROM daily_user_stats
+                WHERE chat_id = %s AND stat_date = %s
+                ORDER BY message_count DESC
+            """, (chat_id, stat_date))
+            rows = cur.fetchall()
 
-            cur.execute("""
-                SELECT COUNT(*) FROM messages
-                WHERE timestamp >= %s AND timestamp < %s AND is_bot = TRUE
-            """, (today, tomorrow))
-            bot_messages_count = cur.fetchone()[0]
+            total_messages = sum(count for _, count, _ in rows)
+            bot_messages_count = sum(count for _, count, is_bot in rows if is_bot)
+            top_users = [(username, count) for username, count, is_bot in rows if not is_bot][:5]
 
             return total_messages, top_users, bot_messages_count
         except psycopg2.Error as e:
@@ -578,162 +1562,1088 @@ class DatabaseManager:
             return 0, [], 0
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def get_all_texts_for_wordcloud(self):
-        """Retrieves all message texts for word cloud generation, excluding bot messages, links, and the word 'content'."""
+    def backfill_daily_user_stats(self, start_date=None):
+        """
+        Rebuilds daily_user_stats from messages (all history, or from start_date on).
+        Inserts into messages are blocked while it runs so no increment is lost.
+        Returns the number of rollup rows written, or None on error.
+        """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
-            logging.warning(f"[{datetime.now()}] DB: No connection to get texts for wordcloud.")
-            return []
+            logging.warning(f"[{datetime.now()}] DB: No connection to backfill daily stats.")
+            return None
 
         cur = None
         try:
             cur = conn.cursor()
-            today = datetime.utcnow().date()
-            tomorrow = today + timedelta(days=1)
-            cur.execute("SELECT message FROM messages WHERE timestamp >= %s AND timestamp < %s AND is_bot = FALSE", (today, tomorrow))
-
-            filtered_texts = []
-            for row in cur.fetchall():
-                message = row[0]
-                if message:
-                    if re.search(r'https?://\S+', message, re.IGNORECASE):
-                        continue
-
-                    cleaned_message = re.sub(r'\bcontent\b', '', message, flags=re.IGNORECASE).strip()
-
-                    if cleaned_message and len(cleaned_message) >= 4:
-                        filtered_texts.append(cleaned_message)
-
-            return filtered_texts
+            cur.execute("BEGIN;")
+            cur.execute("LOCK TABLE messages IN SHARE MODE;")
+            cur.execute("DELETE FROM daily_user_stats WHERE %s::date IS NULL OR stat_date >= %s::date;", (start_date, start_date))
+            cur.execute("""
+                INSERT INTO daily_user_stats (chat_id, stat_date, user_id, username, is_bot, message_count)
+                SELECT chat_id,
+                       (timestamp AT TIME ZONE 'UTC')::date AS stat_date,
+                       user_id,
+                       (array_agg(username ORDER BY timestamp DESC))[1],
+                       bool_or(COALESCE(is_bot, FALSE)),
+                       COUNT(*)
+                FROM messages
+                WHERE chat_id IS NOT NULL
+                  AND (%s::date IS NULL OR timestamp >= %s::date)
+                GROUP BY chat_id, stat_date, user_id;
+            """, (start_date, start_date))
+            written = cur.rowcount
+            cur.execute("COMMIT;")
+            logging.info(f"[{datetime.now()}] DB: Backfilled {written} daily_user_stats row(s) (from {start_date or 'the beginning'}).")
+            return written
         except psycopg2.Error as e:
-            logging.error(f"[{datetime.now()}] DB: Error getting texts for wordcloud: {e}", exc_info=True)
-            return []
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_all_texts_for_wordcloud: {e}", exc_info=True)
-            return []
+            logging.error(f"[{datetime.now()}] DB: Error backfilling daily stats: {e}", exc_info=True)
+            if cur and not cur.closed:
+                cur.execute("ROLLBACK;") # Explicit BEGIN on an autocommit connection needs an explicit ROLLBACK
+            return None
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def get_scheduled_announcements_to_send(self):
-        """Retrieves scheduled announcements that are due."""
+    def backfill_word_freq(self, start_date=None):
+        """
+        Rebuilds word_freq from messages (all history, or from start_date on), tokenizing like the trigger does.
+        Inserts into messages are blocked while it runs so no increment is lost.
+        Returns the number of rollup rows written, or None on error.
+        """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
-            logging.warning(f"[{datetime.now()}] DB: No connection to get scheduled announcements.")
-            return []
+            logging.warning(f"[{datetime.now()}] DB: No connection to backfill word frequencies.")
+            return None
 
         cur = None
         try:
             cur = conn.cursor()
-            now_utc = datetime.utcnow()
-            cur.execute("""
-                SELECT id, chat_id, message_text FROM scheduled_announcements
-                WHERE schedule_datetime <= %s AND sent = FALSE;
-            """, (now_utc,))
-            announcements = cur.fetchall()
-            return announcements
+            cur.execute("BEGIN;")
+            cur.execute("LOCK TABLE messages IN SHARE MODE;")
+            cur.execute("DELETE FROM word_freq WHERE %s::date IS NULL OR day >= %s::date;", (start_date, start_date))
+            cur.execute(f"""
+                INSERT INTO word_freq (chat_id, day, word, count)
+                SELECT m.chat_id, (m.timestamp AT TIME ZONE 'UTC')::date AS day, w.word, COUNT(*)
+                FROM messages m
+                CROSS JOIN LATERAL ({WORD_FREQ_TOKENS_SQL.format(message="m.message")}) AS w
+                WHERE m.chat_id IS NOT NULL AND NOT COALESCE(m.is_bot, FALSE)
+                  AND m.message IS NOT NULL AND m.message !~* 'https?://'
+                  AND (%s::date IS NULL OR m.timestamp >= %s::date)
+                  AND {WORD_FREQ_WORD_FILTER_SQL}
+                GROUP BY m.chat_id, day, w.word;
+            """, (start_date, start_date))
+            written = cur.rowcount
+            cur.execute("COMMIT;")
+            logging.info(f"[{datetime.now()}] DB: Backfilled {written} word_freq row(s) (from {start_date or 'the beginning'}).")
+            return written
         except psycopg2.Error as e:
-            logging.error(f"[{datetime.now()}] DB: Error getting scheduled announcements: {e}", exc_info=True)
-            return []
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_scheduled_announcements_to_send: {e}", exc_info=True)
-            return []
+            logging.error(f"[{datetime.now()}] DB: Error backfilling word frequencies: {e}", exc_info=True)
+            if cur and not cur.closed:
+                cur.execute("ROLLBACK;") # Explicit BEGIN on an autocommit connection needs an explicit ROLLBACK
+            return None
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def mark_announcement_sent(self, ann_id):
-        """Marks a scheduled announcement as sent."""
+    def get_word_frequencies(self, chat_id, start_date, end_date=None, limit=200):
+        """
+        Returns the chat's `limit` most frequent words from start_date to end_date (inclusive) as {word: count},
+        merging the per-day word_freq rows. Cost depends on the number of distinct words, not messages.
+        Returns None if word_freq cannot be read (e.g. not migrated yet), {} if the chat has no words.
+        """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
-            logging.warning(f"[{datetime.now()}] DB: No connection to mark announcement sent.")
-            return
+            logging.warning(f"[{datetime.now()}] DB: No connection to get word frequencies.")
+            return None
 
         cur = None
         try:
             cur = conn.cursor()
-            cur.execute("UPDATE scheduled_announcements SET sent = TRUE WHERE id = %s", (ann_id,))
-            conn.commit()
-            logging.info(f"[{datetime.now()}] DB: Announcement ID {ann_id} marked as sent.")
+            cur.execute("""
+                SELECT word, SUM(count) AS total FROM word_freq
+                WHERE chat_id = %s AND day >= %s AND day <= %s
+                GROUP BY word
+                ORDER BY total DESC, word
+                LIMIT %s;
+            """, (chat_id, start_date, end_date or start_date, limit))
+            return {word: int(total) for word, total in cur.fetchall()}
         except psycopg2.Error as e:
-            logging.error(f"[{datetime.now()}] DB: Error marking announcement {ann_id} as sent: {e}", exc_info=True)
-            if conn: conn.rollback()
+            logging.error(f"[{datetime.now()}] DB: Error getting word frequencies: {e}", exc_info=True)
+            return None
         except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error marking announcement {ann_id} sent: {e}", exc_info=True)
-            if conn: conn.rollback()
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_word_frequencies: {e}", exc_info=True)
+            return None
         finally:
             if cur: cur.close()
+            self._release_connection()
 
-    def has_job_executed_today(self, job_name_base, current_date, slot=None):
+    def get_wordcloud_frequencies(self, chat_id, stop_words=(), min_word_length=4, max_words=5000, itersize=5000, day=None):
         """
-        Checks if a scheduled job has already been executed for the given date and optional slot.
-        Combines job_name_base and slot to form a unique job_name.
+        Returns {word: count} for the chat's non-bot messages of `day` (default: today, UTC), excluding messages with links and stop words.
+        Words are streamed through a server-side cursor `itersize` rows at a time into a bounded counter,
+        so memory does not grow with the number of messages.
         """
+        self._flush_pending_writes()
         conn = self._get_connection()
         if not conn:
-            logging.warning(f"[{datetime.now()}] DB: No connection to check job execution status for {job_name_base}.")
-            return False
+            logging.warning(f"[{datetime.now()}] DB: No connection to get wordcloud frequencies.")
+            return {}
 
         cur = None
         try:
-            job_name = f"{job_name_base}_{slot}" if slot else job_name_base
-
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT 1 FROM scheduled_job_executions_v2
-                WHERE job_name = %s AND execution_date = %s;
-            """, (job_name, current_date))
-            result = cur.fetchone()
-            if result:
-                logging.info(f"[{datetime.now()}] DB: Scheduled job '{job_name}' already executed for {current_date}.")
-                return True
-            return False
+            conn.autocommit = False # Named (server-side) cursors only live inside a transaction
+            cur = conn.cursor(name="wordcloud_words")
+            cur.itersize = itersize
+            today = day or datetime.utcnow().date()
+            tomorrow = today + timedelta(days=1)
+            cur.execute(WORDCLOUD_WORDS_SQL, (chat_id, today, tomorrow, min_word_length, [word.lower() for word in stop_words]))
+
+            counter = WordFrequencyCounter(max_words=max_words, min_word_length=min_word_length, stop_words=stop_words)
+            for (word,) in cur:
+                counter.add(word)
+            frequencies = counter.frequencies()
+            logging.info(f"[{datetime.now()}] DB: Counted {len(frequencies)} distinct wordcloud words for chat {chat_id}.")
+            return frequencies
         except psycopg2.Error as e:
-            logging.error(f"[{datetime.now()}] DB: Error checking job execution status for {job_name_base} (slot: {slot}): {e}", exc_info=True)
-            return False
+            logging.error(f"[{datetime.now()}] DB: Error getting wordcloud frequencies: {e}", exc_info=True)
+            return {}
         except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error checking job execution status for {job_name_base} (slot: {slot}): {e}", exc_info=True)
-            return False
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_wordcloud_frequencies: {e}", exc_info=True)
+            return {}
         finally:
             if cur: cur.close()
+            if not conn.closed:
+                conn.rollback() # Read-only; ends the cursor's transaction
+                conn.autocommit = True
+            self._release_connection()
 
-    def record_job_execution(self, job_name_base, execution_date, slot=None):
-        """
-        Records that a scheduled job has been executed for the given date and optional slot.
-        Combines job_name_base and slot to form a unique job_name.
-        Returns True if the execution was recorded, False if it was already recorded.
-        """
+    def get_pending_announcements(self):
+        """Returns (id, schedule_datetime) of every unsent announcement, earliest first."""
         conn = self._get_connection()
         if not conn:
-            logging.warning(f"[{datetime.now()}] DB: No connection to record job execution for {job_name_base}.")
-            return False
+            logging.warning(f"[{datetime.now()}] DB: No connection to get scheduled announcements.")
+            return []
 
         cur = None
         try:
             cur = conn.cursor()
-            job_name = f"{job_name_base}_{slot}" if slot else job_name_base
+            cur.execute("""
+                SELECT id, schedule_datetime FROM scheduled_announcements
+                WHERE sent = FALSE
+                ORDER BY schedule_datetime;
+            """)
+            return cur.fetchall()
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error getting scheduled announcements: {e}", exc_info=True)
+            return []
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_pending_announcements: {e}", exc_info=True)
+            return []
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def claim_announcement(self, ann_id):
+        """
+        Atomically marks a due, unsent announcement as sent, so it is never sent twice. Returns (status, value):
+        ('claimed', (chat_id, message_text)); ('not_due', seconds until due by the DB clock);
+        ('taken', None) if another process already claimed it or it is gone; ('error', None) if the DB failed.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to claim announcement {ann_id}.")
+            return ("error", None)
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE scheduled_announcements SET sent = TRUE
+                WHERE id = %s AND sent = FALSE AND schedule_datetime <= now()
+                RETURNING chat_id, message_text;
+            """, (ann_id,))
+            row = cur.fetchone()
+            if row:
+                return ("claimed", row)
+            # The app host's clock may run slightly ahead of the DB's: tell the caller how long to wait
+            cur.execute("""
+                SELECT GREATEST(EXTRACT(EPOCH FROM schedule_datetime - now()), 0)
+                FROM scheduled_announcements WHERE id = %s AND sent = FALSE;
+            """, (ann_id,))
+            row = cur.fetchone()
+            return ("not_due", float(row[0])) if row else ("taken", None)
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error claiming announcement {ann_id}: {e}", exc_info=True)
+            return ("error", None)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error claiming announcement {ann_id}: {e}", exc_info=True)
+            return ("error", None)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def release_announcement(self, ann_id):
+        """Returns a claimed announcement to the pending state after a failed send."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to release announcement {ann_id}.")
+            return
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("UPDATE scheduled_announcements SET sent = FALSE WHERE id = %s", (ann_id,))
+            logging.info(f"[{datetime.now()}] DB: Announcement ID {ann_id} released for a retry.")
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error releasing announcement {ann_id}: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error releasing announcement {ann_id}: {e}", exc_info=True)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def has_job_executed_today(self, job_name_base, current_date, slot=None):
+        """
+        Checks if a scheduled job has already been executed for the given date and optional slot.
+        Combines job_name_base and slot to form a unique job_name.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to check job execution status for {job_name_base}.")
+            return False
+
+        cur = None
+        try:
+            job_name = f"{job_name_base}_{slot}" if slot else job_name_base
+
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT 1 FROM scheduled_job_executions_v2
+                WHERE job_name = %s AND execution_date = %s;
+            """, (job_name, current_date))
+            result = cur.fetchone()
+            if result:
+                logging.info(f"[{datetime.now()}] DB: Scheduled job '{job_name}' already executed for {current_date}.")
+                return True
+            return False
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error checking job execution status for {job_name_base} (slot: {slot}): {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error checking job execution status for {job_name_base} (slot: {slot}): {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def record_job_execution(self, job_name_base, execution_date, slot=None):
+        """
+        Records that a scheduled job has been executed for the given date and optional slot.
+        Combines job_name_base and slot to form a unique job_name.
+        Returns True if the execution was recorded, False if it was already recorded, None on a DB error.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to record job execution for {job_name_base}.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            job_name = f"{job_name_base}_{slot}" if slot else job_name_base
+
+            cur.execute("""
+                INSERT INTO scheduled_job_executions_v2 (job_name, execution_date)
+                VALUES (%s, %s)
+                ON CONFLICT (job_name, execution_date) DO NOTHING;
+            """, (job_name, execution_date))
+            conn.commit()
+            if cur.rowcount > 0:
+                logging.info(f"[{datetime.now()}] DB: Recorded execution for scheduled job '{job_name}' on {execution_date}.")
+                return True
+            else:
+                logging.info(f"[{datetime.now()}] DB: Execution for scheduled job '{job_name}' on {execution_date} already recorded (duplicate attempt).")
+                return False
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error recording job execution for {job_name_base} (slot: {slot}): {e}", exc_info=True)
+            if conn: conn.rollback()
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error recording job execution for {job_name_base} (slot: {slot}): {e}", exc_info=True)
+            if conn: conn.rollback()
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def forget_job_execution(self, job_name, execution_date):
+        """Removes a recorded execution, so a run claimed by record_job_execution but not delivered can be retried."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to forget job execution for {job_name}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                DELETE FROM scheduled_job_executions_v2
+                WHERE job_name = %s AND execution_date = %s;
+            """, (job_name, execution_date))
+            return cur.rowcount > 0
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error forgetting job execution for {job_name}: {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in forget_job_execution: {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def enqueue_job(self, job_name, handler, execution_date, run_at, expires_at=None, max_attempts=3):
+        """
+        Adds a job run to job_queue unless it is already queued or recorded in scheduled_job_executions_v2.
+        Returns True if a new run was queued.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to enqueue job {job_name}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO job_queue (job_name, handler, execution_date, run_at, slot_at, expires_at, max_attempts)
+                SELECT %s, %s, %s, %s, %s, %s, %s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM scheduled_job_executions_v2 WHERE job_name = %s AND execution_date = %s
+                )
+                ON CONFLICT (job_name, execution_date) DO NOTHING;
+            """, (job_name, handler, execution_date, run_at, run_at, expires_at, max_attempts, job_name, execution_date))
+            if cur.rowcount > 0:
+                logging.info(f"[{datetime.now()}] DB: Queued job '{job_name}' for {execution_date} at {run_at}.")
+                return True
+            return False
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error enqueuing job {job_name}: {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in enqueue_job: {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def claim_job(self, worker_id, lease_seconds):
+        """
+        Takes the earliest due job: pending, or running with an expired lease (its worker died).
+        FOR UPDATE SKIP LOCKED lets any number of workers poll at once without taking the same row.
+        Returns a dict with the job row, or None if nothing is due.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to claim a job.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE job_queue
+                SET status = 'running', attempts = attempts + 1, locked_by = %s,
+                    locked_until = now() + make_interval(secs => %s)
+                WHERE id = (
+                    SELECT id FROM job_queue
+                    WHERE run_at <= now()
+                      AND (expires_at IS NULL OR expires_at > now())
+                      AND (status = 'pending' OR (status = 'running' AND locked_until < now() AND attempts < max_attempts))
+                    ORDER BY run_at
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, job_name, handler, execution_date, run_at, slot_at, attempts, max_attempts;
+            """, (worker_id, lease_seconds))
+            row = cur.fetchone()
+            if not row:
+                return None
+            columns = [desc[0] for desc in cur.description]
+            return dict(zip(columns, row))
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error claiming a job: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in claim_job: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def extend_job_lease(self, job_id, worker_id, lease_seconds):
+        """Heartbeat for a running job: pushes locked_until forward while this worker still holds it. Returns True if extended."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to extend the lease of job {job_id}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE job_queue SET locked_until = now() + make_interval(secs => %s)
+                WHERE id = %s AND locked_by = %s AND status = 'running';
+            """, (lease_seconds, job_id, worker_id))
+            return cur.rowcount == 1
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error extending the lease of job {job_id}: {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in extend_job_lease: {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def complete_job(self, job_id, job_name, execution_date):
+        """Marks a claimed job as done and records it in scheduled_job_executions_v2, atomically."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to complete job {job_name}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("BEGIN;")
+            cur.execute("""
+                UPDATE job_queue SET status = 'done', finished_at = now(), locked_until = NULL, last_error = NULL
+                WHERE id = %s;
+            """, (job_id,))
+            cur.execute("""
+                INSERT INTO scheduled_job_executions_v2 (job_name, execution_date)
+                VALUES (%s, %s)
+                ON CONFLICT (job_name, execution_date) DO NOTHING;
+            """, (job_name, execution_date))
+            cur.execute("COMMIT;")
+            return True
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error completing job {job_name}: {e}", exc_info=True)
+            if cur and not cur.closed:
+                cur.execute("ROLLBACK;") # Explicit BEGIN on an autocommit connection needs an explicit ROLLBACK
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def fail_job(self, job_id, error_text, retry_delay_seconds):
+        """
+        Records a failed attempt: the job is retried after `retry_delay_seconds`, or marked 'failed'
+        once it has used max_attempts. Returns the new status, or None on error.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to record job failure.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE job_queue
+                SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                    run_at = CASE WHEN attempts >= max_attempts THEN run_at ELSE now() + make_interval(secs => %s) END,
+                    finished_at = CASE WHEN attempts >= max_attempts THEN now() END,
+                    last_error = %s, locked_by = NULL, locked_until = NULL
+                WHERE id = %s
+                RETURNING status;
+            """, (retry_delay_seconds, error_text[:2000], job_id))
+            row = cur.fetchone()
+            return row[0] if row else None
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error recording job failure: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in fail_job: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def expire_jobs(self):
+        """Closes runs that can no longer happen: past their catch-up window, or out of attempts after a crash."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to expire jobs.")
+            return 0
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE job_queue
+                SET status = CASE WHEN status = 'pending' THEN 'expired' ELSE 'failed' END,
+                    finished_at = now(), locked_until = NULL,
+                    last_error = COALESCE(last_error, CASE WHEN status = 'pending' THEN 'missed its catch-up window' ELSE 'worker lease expired' END)
+                WHERE (status = 'pending' AND expires_at <= now())
+                   OR (status = 'running' AND locked_until < now() AND (attempts >= max_attempts OR expires_at <= now()));
+            """)
+            if cur.rowcount:
+                logging.warning(f"[{datetime.now()}] DB: Closed {cur.rowcount} job run(s) that can no longer run.")
+            return cur.rowcount
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error expiring jobs: {e}", exc_info=True)
+            return 0
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in expire_jobs: {e}", exc_info=True)
+            return 0
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    @contextlib.contextmanager
+    def try_advisory_lock(self, name):
+        """
+        Yields True if this process got the named session-level advisory lock (and holds it until exit),
+        False if another process has it. The connection stays checked out for the duration.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to take advisory lock '{name}'.")
+            yield False
+            return
+
+        cur = None
+        acquired = False
+        try:
+            cur = conn.cursor()
+            # Two-key form keeps these locks apart from DB_MIGRATIONS_LOCK_ID
+            cur.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s));", (DB_MIGRATIONS_LOCK_ID, name))
+            acquired = cur.fetchone()[0]
+            yield acquired
+        finally:
+            if cur:
+                if acquired and not conn.closed:
+                    cur.execute("SELECT pg_advisory_unlock(%s, hashtext(%s));", (DB_MIGRATIONS_LOCK_ID, name))
+                cur.close()
+            self._release_connection()
+
+    def get_chat_subscriptions(self, report_type=None, include_disabled=False):
+        """Returns chat_subscriptions rows as dicts (chat_id, report_type, local_time, timezone, enabled)."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to get chat subscriptions.")
+            return []
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT chat_id, report_type, local_time, timezone, enabled
+                FROM chat_subscriptions
+                WHERE (%s IS NULL OR report_type = %s) AND (enabled OR %s)
+                ORDER BY report_type, local_time, chat_id;
+            """, (report_type, report_type, include_disabled))
+            columns = [desc[0] for desc in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error getting chat subscriptions: {e}", exc_info=True)
+            return []
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_chat_subscriptions: {e}", exc_info=True)
+            return []
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def subscribe_chat(self, chat_id, report_type, local_time, timezone_name, enabled=True):
+        """Adds a subscription, or updates the timezone and re-enables an existing one. Returns True on success."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to subscribe chat {chat_id}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO chat_subscriptions (chat_id, report_type, local_time, timezone, enabled)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (chat_id, report_type, local_time)
+                DO UPDATE SET timezone = EXCLUDED.timezone, enabled = EXCLUDED.enabled;
+            """, (chat_id, report_type, local_time, timezone_name, enabled))
+            logging.info(f"[{datetime.now()}] DB: Chat {chat_id} subscribed to '{report_type}' at {local_time} {timezone_name} (enabled: {enabled}).")
+            return True
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error subscribing chat {chat_id} to '{report_type}': {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in subscribe_chat: {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def set_subscription_enabled(self, chat_id, report_type, local_time, enabled):
+        """Turns an existing subscription on or off without touching its timezone. Returns True if it exists."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to update subscription of chat {chat_id}.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE chat_subscriptions SET enabled = %s
+                WHERE chat_id = %s AND report_type = %s AND local_time = %s;
+            """, (enabled, chat_id, report_type, local_time))
+            if cur.rowcount == 0:
+                logging.warning(f"[{datetime.now()}] DB: Chat {chat_id} has no '{report_type}' subscription at {local_time}.")
+                return False
+            logging.info(f"[{datetime.now()}] DB: Subscription of chat {chat_id} to '{report_type}' at {local_time} enabled: {enabled}.")
+            return True
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error updating subscription of chat {chat_id} to '{report_type}': {e}", exc_info=True)
+            return False
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in set_subscription_enabled: {e}", exc_info=True)
+            return False
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def unsubscribe_chat(self, chat_id, report_type, local_time=None):
+        """Removes a chat's subscription to report_type (all of its times unless local_time is given). Returns rows removed."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to unsubscribe chat {chat_id}.")
+            return 0
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                DELETE FROM chat_subscriptions
+                WHERE chat_id = %s AND report_type = %s AND (%s::time IS NULL OR local_time = %s::time);
+            """, (chat_id, report_type, local_time, local_time))
+            logging.info(f"[{datetime.now()}] DB: Removed {cur.rowcount} subscription(s) of chat {chat_id} to '{report_type}'.")
+            return cur.rowcount
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error unsubscribing chat {chat_id} from '{report_type}': {e}", exc_info=True)
+            return 0
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in unsubscribe_chat: {e}", exc_info=True)
+            return 0
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_social_video_cache_entry(self, source_url):
+        """
+        Returns the cached video for a normalized source URL as
+        {"resolved_url", "resolved_at", "telegram_file_id"}, or None if the link was never seen.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to read social video cache.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE social_video_cache SET hits = hits + 1
+                WHERE source_url = %s
+                RETURNING resolved_url, resolved_at, telegram_file_id;
+            """, (source_url,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            return {"resolved_url": row[0], "resolved_at": row[1], "telegram_file_id": row[2]}
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error reading social video cache: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_social_video_cache_entry: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def save_social_video_cache_entry(self, source_url, resolved_url=None, telegram_file_id=None):
+        """
+        Stores the resolved media URL and/or Telegram file_id for a normalized source URL.
+        Fields passed as None keep their current value.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to update social video cache.")
+            return
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO social_video_cache (source_url, resolved_url, resolved_at, telegram_file_id, uploaded_at)
+                VALUES (%s, %s, CASE WHEN %s IS NULL THEN NULL ELSE now() END, %s, CASE WHEN %s IS NULL THEN NULL ELSE now() END)
+                ON CONFLICT (source_url) DO UPDATE SET
+                    resolved_url = COALESCE(EXCLUDED.resolved_url, social_video_cache.resolved_url),
+                    resolved_at = COALESCE(EXCLUDED.resolved_at, social_video_cache.resolved_at),
+                    telegram_file_id = COALESCE(EXCLUDED.telegram_file_id, social_video_cache.telegram_file_id),
+                    uploaded_at = COALESCE(EXCLUDED.uploaded_at, social_video_cache.uploaded_at);
+            """, (source_url, resolved_url, resolved_url, telegram_file_id, telegram_file_id))
+            logging.info(f"[{datetime.now()}] DB: Social video cache updated for {source_url} (resolved: {resolved_url is not None}, file_id: {telegram_file_id is not None}).")
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error updating social video cache: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in save_social_video_cache_entry: {e}", exc_info=True)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def invalidate_social_video_cache_entry(self, source_url, resolved_url=False, telegram_file_id=False):
+        """Clears the resolved URL and/or file_id of a cached video that turned out to be stale."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to invalidate social video cache.")
+            return
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE social_video_cache SET
+                    resolved_url = CASE WHEN %s THEN NULL ELSE resolved_url END,
+                    resolved_at = CASE WHEN %s THEN NULL ELSE resolved_at END,
+                    telegram_file_id = CASE WHEN %s THEN NULL ELSE telegram_file_id END,
+                    uploaded_at = CASE WHEN %s THEN NULL ELSE uploaded_at END
+                WHERE source_url = %s;
+            """, (resolved_url, resolved_url, telegram_file_id, telegram_file_id, source_url))
+            logging.info(f"[{datetime.now()}] DB: Social video cache invalidated for {source_url} (resolved: {resolved_url}, file_id: {telegram_file_id}).")
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error invalidating social video cache: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in invalidate_social_video_cache_entry: {e}", exc_info=True)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_cached_translation(self, cache_key):
+        """Returns a stored translation for the cache key, or None."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to read translation cache.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("UPDATE translation_cache SET hits = hits + 1 WHERE cache_key = %s RETURNING translated_text;", (cache_key,))
+            row = cur.fetchone()
+            return row[0] if row else None
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error reading translation cache: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_cached_translation: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def save_cached_translation(self, cache_key, target_language, model, translated_text):
+        """Stores a translation under its cache key (first writer wins)."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to save translation cache.")
+            return
 
+        cur = None
+        try:
+            cur = conn.cursor()
             cur.execute("""
-                INSERT INTO scheduled_job_executions_v2 (job_name, execution_date)
-                VALUES (%s, %s)
-                ON CONFLICT (job_name, execution_date) DO NOTHING;
-            """, (job_name, execution_date))
-            conn.commit()
-            if cur.rowcount > 0:
-                logging.info(f"[{datetime.now()}] DB: Recorded execution for scheduled job '{job_name}' on {execution_date}.")
-                return True
+                INSERT INTO translation_cache (cache_key, target_language, model, translated_text)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cache_key) DO NOTHING;
+            """, (cache_key, target_language, model, translated_text))
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error saving translation cache: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in save_cached_translation: {e}", exc_info=True)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_cached_chunk_summaries(self, chunk_keys):
+        """Returns {chunk_key: summary_text} for the chunk keys that were summarized before."""
+        if not chunk_keys:
+            return {}
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to read summary chunk cache.")
+            return {}
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_key, summary_text FROM summary_chunk_cache WHERE chunk_key = ANY(%s);", (list(chunk_keys),))
+            return dict(cur.fetchall())
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error reading summary chunk cache: {e}", exc_info=True)
+            return {}
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_cached_chunk_summaries: {e}", exc_info=True)
+            return {}
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def save_chunk_summary(self, chunk_key, summary_date, summary_text, keep_days=7):
+        """Stores a chunk summary and drops chunk summaries older than `keep_days`."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to save summary chunk cache.")
+            return
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO summary_chunk_cache (chunk_key, summary_date, summary_text)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (chunk_key) DO NOTHING;
+            """, (chunk_key, summary_date, summary_text))
+            cur.execute("DELETE FROM summary_chunk_cache WHERE summary_date < %s;", (summary_date - timedelta(days=keep_days),))
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error saving summary chunk cache: {e}", exc_info=True)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in save_chunk_summary: {e}", exc_info=True)
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_rolling_summary(self, chat_id, summary_date):
+        """Returns {"summary_text", "last_message_id", "messages_folded"} for the chat's day, or None."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to get rolling summary.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT summary_text, last_message_id, messages_folded FROM rolling_summaries
+                WHERE chat_id = %s AND summary_date = %s;
+            """, (chat_id, summary_date))
+            row = cur.fetchone()
+            if not row:
+                return None
+            return {"summary_text": row[0], "last_message_id": row[1], "messages_folded": row[2]}
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error getting rolling summary: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_rolling_summary: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_messages_after(self, chat_id, summary_date, after_message_id=0, settle_seconds=0):
+        """
+        Returns (id, username, message) of the chat's non-bot messages of the UTC day with id > after_message_id,
+        in insertion order. With `settle_seconds`, rows inserted more recently are left out: a lower id may
+        still be uncommitted, and folding past it would skip it for good.
+        """
+        self._flush_pending_writes()
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to get new messages for chat {chat_id}.")
+            return []
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, username, message FROM messages
+                WHERE chat_id = %s AND timestamp >= %s AND timestamp < %s
+                  AND is_bot = FALSE AND message IS NOT NULL AND id > %s
+                  AND inserted_at < now() - make_interval(secs => %s)
+                ORDER BY id ASC;
+            """, (chat_id, summary_date, summary_date + timedelta(days=1), after_message_id, settle_seconds))
+            return cur.fetchall()
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error getting new messages for chat {chat_id}: {e}", exc_info=True)
+            return []
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_messages_after: {e}", exc_info=True)
+            return []
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def get_chats_with_unsummarized_messages(self, summary_date, min_new_messages, settle_seconds=0):
+        """Returns chat ids that have at least `min_new_messages` settled messages not yet folded into their rolling summary."""
+        self._flush_pending_writes()
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to find chats for rolling summaries.")
+            return []
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT m.chat_id FROM messages m
+                LEFT JOIN rolling_summaries r ON r.chat_id = m.chat_id AND r.summary_date = %s
+                WHERE m.timestamp >= %s AND m.timestamp < %s AND m.chat_id IS NOT NULL
+                  AND m.is_bot = FALSE AND m.message IS NOT NULL AND m.id > COALESCE(r.last_message_id, 0)
+                  AND m.inserted_at < now() - make_interval(secs => %s)
+                GROUP BY m.chat_id
+                HAVING COUNT(*) >= %s;
+            """, (summary_date, summary_date, summary_date + timedelta(days=1), settle_seconds, min_new_messages))
+            return [row[0] for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error finding chats for rolling summaries: {e}", exc_info=True)
+            return []
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_chats_with_unsummarized_messages: {e}", exc_info=True)
+            return []
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def save_rolling_summary(self, chat_id, summary_date, summary_text, last_message_id, messages_folded, expected_last_message_id=None):
+        """
+        Stores the chat's running summary only if nobody else folded messages in the meantime
+        (compare-and-set on last_message_id). Returns True if the summary was saved.
+        """
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to save rolling summary.")
+            return False
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            if expected_last_message_id is None:
+                cur.execute("""
+                    INSERT INTO rolling_summaries (chat_id, summary_date, summary_text, last_message_id, messages_folded)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (chat_id, summary_date) DO NOTHING;
+                """, (chat_id, summary_date, summary_text, last_message_id, messages_folded))
             else:
-                logging.info(f"[{datetime.now()}] DB: Execution for scheduled job '{job_name}' on {execution_date} already recorded (duplicate attempt).")
-                return False
+                cur.execute("""
+                    UPDATE rolling_summaries
+                    SET summary_text = %s, last_message_id = %s, messages_folded = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE chat_id = %s AND summary_date = %s AND last_message_id = %s;
+                """, (summary_text, last_message_id, messages_folded, chat_id, summary_date, expected_last_message_id))
+            saved = cur.rowcount == 1
+            if not saved:
+                logging.info(f"[{datetime.now()}] DB: Rolling summary for chat {chat_id} was updated concurrently; result discarded.")
+            return saved
         except psycopg2.Error as e:
-            logging.error(f"[{datetime.now()}] DB: Error recording job execution for {job_name_base} (slot: {slot}): {e}", exc_info=True)
-            if conn: conn.rollback()
+            logging.error(f"[{datetime.now()}] DB: Error saving rolling summary: {e}", exc_info=True)
             return False
         except Exception as e:
-            logging.error(f"[{datetime.now()}] DB: Unexpected error recording job execution for {job_name_base} (slot: {slot}): {e}", exc_info=True)
-            if conn: conn.rollback()
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in save_rolling_summary: {e}", exc_info=True)
             return False
         finally:
             if cur: cur.close()
+            self._release_connection()
+
+    def get_fact_pool_status(self, kind):
+        """Returns (normalized texts of every pooled fact of this kind, sent or not; number still available)."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to read the fact pool.")
+            return [], 0
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT normalized_fact, sent_at IS NULL FROM fact_pool WHERE kind = %s;", (kind,))
+            rows = cur.fetchall()
+            return [row[0] for row in rows], sum(1 for row in rows if row[1])
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error reading fact pool: {e}", exc_info=True)
+            return [], 0
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in get_fact_pool_status: {e}", exc_info=True)
+            return [], 0
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def add_pool_facts(self, kind, facts):
+        """Inserts (fact, normalized_fact) pairs as available facts. Returns how many were new."""
+        if not facts:
+            return 0
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to add facts to the pool.")
+            return 0
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(
+                cur,
+                """INSERT INTO fact_pool (kind, fact, normalized_fact) VALUES %s
+                   ON CONFLICT (kind, normalized_fact) DO NOTHING;""",
+                [(kind, fact, normalized) for fact, normalized in facts]
+            )
+            return cur.rowcount
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error adding facts to the pool: {e}", exc_info=True)
+            return 0
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in add_pool_facts: {e}", exc_info=True)
+            return 0
+        finally:
+            if cur: cur.close()
+            self._release_connection()
+
+    def pop_pool_fact(self, kind):
+        """Marks the oldest available fact of this kind as sent and returns its text, or None if the pool is empty."""
+        conn = self._get_connection()
+        if not conn:
+            logging.warning(f"[{datetime.now()}] DB: No connection to take a fact from the pool.")
+            return None
+
+        cur = None
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE fact_pool SET sent_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM fact_pool
+                    WHERE kind = %s AND sent_at IS NULL
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING fact;
+            """, (kind,))
+            row = cur.fetchone()
+            return row[0] if row else None
+        except psycopg2.Error as e:
+            logging.error(f"[{datetime.now()}] DB: Error taking a fact from the pool: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] DB: Unexpected error in pop_pool_fact: {e}", exc_info=True)
+            return None
+        finally:
+            if cur: cur.close()
+            self._release_connection()
 
     def table_exists(self, table_name):
         """Checks if a given table exists in the database."""
@@ -758,16 +2668,202 @@ class DatabaseManager:
             return exists
         finally:
             if cur: cur.close()
+            self._release_connection()
 
 
-# Instantiate DatabaseManager
+# Instantiate DatabaseManager (the write buffer is started by start_background_services)
 db_manager = DatabaseManager(Config.DATABASE_URL)
 
 
+# === Translation Cache ===
+class TranslationCache:
+    """
+    Content-hash keyed translations: in-process LRU over the translation_cache table, plus
+    single-flight coalescing so concurrent requests for the same text share one OpenAI call.
+    """
+    def __init__(self, db, max_memory_entries=2000):
+        self.db = db
+        self.max_memory_entries = max_memory_entries
+        self._entries = OrderedDict()
+        self._in_flight = {} # cache_key -> concurrent.futures.Future of the leader's call
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model, system_prompt, text):
+        payload = json.dumps([model, system_prompt, text.strip()], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def peek(self, cache_key):
+        """Memory-only lookup."""
+        with self._lock:
+            value = self._entries.get(cache_key)
+            if value is not None:
+                self._entries.move_to_end(cache_key)
+            return value
+
+    def _remember(self, cache_key, value):
+        with self._lock:
+            self._entries[cache_key] = value
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_memory_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, cache_key):
+        """Memory, then DB; a DB hit is promoted to memory."""
+        value = self.peek(cache_key)
+        if value is None:
+            value = self.db.get_cached_translation(cache_key)
+            if value is not None:
+                self._remember(cache_key, value)
+        return value
+
+    def put(self, cache_key, target_language, model, value):
+        self._remember(cache_key, value)
+        self.db.save_cached_translation(cache_key, target_language, model, value)
+
+    def get_or_compute(self, cache_key, target_language, model, compute):
+        """
+        Returns the cached translation or runs `compute()` once for all concurrent callers of the key.
+        Exceptions from `compute()` are re-raised to every waiting caller and nothing is cached.
+        """
+        value = self.peek(cache_key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._in_flight.get(cache_key)
+            is_leader = future is None
+            if is_leader:
+                future = concurrent.futures.Future()
+                self._in_flight[cache_key] = future
+        if not is_leader:
+            logging.info(f"[{datetime.now()}] TranslationCache: Waiting for in-flight translation {cache_key[:12]}.")
+            return future.result()
+
+        try:
+            value = self.get(cache_key)
+            if value is None:
+                value = compute()
+                self.put(cache_key, target_language, model, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+
+translation_cache = TranslationCache(db_manager, Config.TRANSLATION_CACHE_MEMORY_ENTRIES)
+
+
+# === Conversation Context ===
+class ConversationContextBuilder:
+    """
+    Assembles the history sent with an expert question under a token budget rather than a row count:
+    the reply chain the user is answering comes first, then the most recent messages, newest first,
+    until the budget is spent. Entries over `max_entry_tokens` are truncated.
+    The last `tail_size` messages per chat are kept in memory (fed by DatabaseManager.save_message
+    and reloaded after `tail_ttl_seconds`), so most lookups skip the DB.
+    """
+    def __init__(self, db, token_budget=1200, max_entry_tokens=200, max_reply_depth=6, tail_size=50, tail_ttl_seconds=300):
+        self.db = db
+        self.token_budget = token_budget
+        self.max_entry_tokens = max_entry_tokens
+        self.max_reply_depth = max_reply_depth
+        self.tail_size = tail_size
+        self.tail_ttl_seconds = tail_ttl_seconds
+        self._tails = {} # chat_id -> (deque of entries, loaded_at monotonic)
+        self._lock = threading.Lock()
+
+    def record(self, row):
+        """DatabaseManager message listener: appends a saved message to the chat's cached tail."""
+        telegram_message_id, user_id, username, message, message_date, is_bot, chat_id, bot_message_type, reply_to_message_id = row
+        entry = {"telegram_message_id": telegram_message_id, "username": username, "message": message, "is_bot": bool(is_bot), "reply_to_message_id": reply_to_message_id}
+        with self._lock:
+            cached = self._tails.get(chat_id)
+            if cached is None:
+                return # Loaded from the DB on first use
+            tail = cached[0]
+            for i, existing in enumerate(tail):
+                if existing["telegram_message_id"] == telegram_message_id:
+                    tail[i] = entry
+                    return
+            tail.append(entry)
+
+    def _get_tail(self, chat_id):
+        with self._lock:
+            cached = self._tails.get(chat_id)
+            if cached and time.monotonic() - cached[1] < self.tail_ttl_seconds:
+                return list(cached[0])
+        entries = self.db.get_recent_context_entries(chat_id, limit=self.tail_size)
+        with self._lock:
+            self._tails[chat_id] = (deque(entries, maxlen=self.tail_size), time.monotonic())
+        return entries
+
+    def _reply_chain(self, chat_id, reply_to_message_id, tail_by_id):
+        """Entries of the reply chain ending at `reply_to_message_id`, oldest first."""
+        chain = []
+        next_id = reply_to_message_id
+        while next_id and len(chain) < self.max_reply_depth:
+            entry = tail_by_id.get(next_id)
+            if entry is None:
+                row = self.db.get_message_by_id(next_id)
+                if not row or row.get("chat_id") != chat_id or row.get("message") is None:
+                    break
+                entry = {key: row.get(key) for key in ("telegram_message_id", "username", "message", "is_bot", "reply_to_message_id")}
+            chain.append(entry)
+            next_id = entry.get("reply_to_message_id")
+        chain.reverse()
+        return chain
+
+    def _to_chat_message(self, entry):
+        content = truncate_to_tokens(entry["message"], self.max_entry_tokens)
+        if entry["is_bot"]:
+            return {"role": "assistant", "content": content}
+        return {"role": "user", "content": f"{entry['username'] if entry['username'] else 'Unknown user'}: {content}"}
+
+    def build(self, chat_id, reply_to_message_id=None, exclude_message_id=None):
+        """Returns [{"role", "content"}] in chronological order, within the token budget."""
+        tail = [entry for entry in self._get_tail(chat_id) if entry["telegram_message_id"] != exclude_message_id]
+        tail_by_id = {entry["telegram_message_id"]: entry for entry in tail}
+        chain = self._reply_chain(chat_id, reply_to_message_id, tail_by_id) if reply_to_message_id else []
+
+        selected = {}
+        used_tokens = 0
+        # Reply chain first (closest to the question first), then the newest messages
+        for entry in list(reversed(chain)) + list(reversed(tail)):
+            if entry["telegram_message_id"] in selected:
+                continue
+            chat_message = self._to_chat_message(entry)
+            entry_tokens = count_tokens(chat_message["content"]) + 4
+            if used_tokens + entry_tokens > self.token_budget:
+                if entry in chain:
+                    continue # A shorter, older chain entry may still fit
+                break
+            selected[entry["telegram_message_id"]] = chat_message
+            used_tokens += entry_tokens
+
+        logging.info(f"[{datetime.now()}] Context: {len(selected)} message(s), ~{used_tokens} tokens for chat {chat_id} (reply chain: {len(chain)}).")
+        return [selected[message_id] for message_id in sorted(selected, key=lambda message_id: message_id or 0)]
+
+conversation_context = ConversationContextBuilder(
+    db_manager,
+    token_budget=Config.CONTEXT_TOKEN_BUDGET,
+    max_entry_tokens=Config.CONTEXT_MAX_ENTRY_TOKENS,
+    max_reply_depth=Config.CONTEXT_MAX_REPLY_DEPTH,
+    tail_size=Config.CONTEXT_TAIL_SIZE,
+    tail_ttl_seconds=Config.CONTEXT_TAIL_TTL_SECONDS
+)
+db_manager.message_listeners.append(conversation_context.record)
+
+
 # === OpenAI Service Class ===
 class OpenAIService:
-    def __init__(self, client):
+    def __init__(self, client, translation_cache=None):
         self.client = client
+        self.translation_cache = translation_cache
+        self.translation_model = "gpt-4.1-nano"
         self.expert_roles = [
             "Ти — шановний історик-дослідник, що мандрує крізь часи, щоб розкрити правду.",
             "Мої думки ширять у завтрашньому дні. Я — футуролог, що бачить можливі шляхи майбутнього.",
@@ -808,20 +2904,113 @@ class OpenAIService:
 - Дій відповідно до своєї ролі, формуючи огляд чату. Додай до огляду легкий тон, що відповідає твоїй обраній ролі, але зберігай професіоналізм та об'єктивність.
 """
 
-    def generate_summary(self, messages_data):
-        """Generates a summary from a list of messages using OpenAI."""
+    def _get_chunk_summary_system_prompt(self):
+        """Neutral prompt for the map step; the role is applied only in the final reduce step."""
+        return f"""
+Тобі дано фрагмент групового чату в хронологічному порядку (рядки "користувач: повідомлення").
+Стисло перекажи його для подальшого об'єднання з іншими фрагментами того ж дня:
+- перелічи теми та події, ключові рішення/висновки;
+- обов'язково зберігай username або імена учасників ключових обговорень;
+- ігноруй привітання, флуд та меми;
+- без вступу та оцінок, не більше {Config.SUMMARY_CHUNK_SUMMARY_TOKENS} токенів.
+""".strip()
+
+    def _split_summary_chunks(self, lines, chunk_tokens):
+        """
+        Packs time-ordered lines greedily into chunks of at most `chunk_tokens`.
+        Chunks are filled from the start of the day, so earlier chunks stay identical
+        as new messages arrive and their cached summaries keep matching.
+        """
+        chunks, current, current_tokens = [], [], 0
+        for line in lines:
+            line_tokens = count_tokens(line) + 1
+            if current and current_tokens + line_tokens > chunk_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _summarize_chunk(self, chunk_text):
+        response = self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=[
+                {"role": "system", "content": self._get_chunk_summary_system_prompt()},
+                {"role": "user", "content": chunk_text}
+            ],
+            max_tokens=Config.SUMMARY_CHUNK_SUMMARY_TOKENS,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+
+    def summarize_chunks(self, chunks, summary_date):
+        """
+        Map step: returns one summary per chunk (list of lines), in order. Chunk summaries cached
+        earlier (summary_chunk_cache) are reused; the rest are requested concurrently.
+        """
+        chunk_texts = ["\n".join(chunk) for chunk in chunks]
+        chunk_keys = [
+            hashlib.sha256(json.dumps(["gpt-4.1-nano", self._get_chunk_summary_system_prompt(), text], ensure_ascii=False).encode("utf-8")).hexdigest()
+            for text in chunk_texts
+        ]
+        summaries = db_manager.get_cached_chunk_summaries(chunk_keys)
+        missing = [i for i, key in enumerate(chunk_keys) if key not in summaries]
+        logging.info(f"[{datetime.now()}] OpenAI: Summarizing {len(chunks)} chunk(s), {len(chunks) - len(missing)} reused from cache.")
+
+        if missing:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(missing), Config.SUMMARY_MAX_PARALLEL_CHUNKS)) as executor:
+                futures = {executor.submit(self._summarize_chunk, chunk_texts[i]): i for i in missing}
+                for future in concurrent.futures.as_completed(futures):
+                    i = futures[future]
+                    summaries[chunk_keys[i]] = future.result()
+                    db_manager.save_chunk_summary(chunk_keys[i], summary_date, summaries[chunk_keys[i]])
+        return [summaries[key] for key in chunk_keys]
+
+    def _map_reduce_inputs(self, lines, summary_date):
+        """Summarizes chunks (and, for very long days, summaries of summaries) until the rest fits into one request."""
+        level = 0
+        while sum(count_tokens(line) + 1 for line in lines) > Config.SUMMARY_CHUNK_TOKENS:
+            level += 1
+            chunks = self._split_summary_chunks(lines, Config.SUMMARY_CHUNK_TOKENS)
+            logging.info(f"[{datetime.now()}] OpenAI: Summary level {level}: {len(lines)} entries in {len(chunks)} chunk(s).")
+            lines = self.summarize_chunks(chunks, summary_date)
+            if len(chunks) == 1:
+                break
+        return lines
+
+    def generate_summary(self, messages_data, summary_date=None):
+        """
+        Generates a summary from a list of messages using OpenAI.
+        Large days are token-counted, split into time-ordered chunks that are summarized concurrently,
+        and the partial summaries are reduced into the final digest (max 300 tokens).
+        """
         if not messages_data:
             return "No messages available for summary."
+        summary_date = summary_date or datetime.utcnow().date()
 
         random_role_for_summary = random.choice(self.expert_roles)
         summary_system_prompt = self._get_summary_system_prompt(random_role_for_summary)
 
-        messages_for_openai = [{"role": "system", "content": summary_system_prompt}]
-        for user, msg in messages_data:
-            messages_for_openai.append({"role": "user", "content": f"{user if user else 'Unknown user'}: {msg}"})
-
-        logging.info(f"[{datetime.now()}] OpenAI: Sending request for summary with role: {random_role_for_summary}...")
+        lines = [
+            f"{user if user else 'Unknown user'}: {truncate_to_tokens(msg, Config.SUMMARY_MAX_MESSAGE_TOKENS)}"
+            for user, msg in messages_data
+        ]
         try:
+            total_tokens = sum(count_tokens(line) + 1 for line in lines)
+            if total_tokens <= Config.SUMMARY_CHUNK_TOKENS:
+                messages_for_openai = [{"role": "system", "content": summary_system_prompt}]
+                messages_for_openai += [{"role": "user", "content": line} for line in lines]
+            else:
+                logging.info(f"[{datetime.now()}] OpenAI: {len(lines)} messages (~{total_tokens} tokens) exceed one request, using map-reduce summary.")
+                partial_summaries = self._map_reduce_inputs(lines, summary_date)
+                messages_for_openai = [
+                    {"role": "system", "content": summary_system_prompt},
+                    {"role": "user", "content": "Нижче — стислі перекази послідовних частин сьогоднішнього чату. Об'єднай їх в один огляд дня.\n\n" + "\n\n".join(partial_summaries)}
+                ]
+
+            logging.info(f"[{datetime.now()}] OpenAI: Sending request for summary with role: {random_role_for_summary}...")
             response = self.client.chat.completions.create(
                 model="gpt-4.1-nano",
                 messages=messages_for_openai,
@@ -838,10 +3027,69 @@ class OpenAIService:
             logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during summary generation: {e}", exc_info=True)
             return f"Unexpected error creating summary: {e}"
 
-    def get_expert_answer(self, chat_id, current_query_text):
-        """Generates an expert answer with conversation context using OpenAI, with a random role."""
-        logging.info(f"[{datetime.now()}] OpenAI: Generating expert answer for chat {chat_id}: '{current_query_text[:50]}...'")
+    def fold_into_running_summary(self, running_summary, lines, summary_date):
+        """
+        Returns an updated running summary of the day: `running_summary` (may be None) extended with
+        the new message `lines`. A delta larger than one chunk is condensed with the map step first.
+        Errors are raised to the caller.
+        """
+        lines = [truncate_to_tokens(line, Config.SUMMARY_MAX_MESSAGE_TOKENS) for line in lines]
+        lines = self._map_reduce_inputs(lines, summary_date)
+        system_prompt = f"""
+Ти ведеш поточний стислий підсумок групового чату за сьогодні.
+Тобі дано попередній підсумок (може бути порожнім) і нові повідомлення (або стислі перекази нових частин) у хронологічному порядку.
+Поверни оновлений підсумок дня цілком:
+- збережи важливе з попереднього підсумку, додай нові теми, рішення та висновки;
+- зберігай username або імена учасників ключових обговорень;
+- ігноруй привітання, флуд та меми;
+- без вступу, не більше {Config.ROLLING_SUMMARY_TOKENS} токенів.
+""".strip()
+        user_content = f"Попередній підсумок:\n{running_summary or '(ще немає)'}\n\nНові повідомлення:\n" + "\n".join(lines)
+        response = self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            max_tokens=Config.ROLLING_SUMMARY_TOKENS,
+            temperature=0.3
+        )
+        return response.choices[0].message.content
+
+    def generate_summary_from_running(self, running_summary, new_lines=(), summary_date=None):
+        """
+        Final role-flavoured digest (max 300 tokens) from the stored running summary (may be None)
+        plus the message `new_lines` not folded into it yet, in a single request.
+        """
+        random_role_for_summary = random.choice(self.expert_roles)
+        user_content = "Нижче — поточний підсумок сьогоднішнього чату. Сформуй з нього огляд дня.\n\n" + (running_summary or "(ще немає)")
+        if new_lines:
+            new_lines = [truncate_to_tokens(line, Config.SUMMARY_MAX_MESSAGE_TOKENS) for line in new_lines]
+            new_lines = self._map_reduce_inputs(new_lines, summary_date) # Only splits if the delta exceeds one chunk
+            user_content += "\n\nПовідомлення після цього підсумку (врахуй їх теж):\n" + "\n".join(new_lines)
+        logging.info(f"[{datetime.now()}] OpenAI: Sending request for summary from running summary with role: {random_role_for_summary}...")
+        try:
+            response = self.client.chat.completions.create(
+                model="gpt-4.1-nano",
+                messages=[
+                    {"role": "system", "content": self._get_summary_system_prompt(random_role_for_summary)},
+                    {"role": "user", "content": user_content}
+                ],
+                max_tokens=300,
+                temperature=0.8
+            )
+            summary = response.choices[0].message.content
+            logging.info(f"[{datetime.now()}] OpenAI: Summary successfully generated.")
+            return summary
+        except openai.APIError as e:
+            logging.error(f"[{datetime.now()}] OpenAI: API Error during summary generation: {e}", exc_info=True)
+            return f"Error generating summary: {e}"
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during summary generation: {e}", exc_info=True)
+            return f"Unexpected error creating summary: {e}"
 
+    def _build_expert_messages(self, raw_history, current_query_text):
+        """Builds the chat request for an expert answer: random role prompt, conversation history, query."""
         random_role_prompt = random.choice(self.expert_roles)
 
         dynamic_expert_system_prompt = f"""
@@ -853,13 +3101,19 @@ class OpenAIService:
 """
         dynamic_expert_system_prompt = dynamic_expert_system_prompt.strip()
 
-        raw_history = db_manager.get_recent_messages_for_context(chat_id, limit=10)
         messages_for_openai = [{"role": "system", "content": dynamic_expert_system_prompt}]
         for msg_entry in raw_history:
             messages_for_openai.append({"role": msg_entry["role"], "content": msg_entry["content"]})
 
-
         messages_for_openai.append({"role": "user", "content": current_query_text})
+        return messages_for_openai
+
+    def get_expert_answer(self, chat_id, current_query_text, reply_to_message_id=None, current_message_id=None):
+        """Generates an expert answer with conversation context using OpenAI, with a random role."""
+        logging.info(f"[{datetime.now()}] OpenAI: Generating expert answer for chat {chat_id}: '{current_query_text[:50]}...'")
+
+        raw_history = conversation_context.build(chat_id, reply_to_message_id=reply_to_message_id, exclude_message_id=current_message_id)
+        messages_for_openai = self._build_expert_messages(raw_history, current_query_text)
 
         try:
             response = self.client.chat.completions.create(
@@ -871,28 +3125,66 @@ class OpenAIService:
             expert_answer = response.choices[0].message.content
             logging.info(f"[{datetime.now()}] OpenAI: Expert answer successfully generated.")
             return expert_answer
-        except openai.APIError as e:
+        except Exception as e:
+            return self.expert_answer_error_text(e)
+
+    def stream_expert_answer(self, chat_id, current_query_text, reply_to_message_id=None, current_message_id=None):
+        """
+        Same request as get_expert_answer, but yields the answer in text chunks as tokens arrive.
+        Errors are raised to the caller (see expert_answer_error_text).
+        """
+        logging.info(f"[{datetime.now()}] OpenAI: Streaming expert answer for chat {chat_id}: '{current_query_text[:50]}...'")
+
+        raw_history = conversation_context.build(chat_id, reply_to_message_id=reply_to_message_id, exclude_message_id=current_message_id)
+        messages_for_openai = self._build_expert_messages(raw_history, current_query_text)
+
+        stream = self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=messages_for_openai,
+            max_tokens=180,
+            temperature=0.8,
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        logging.info(f"[{datetime.now()}] OpenAI: Expert answer stream finished.")
+
+    def expert_answer_error_text(self, e):
+        """Logs a failed expert answer and returns the text shown in chat instead."""
+        if isinstance(e, openai.APIError):
             logging.error(f"[{datetime.now()}] OpenAI: API Error during expert answer generation: {e}", exc_info=True)
             return f"Expert on break. Questions too complex. Reason: {e}. Try simplifying, if you can."
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during expert answer generation: {e}", exc_info=True)
-            return f"Something went wrong getting expert opinion. Perhaps your question was too silly for me. Reason: {e}."
+        logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during expert answer generation: {e}", exc_info=True)
+        return f"Something went wrong getting expert opinion. Perhaps your question was too silly for me. Reason: {e}."
+
+    def _request_translation(self, text, target_language):
+        response = self.client.chat.completions.create(
+            model=self.translation_model,
+            messages=[
+                {"role": "system", "content": self.translator_system_prompt(target_language)},
+                {"role": "user", "content": text}
+            ],
+            max_tokens=500
+        )
+        translated_text = response.choices[0].message.content
+        logging.info(f"[{datetime.now()}] OpenAI: Text successfully translated.")
+        return translated_text
 
     def translate_text(self, text, target_language="українську"):
-        """Translates text to the specified language using OpenAI API."""
+        """
+        Translates text to the specified language using OpenAI API.
+        Repeated texts are served from the translation cache; errors are never cached.
+        """
         logging.info(f"[{datetime.now()}] OpenAI: Attempting to translate text: '{text[:50]}...' to {target_language}")
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-nano",
-                messages=[
-                    {"role": "system", "content": self.translator_system_prompt(target_language)},
-                    {"role": "user", "content": text}
-                ],
-                max_tokens=500
+            if not self.translation_cache:
+                return self._request_translation(text, target_language)
+            cache_key = TranslationCache.make_key(self.translation_model, self.translator_system_prompt(target_language), text)
+            return self.translation_cache.get_or_compute(
+                cache_key, target_language, self.translation_model,
+                lambda: self._request_translation(text, target_language)
             )
-            translated_text = response.choices[0].message.content
-            logging.info(f"[{datetime.now()}] OpenAI: Text successfully translated.")
-            return translated_text
         except openai.APIError as e:
             logging.error(f"[{datetime.now()}] OpenAI: API Error during translation: {e}", exc_info=True)
             return f"Failed to translate text due to an error: {e}"
@@ -939,19 +3231,308 @@ class OpenAIService:
             fact = response.choices[0].message.content
             logging.info(f"[{datetime.now()}] OpenAI: Ukrainian historical fact successfully generated.")
             return fact
-        except openai.APIError as e:
-            logging.error(f"[{datetime.now()}] OpenAI: API Error during Ukrainian historical fact generation: {e}", exc_info=True)
-            return f"Вибачте, не вдалося згенерувати історичний факт: {e}"
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during Ukrainian historical fact generation: {e}", exc_info=True)
-            return f"Виникла несподівана помилка при генерації історичного факту: {e}"
+        except openai.APIError as e:
+            logging.error(f"[{datetime.now()}] OpenAI: API Error during Ukrainian historical fact generation: {e}", exc_info=True)
+            return f"Вибачте, не вдалося згенерувати історичний факт: {e}"
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] OpenAI: Unexpected error during Ukrainian historical fact generation: {e}", exc_info=True)
+            return f"Виникла несподівана помилка при генерації історичного факту: {e}"
+
+    def generate_fact_batch(self, kind, count):
+        """
+        Generates `count` distinct facts of the given kind ("random" or "ukrainian_history") in one request.
+        Returns a list of fact texts; raises on API errors so that nothing is pooled from an error message.
+        """
+        system_prompt = {"random": self.random_fact_prompt, "ukrainian_history": self.ukrainian_history_fact_prompt}[kind]
+        sentences = "1-2 речення" if kind == "random" else "2-3 речення"
+        logging.info(f"[{datetime.now()}] OpenAI: Generating a batch of {count} '{kind}' facts...")
+        response = self.client.chat.completions.create(
+            model="gpt-4.1-nano",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": (
+                    f"Надай {count} різних цікавих фактів ({sentences} кожен) на різні теми, без повторів. "
+                    'Відповідь дай у форматі JSON: {"facts": ["факт 1", "факт 2", ...]}'
+                )}
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=(100 if kind == "random" else 150) * count,
+            temperature=0.9
+        )
+        facts = json.loads(response.choices[0].message.content).get("facts", [])
+        facts = [fact.strip() for fact in facts if isinstance(fact, str) and fact.strip()]
+        logging.info(f"[{datetime.now()}] OpenAI: Received {len(facts)} '{kind}' facts.")
+        return facts
+
+
+# Instantiate OpenAIService
+openai_service = OpenAIService(openai_client, translation_cache)
+
+
+# === Fact Pool ===
+def normalize_fact_text(text):
+    """Lowercase, punctuation removed, whitespace collapsed: the form facts are compared in."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class FactPool:
+    """
+    Scheduled facts are taken from the fact_pool table instead of being generated at send time.
+    refill() tops the pool up with one batched request and drops facts that are too similar
+    (character trigram Jaccard >= `similarity_threshold`) to anything pooled or sent before.
+    Generation errors are raised, never turned into fact text.
+    """
+    KINDS = ("random", "ukrainian_history")
+
+    def __init__(self, db, ai_service, batch_size=20, min_available=8, similarity_threshold=0.6, live_batch_size=3):
+        self.db = db
+        self.ai_service = ai_service
+        self.batch_size = batch_size
+        self.min_available = min_available
+        self.similarity_threshold = similarity_threshold
+        self.live_batch_size = live_batch_size
+
+    @staticmethod
+    def _trigrams(normalized):
+        padded = f" {normalized} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _is_duplicate(self, trigrams, known):
+        for other in known:
+            union = len(trigrams | other)
+            if union and len(trigrams & other) / union >= self.similarity_threshold:
+                return True
+        return False
+
+    def _new_facts(self, candidates, known_texts):
+        """(fact, normalized) pairs of the candidates that are not too similar to known texts or to each other."""
+        known = [self._trigrams(text) for text in known_texts]
+        new_facts = []
+        for fact in candidates:
+            normalized = normalize_fact_text(fact)
+            trigrams = self._trigrams(normalized)
+            if not normalized or self._is_duplicate(trigrams, known):
+                continue
+            known.append(trigrams)
+            new_facts.append((fact, normalized))
+        return new_facts
+
+    def refill(self, kind):
+        """
+        Generates a batch if fewer than `min_available` facts are left. Returns how many facts were added.
+        Generation errors are raised, so the refill job fails and is retried by the job queue.
+        """
+        known_texts, available = self.db.get_fact_pool_status(kind)
+        if available >= self.min_available:
+            logging.info(f"[{datetime.now()}] FactPool: '{kind}' has {available} fact(s) available, no refill needed.")
+            return 0
+
+        candidates = self.ai_service.generate_fact_batch(kind, self.batch_size)
+        added = self.db.add_pool_facts(kind, self._new_facts(candidates, known_texts))
+        logging.info(f"[{datetime.now()}] FactPool: '{kind}' refilled with {added} of {len(candidates)} generated fact(s) ({available} were left).")
+        return added
+
+    def take(self, kind):
+        """
+        Returns the next unsent fact. If the pool is empty, a small batch is generated live and pooled,
+        so the fact sent now is recorded for deduplication; generation errors are raised.
+        """
+        fact = self.db.pop_pool_fact(kind)
+        if fact is not None:
+            return fact
+        logging.warning(f"[{datetime.now()}] FactPool: '{kind}' pool is empty, generating facts live.")
+        candidates = self.ai_service.generate_fact_batch(kind, self.live_batch_size)
+        if not candidates:
+            raise RuntimeError(f"No '{kind}' fact was generated")
+        known_texts, _ = self.db.get_fact_pool_status(kind)
+        self.db.add_pool_facts(kind, self._new_facts(candidates, known_texts))
+        fact = self.db.pop_pool_fact(kind)
+        if fact is None: # Every candidate repeated a known fact, or the DB is unavailable: still answer
+            logging.warning(f"[{datetime.now()}] FactPool: Could not pool a new '{kind}' fact, sending an unrecorded one.")
+            return candidates[0]
+        return fact
+
+fact_pool = FactPool(
+    db_manager, openai_service,
+    batch_size=Config.FACT_POOL_BATCH_SIZE,
+    min_available=Config.FACT_POOL_MIN_AVAILABLE,
+    similarity_threshold=Config.FACT_POOL_SIMILARITY_THRESHOLD
+)
+
+
+# === Rolling Summaries ===
+class RollingSummarizer:
+    """
+    Keeps a running summary per chat and UTC day in rolling_summaries. New messages are folded in
+    every `every_n_messages` by the scheduler, so the daily summary only pays for the delta.
+    Only rows inserted at least `settle_seconds` ago are folded into the stored summary.
+    """
+    def __init__(self, db, ai_service, every_n_messages=50, settle_seconds=60):
+        self.db = db
+        self.ai_service = ai_service
+        self.every_n_messages = every_n_messages
+        self.settle_seconds = settle_seconds
+        self._chat_locks = {}
+        self._chat_locks_lock = threading.Lock()
+
+    def _chat_lock(self, chat_id):
+        with self._chat_locks_lock:
+            return self._chat_locks.setdefault(chat_id, threading.Lock())
+
+    def update_chat(self, chat_id, summary_date=None, min_new_messages=1):
+        """
+        Folds the chat's unsummarized messages into its running summary if there are at least
+        `min_new_messages` of them. Returns the current running summary text (None if the day is empty).
+        """
+        summary_date = summary_date or datetime.utcnow().date()
+        with self._chat_lock(chat_id):
+            stored = self.db.get_rolling_summary(chat_id, summary_date)
+            last_message_id = stored["last_message_id"] if stored else 0
+            new_rows = self.db.get_messages_after(chat_id, summary_date, last_message_id, self.settle_seconds)
+            if len(new_rows) < min_new_messages:
+                return stored["summary_text"] if stored else None
+
+            lines = [f"{username if username else 'Unknown user'}: {message}" for _, username, message in new_rows]
+            logging.info(f"[{datetime.now()}] RollingSummary: Folding {len(lines)} new message(s) into chat {chat_id} summary for {summary_date}.")
+            summary_text = self.ai_service.fold_into_running_summary(stored["summary_text"] if stored else None, lines, summary_date)
+            saved = self.db.save_rolling_summary(
+                chat_id, summary_date, summary_text,
+                last_message_id=new_rows[-1][0],
+                messages_folded=(stored["messages_folded"] if stored else 0) + len(new_rows),
+                expected_last_message_id=last_message_id if stored else None
+            )
+            if not saved:
+                # Another process folded the same messages first; use its result
+                stored = self.db.get_rolling_summary(chat_id, summary_date)
+                return stored["summary_text"] if stored else summary_text
+            return summary_text
+
+    def run_pending(self, summary_date=None):
+        """Folds every chat that has accumulated at least `every_n_messages` new messages today."""
+        summary_date = summary_date or datetime.utcnow().date()
+        for chat_id in self.db.get_chats_with_unsummarized_messages(summary_date, self.every_n_messages, self.settle_seconds):
+            try:
+                self.update_chat(chat_id, summary_date, min_new_messages=self.every_n_messages)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] RollingSummary: Failed to update chat {chat_id}: {e}", exc_info=True)
+
+    def daily_summary(self, chat_id, summary_date=None):
+        """
+        Final digest for the chat's day in one request: the stored running summary plus the messages not
+        folded into it yet. Nothing is folded or stored here; that is left to run_pending.
+        """
+        summary_date = summary_date or datetime.utcnow().date()
+        stored = self.db.get_rolling_summary(chat_id, summary_date)
+        new_rows = self.db.get_messages_after(chat_id, summary_date, stored["last_message_id"] if stored else 0)
+        if not stored and not new_rows:
+            return "No messages available for summary."
+        lines = [f"{username if username else 'Unknown user'}: {message}" for _, username, message in new_rows]
+        return self.ai_service.generate_summary_from_running(stored["summary_text"] if stored else None, lines, summary_date)
 
+rolling_summarizer = RollingSummarizer(db_manager, openai_service, Config.ROLLING_SUMMARY_EVERY_N_MESSAGES, Config.ROLLING_SUMMARY_SETTLE_SECONDS)
 
-# Instantiate OpenAIService
-openai_service = OpenAIService(openai_client)
+
+# === Shared HTTP Client ===
+class JitteredRetry(Retry):
+    """
+    urllib3 Retry with full jitter: sleeps a random time between 0 and the exponential backoff.
+    A server's Retry-After is honoured up to `max_retry_after` seconds, since the caller holds a
+    per-host slot while it sleeps and a long wait would stall every other request to that host.
+    """
+    def __init__(self, *args, max_retry_after=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kwargs):
+        # urllib3 copies the Retry on every attempt and only knows its own parameters
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+    def sleep_for_retry(self, response=None):
+        retry_after = self.get_retry_after(response) if response is not None else None
+        if retry_after:
+            time.sleep(min(retry_after, self.max_retry_after))
+            return True
+        return False
+
+class HttpClient:
+    """
+    One requests.Session for all outbound HTTP in this process: keep-alive connection pools
+    per host, retries with jittered exponential backoff on connection errors and 429/5xx,
+    gzip/deflate compression, and at most `max_concurrency_per_host` requests in flight per host.
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, pool_connections=20, pool_maxsize=10, max_retries=3, backoff_factor=0.5, max_concurrency_per_host=4, max_retry_after_seconds=10):
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.session = requests.Session()
+        retry = JitteredRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUS_CODES,
+            raise_on_status=False, # Hand the last response back to the caller's raise_for_status()
+            respect_retry_after_header=True,
+            max_retry_after=max_retry_after_seconds
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+        self._host_semaphores = {}
+        self._host_semaphores_lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._host_semaphores_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.max_concurrency_per_host)
+                self._host_semaphores[host] = semaphore
+            return semaphore
+
+    def request(self, method, url, **kwargs):
+        """Sends a request and returns the fully read response."""
+        with self._host_semaphore(url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @contextlib.contextmanager
+    def stream(self, method, url, **kwargs):
+        """Streaming request; the host slot and the pooled connection are held until the block exits."""
+        with self._host_semaphore(url):
+            response = self.session.request(method, url, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+
+http_client = HttpClient(
+    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+    pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+    max_retries=Config.HTTP_MAX_RETRIES,
+    backoff_factor=Config.HTTP_BACKOFF_FACTOR,
+    max_concurrency_per_host=Config.HTTP_MAX_CONCURRENCY_PER_HOST,
+    max_retry_after_seconds=Config.HTTP_MAX_RETRY_AFTER_SECONDS
+)
 
 
 # === Social Downloader Class ===
+class VideoTooLargeError(Exception):
+    """Raised when a video exceeds the upload limit; size_bytes is None if the download was cut off before the end."""
+    def __init__(self, size_bytes=None):
+        super().__init__(f"Video is larger than the allowed size ({size_bytes} bytes)")
+        self.size_bytes = size_bytes
+
+
 class SocialDownloader:
     def __init__(self, rapidapi_key, rapidapi_host):
         self.api_url = "https://social-download-all-in-one.p.rapidapi.com/v1/social/autolink"
@@ -962,49 +3543,82 @@ class SocialDownloader:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
         }
 
+    def select_video_url(self, url, data):
+        """Picks the best video URL for the source platform from a RapidAPI response."""
+        if "medias" in data and len(data["medias"]) > 0:
+            best_video_url = None
+            any_video_url = None
+
+            for media in data["medias"]:
+                if media.get("type") == "video":
+                    if any_video_url is None:
+                        any_video_url = media["url"]
+
+                    quality = str(media.get("quality", "")).lower()
+
+                    if "tiktok" in url.lower():
+                        if "hd_no_watermark" in quality: return media["url"]
+                        elif "no_watermark" in quality: best_video_url = media["url"]
+                    elif "instagram" in url.lower():
+                        if "p" in quality: return media["url"]
+                        elif "hd" in quality or "high" in quality: return media["url"]
+                    elif "facebook" in url.lower():
+                        if "hd" in quality: return media["url"]
+
+                    if "hd" in quality or "high" in quality: best_video_url = media["url"]
+                    elif "sd" in quality or "medium" in quality:
+                        if best_video_url is None: best_video_url = media["url"]
+
+            if best_video_url:
+                logging.info(f"[{datetime.now()}] SocialDownloader: Found preferred quality video URL: {best_video_url}")
+                return best_video_url
+            elif any_video_url:
+                logging.info(f"[{datetime.now()}] SocialDownloader: No preferred quality, using first available video URL: {any_video_url}")
+                return any_video_url
+        else:
+            logging.warning(f"[{datetime.now()}] SocialDownloader: RapidAPI returned media, but no video URL found.")
+            return "Could not find video link."
+
+    def fetch_video_file(self, video_url, max_bytes, chunk_size=1024 * 1024):
+        """
+        Streams a resolved video URL into a temporary file on disk.
+        Rejects the video from Content-Length before downloading, and stops as soon as
+        `max_bytes` is crossed when the size is not announced. Raises VideoTooLargeError.
+        The caller must close the returned file (it is deleted on close).
+        """
+        with http_client.stream("GET", video_url, timeout=60) as video_resp:
+            video_resp.raise_for_status()
+            content_length = video_resp.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise VideoTooLargeError(int(content_length))
+
+            video_file = tempfile.NamedTemporaryFile(prefix="video-", suffix=".mp4")
+            try:
+                downloaded = 0
+                for chunk in video_resp.iter_content(chunk_size=chunk_size):
+                    downloaded += len(chunk)
+                    if downloaded > max_bytes:
+                        raise VideoTooLargeError()
+                    video_file.write(chunk)
+                video_file.flush()
+                video_file.seek(0)
+                logging.info(f"[{datetime.now()}] SocialDownloader: Video downloaded to temp file ({downloaded / (1024 * 1024):.2f} MB).")
+                return video_file
+            except BaseException:
+                video_file.close()
+                raise
+
     def download_video(self, url):
         """Downloads a social media video from the given URL using RapidAPI."""
         logging.info(f"[{datetime.now()}] SocialDownloader: Attempting to download video from URL: {url}")
         payload = {"url": url}
         try:
-            response = requests.post(self.api_url, json=payload, headers=self.headers, timeout=60)
+            response = http_client.post(self.api_url, json=payload, headers=self.headers, timeout=60)
             response.raise_for_status()
             data = response.json()
             logging.info(f"[{datetime.now()}] SocialDownloader: RapidAPI response received.")
 
-            if "medias" in data and len(data["medias"]) > 0:
-                best_video_url = None
-                any_video_url = None
-
-                for media in data["medias"]:
-                    if media.get("type") == "video":
-                        if any_video_url is None:
-                            any_video_url = media["url"]
-
-                        quality = str(media.get("quality", "")).lower()
-
-                        if "tiktok" in url.lower():
-                            if "hd_no_watermark" in quality: return media["url"]
-                            elif "no_watermark" in quality: best_video_url = media["url"]
-                        elif "instagram" in url.lower():
-                            if "p" in quality: return media["url"]
-                            elif "hd" in quality or "high" in quality: return media["url"]
-                        elif "facebook" in url.lower():
-                            if "hd" in quality: return media["url"]
-
-                        if "hd" in quality or "high" in quality: best_video_url = media["url"]
-                        elif "sd" in quality or "medium" in quality:
-                            if best_video_url is None: best_video_url = media["url"]
-
-                if best_video_url:
-                    logging.info(f"[{datetime.now()}] SocialDownloader: Found preferred quality video URL: {best_video_url}")
-                    return best_video_url
-                elif any_video_url:
-                    logging.info(f"[{datetime.now()}] SocialDownloader: No preferred quality, using first available video URL: {any_video_url}")
-                    return any_video_url
-            else:
-                logging.warning(f"[{datetime.now()}] SocialDownloader: RapidAPI returned media, but no video URL found.")
-                return "Could not find video link."
+            return self.select_video_url(url, data)
         except requests.exceptions.HTTPError as e:
             logging.error(f"[{datetime.now()}] SocialDownloader: HTTP Error from RapidAPI: {e.response.status_code} - {e.response.text}", exc_info=True)
             if e.response.status_code == 404: return "Video not found or private."
@@ -1024,120 +3638,323 @@ class SocialDownloader:
 social_downloader = SocialDownloader(Config.RAPIDAPI_KEY, Config.RAPIDAPI_HOST)
 
 
+# === Social Video Cache ===
+# Query parameters that identify the video itself; everything else (utm_*, igsh, si, ...) is tracking noise
+SOCIAL_URL_KEPT_PARAMS = {"v", "id", "story_fbid"}
+
+def normalize_social_url(url):
+    """Canonical form of a social media link used as the cache key."""
+    parsed = urllib.parse.urlsplit(url.strip())
+    host = (parsed.hostname or "").lower()
+    for prefix in ("www.", "m.", "mobile.", "web."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    path = parsed.path.rstrip("/") or "/"
+    query = urllib.parse.urlencode(sorted(
+        (key, value) for key, value in urllib.parse.parse_qsl(parsed.query) if key in SOCIAL_URL_KEPT_PARAMS
+    ))
+    return urllib.parse.urlunsplit(("https", host, path, query, ""))
+
+class SocialVideoCache:
+    """
+    Two-level cache (in-process LRU over the social_video_cache table) for social links:
+    the Telegram file_id of an already uploaded video, and the RapidAPI-resolved media URL with a TTL.
+    Only entries with a file_id are kept in memory; misses go back to the table, where another process
+    (async app, another worker) may have stored the upload since.
+    """
+    def __init__(self, db, resolved_url_ttl_seconds=3600, max_memory_entries=1000):
+        self.db = db
+        self.resolved_url_ttl = timedelta(seconds=resolved_url_ttl_seconds)
+        self.max_memory_entries = max_memory_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, source_url):
+        with self._lock:
+            entry = self._entries.get(source_url)
+            if entry is not None:
+                self._entries.move_to_end(source_url)
+                return entry
+        entry = self.db.get_social_video_cache_entry(source_url) or {}
+        self._remember(source_url, entry)
+        return entry
+
+    def _remember(self, source_url, entry):
+        with self._lock:
+            if not entry.get("telegram_file_id"):
+                self._entries.pop(source_url, None)
+                return
+            self._entries[source_url] = entry
+            self._entries.move_to_end(source_url)
+            while len(self._entries) > self.max_memory_entries:
+                self._entries.popitem(last=False)
+
+    def get_file_id(self, source_url):
+        return self._lookup(source_url).get("telegram_file_id")
+
+    def get_resolved_url(self, source_url):
+        entry = self._lookup(source_url)
+        resolved_at = entry.get("resolved_at")
+        if entry.get("resolved_url") and resolved_at and datetime.now(timezone.utc) - resolved_at < self.resolved_url_ttl:
+            return entry["resolved_url"]
+        return None
+
+    def store(self, source_url, resolved_url=None, telegram_file_id=None):
+        entry = dict(self._lookup(source_url))
+        if resolved_url:
+            entry["resolved_url"] = resolved_url
+            entry["resolved_at"] = datetime.now(timezone.utc)
+        if telegram_file_id:
+            entry["telegram_file_id"] = telegram_file_id
+        self._remember(source_url, entry)
+        self.db.save_social_video_cache_entry(source_url, resolved_url=resolved_url, telegram_file_id=telegram_file_id)
+
+    def invalidate(self, source_url, resolved_url=False, telegram_file_id=False):
+        entry = dict(self._lookup(source_url))
+        if resolved_url:
+            entry.pop("resolved_url", None)
+            entry.pop("resolved_at", None)
+        if telegram_file_id:
+            entry.pop("telegram_file_id", None)
+        self._remember(source_url, entry)
+        self.db.invalidate_social_video_cache_entry(source_url, resolved_url=resolved_url, telegram_file_id=telegram_file_id)
+
+social_video_cache = SocialVideoCache(db_manager, Config.VIDEO_RESOLVED_URL_TTL_SECONDS, Config.VIDEO_CACHE_MEMORY_ENTRIES)
+
+
 # === News and Weather Service Class ===
+html_extractor = HtmlExtractor(get_html_backend(Config.HTML_PARSER_BACKEND))
+logging.info(f"[{datetime.now()}] NewsWeather: Using '{html_extractor.backend.name}' HTML parser backend.")
+
 class NewsWeatherService:
-    def get_weather_meteo(self, city_url):
-        """Fetches weather from meteo.ua for a given city URL."""
+    """
+    Scrapers for the morning report. Every source is cached with its own TTL; a failed
+    or slow fetch falls back to the last good value instead of "N/A".
+    """
+    WEATHER_CITIES = {
+        "Київ": "https://meteo.ua/ua/34/kiev",
+        "Рівне": "https://meteo.ua/ua/28/rovno",
+        "Косів": "https://meteo.ua/ua/16532/kosov",
+        "Одеса": "https://meteo.ua/ua/111/odessa"
+    }
+
+    def __init__(self, max_workers=8):
+        self._cache = {} # key -> (value, fetched_at monotonic)
+        self._cache_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-source")
+
+    def _last_good(self, key):
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        return cached[0] if cached else None
+
+    def _cached(self, key, ttl_seconds, fetch):
+        """Returns a fresh cached value, else fetches; on failure (None) returns the last good value, if any."""
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[1] < ttl_seconds:
+            return cached[0]
+
+        value = fetch()
+        if value is not None:
+            with self._cache_lock:
+                self._cache[key] = (value, time.monotonic())
+            return value
+        if cached:
+            logging.warning(f"[{datetime.now()}] NewsWeather: Source '{key}' failed, using last good value from {time.monotonic() - cached[1]:.0f}s ago.")
+            return cached[0]
+        return None
+
+    def _gather(self, tasks, timeout_seconds):
+        """
+        Runs {name: (cache_key, func, default)} concurrently and returns {name: value}.
+        A source that is still running after `timeout_seconds` is answered from its last good value;
+        it keeps running in the background and refreshes the cache for the next report.
+        """
+        futures = {name: self._executor.submit(func) for name, (cache_key, func, default) in tasks.items()}
+        deadline = time.monotonic() + timeout_seconds
+        results = {}
+        for name, future in futures.items():
+            cache_key, func, default = tasks[name]
+            try:
+                results[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except concurrent.futures.TimeoutError:
+                logging.warning(f"[{datetime.now()}] NewsWeather: Source '{cache_key}' is too slow, using last good value.")
+                results[name] = self._last_good(cache_key) or default
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] NewsWeather: Source '{cache_key}' failed: {e}", exc_info=True)
+                results[name] = self._last_good(cache_key) or default
+        return results
+
+    def _fetch_weather_meteo(self, city_url):
         try:
-            r = requests.get(city_url, timeout=10)
-            soup = BeautifulSoup(r.content, "html.parser")
-            temp = soup.find(class_="menu-basic__degree")
-            return temp.get_text(strip=True) if temp else "N/A"
+            r = http_client.get(city_url, timeout=10)
+            return html_extractor.weather_degree(r.content)
         except requests.exceptions.RequestException as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Error getting weather for {city_url}: {e}", exc_info=True)
-            return "N/A"
+            return None
         except Exception as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Unexpected error in get_weather_meteo: {e}", exc_info=True)
-            return "N/A"
+            return None
 
-    def get_daily_weather_report(self):
-        """Generates a daily weather report for predefined cities."""
-        cities = {
-            "Київ": "https://meteo.ua/ua/34/kiev",
-            "Рівне": "https://meteo.ua/ua/28/rovno",
-            "Косів": "https://meteo.ua/ua/16532/kosov",
-            "Одеса": "https://meteo.ua/ua/111/odessa"
+    def get_weather_meteo(self, city_url):
+        """Fetches weather from meteo.ua for a given city URL."""
+        return self._cached(f"weather:{city_url}", Config.WEATHER_CACHE_TTL_SECONDS, lambda: self._fetch_weather_meteo(city_url)) or "N/A"
+
+    def _weather_tasks(self):
+        return {
+            f"weather:{city}": (f"weather:{url}", lambda url=url: self.get_weather_meteo(url), "N/A")
+            for city, url in self.WEATHER_CITIES.items()
         }
+
+    def _format_weather_report(self, results):
         msg = "\U0001F324️ Прогноз погоди на сьогодні\\:\n"
-        for city, url in cities.items():
+        for city in self.WEATHER_CITIES:
             escaped_city = escape_markdown_v2(city)
-            escaped_weather = escape_markdown_v2(self.get_weather_meteo(url))
+            escaped_weather = escape_markdown_v2(results[f"weather:{city}"])
             msg += f" \u2022 {escaped_city}\\: {escaped_weather}\n"
         return msg
 
-    def get_top3_news_pravda(self):
-        """Fetches top 3 news from pravda.ua."""
+    def get_daily_weather_report(self):
+        """Generates a daily weather report for predefined cities (fetched concurrently)."""
+        return self._format_weather_report(self._gather(self._weather_tasks(), Config.REPORT_SOURCES_TIMEOUT_SECONDS))
+
+    def _fetch_top3_news_pravda(self):
         try:
-            r = requests.get("https://www.pravda.ua/", timeout=10)
-            soup = BeautifulSoup(r.content, "html.parser")
-            block = soup.find("div", {"data-vr-zone": "Popular by views"})
-            articles = block.find_all("div", class_="article_popular", limit=3)
+            r = http_client.get("https://www.pravda.ua/", timeout=10)
+            titles = html_extractor.top_news_titles(r.content, limit=3)
+            if not titles:
+                return None
             text = "\U0001F4F0 Найбільш важливі новини за вчора\\:\n"
-            for i, a in enumerate(articles, 1):
-                title = a.find("a").get_text(strip=True)
+            for i, title in enumerate(titles, 1):
                 escaped_title = escape_markdown_v2(title)
                 text += f"{i}\\. {escaped_title}\n"
             return text
         except requests.exceptions.RequestException as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Error getting news: {e}", exc_info=True)
-            return "Новини недоступні\\."
+            return None
         except Exception as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Unexpected error in get_top3_news_pravda: {e}", exc_info=True)
-            return "Новини недоступні\\."
+            return None
 
-    def get_official_usd_rate(self):
-        """Fetches official USD rate from bank.gov.ua."""
+    def get_top3_news_pravda(self):
+        """Fetches top 3 news from pravda.ua."""
+        return self._cached("news", Config.NEWS_CACHE_TTL_SECONDS, self._fetch_top3_news_pravda) or "Новини недоступні\\."
+
+    def _fetch_official_usd_rate(self):
         try:
-            r = requests.get("https://bank.gov.ua/ua/markets/exchangerates", timeout=10)
-            soup = BeautifulSoup(r.content, "html.parser")
-            rows = soup.find_all("tr")
-            for row in rows:
-                code = row.find("td", {"data-label": "Код літерний"})
-                if code and code.get_text(strip=True) == "USD":
-                    rate = row.find("td", {"data-label": "Офіційний курс"})
-                    escaped_rate = escape_markdown_v2(rate.get_text(strip=True))
-                    return f"\U0001F4B1 Офіційний курс USD від НБУ\\: {escaped_rate} UAH"
-            return "N/A"
+            r = http_client.get("https://bank.gov.ua/ua/markets/exchangerates", timeout=10)
+            rate = html_extractor.official_rate(r.content, "USD")
+            if rate:
+                escaped_rate = escape_markdown_v2(rate)
+                return f"\U0001F4B1 Офіційний курс USD від НБУ\\: {escaped_rate} UAH"
+            return None
         except requests.exceptions.RequestException as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Error getting USD rate: {e}", exc_info=True)
-            return "N/A"
+            return None
         except Exception as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Unexpected error in get_official_usd_rate: {e}", exc_info=True)
-            return "N/A"
+            return None
 
-    def get_bitcoin_price(self):
-        """Fetches Bitcoin price from finance.ua."""
+    def get_official_usd_rate(self):
+        """Fetches official USD rate from bank.gov.ua."""
+        return self._cached("usd_rate", Config.USD_RATE_CACHE_TTL_SECONDS, self._fetch_official_usd_rate) or "N/A"
+
+    def _fetch_bitcoin_price(self):
         try:
-            r = requests.get("https://finance.ua/ua/crypto/btc", headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
-            soup = BeautifulSoup(r.content, "html.parser")
-            container = soup.find("div", class_="MainInfostyles__Price-sc-1pcfgvi-16 gfcnFW")
-            trend = soup.find("div", class_="MainInfostyles__Trend-sc-1pcfgvi-17 hwJIFp")
-            if container:
-                price = ''.join(container.stripped_strings)
-                change = trend.get_text(strip=True) if trend else ''
+            r = http_client.get("https://finance.ua/ua/crypto/btc", headers={"User-Agent": "Mozilla/5.0"}, timeout=10)
+            price_and_change = html_extractor.btc_price(r.content)
+            if price_and_change:
+                price, change = price_and_change
                 escaped_price = escape_markdown_v2(price)
                 escaped_change = escape_markdown_v2(change)
                 return f"\U0001FA99 Поточний курс бітка\\: 1 BTC \\= {escaped_price} \\({escaped_change}\\)"
-            return "N/A"
+            return None
         except requests.exceptions.RequestException as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Error getting Bitcoin price: {e}", exc_info=True)
-            return "N/A"
+            return None
         except Exception as e:
             logging.error(f"[{datetime.now()}] NewsWeather: Unexpected error in get_bitcoin_price: {e}", exc_info=True)
-            return "N/A"
+            return None
+
+    def get_bitcoin_price(self):
+        """Fetches Bitcoin price from finance.ua."""
+        return self._cached("btc_price", Config.BTC_PRICE_CACHE_TTL_SECONDS, self._fetch_bitcoin_price) or "N/A"
+
+    def get_morning_report_sources(self):
+        """Fetches every morning report source concurrently; returns {"weather", "usd_rate", "btc_price", "news"}."""
+        tasks = self._weather_tasks()
+        tasks["usd_rate"] = ("usd_rate", self.get_official_usd_rate, "N/A")
+        tasks["btc_price"] = ("btc_price", self.get_bitcoin_price, "N/A")
+        tasks["news"] = ("news", self.get_top3_news_pravda, "Новини недоступні\\.")
+        results = self._gather(tasks, Config.REPORT_SOURCES_TIMEOUT_SECONDS)
+        return {
+            "weather": self._format_weather_report(results),
+            "usd_rate": results["usd_rate"],
+            "btc_price": results["btc_price"],
+            "news": results["news"],
+        }
 
 # Instantiate NewsWeatherService
 news_weather_service = NewsWeatherService()
 
 
 # === Telegram Message Sender Class ===
+class TelegramRateLimiter:
+    """
+    Spaces outgoing messages to stay under Telegram's limits: a global rate for the whole bot and a
+    minimum interval per chat (longer for groups, chat_id < 0). Each acquire() reserves the next free
+    slot under a lock and sleeps outside it, so parallel senders queue up instead of hitting 429s.
+    The limits are per process; run one sending scheduler per bot or lower the global rate accordingly.
+    """
+    def __init__(self, global_per_second=25, private_chat_interval_seconds=1.0, group_chat_interval_seconds=3.0):
+        self.global_interval = 1.0 / global_per_second
+        self.private_chat_interval = private_chat_interval_seconds
+        self.group_chat_interval = group_chat_interval_seconds
+        self._lock = threading.Lock()
+        self._next_global = {}
+        self._next_per_chat = {}
+
+    def _reserve(self, next_slots, key, interval):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, next_slots.get(key, 0.0))
+            next_slots[key] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def acquire(self, chat_id):
+        # Wait for the chat first, so a busy chat does not hold up global slots other chats could use
+        self._reserve(self._next_per_chat, chat_id, self.group_chat_interval if int(chat_id) < 0 else self.private_chat_interval)
+        self._reserve(self._next_global, None, self.global_interval)
+
+
 class TelegramMessageSender:
-    def __init__(self, bot_instance, db_manager_instance):
+    def __init__(self, bot_instance, db_manager_instance, bot_identity_instance, rate_limiter=None):
         self.bot = bot_instance
         self.db_manager = db_manager_instance
+        self.bot_identity = bot_identity_instance
+        self.rate_limiter = rate_limiter # Set by scheduler_process for report fan-out; replies are not throttled
 
-    def send_and_save_message(self, chat_id, text, parse_mode=None, bot_message_type=None, telegram_message_id_to_reply=None, media_type=None, media_file=None):
+    def send_and_save_message(self, chat_id, text, parse_mode=None, bot_message_type=None, telegram_message_id_to_reply=None, media_type=None, media_file=None, on_sent=None, edit_message_id=None):
         """
         Sends a message (text or media) and saves its details to the database.
         The `text` parameter is expected to be correctly formatted for the given `parse_mode`.
+        `media_file` may also be a Telegram file_id; `on_sent(sent_message)` is called after a successful send.
+        With `edit_message_id` the bot's existing text message is replaced by `text` instead (streamed answers).
         """
         try:
+            if self.rate_limiter:
+                self.rate_limiter.acquire(chat_id)
             reply_parameters = None
             if telegram_message_id_to_reply:
                 reply_parameters = telebot.types.ReplyParameters(message_id=telegram_message_id_to_reply, chat_id=chat_id, allow_sending_without_reply=True)
 
             sent_message = None
-            if media_type == 'video' and media_file:
+            if edit_message_id:
+                sent_message = self.bot.edit_message_text(text, chat_id=chat_id, message_id=edit_message_id, parse_mode=parse_mode)
+            elif media_type == 'video' and media_file:
                 sent_message = self.bot.send_video(chat_id, media_file, caption=text, parse_mode=parse_mode, reply_parameters=reply_parameters)
             elif media_type == 'photo' and media_file:
                 sent_message = self.bot.send_photo(chat_id, media_file, caption=text, parse_mode=parse_mode, reply_parameters=reply_parameters)
@@ -1145,23 +3962,40 @@ class TelegramMessageSender:
                 sent_message = self.bot.send_message(chat_id, text, parse_mode=parse_mode, reply_parameters=reply_parameters)
 
             logging.info(f"[{datetime.now()}] Sender: Повідомлення надіслано до чату {chat_id}, message_id: {sent_message.message_id}, тип: {bot_message_type}")
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Sender: Помилка при відправці повідомлення: {e}", exc_info=True)
+            return None
+
+        # The message is out: bookkeeping failures are logged, but the caller still gets the message_id,
+        # since callers treat None as "not sent" and would send it again
+        try:
+            if on_sent:
+                on_sent(sent_message)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Sender: Помилка в on_sent для message_id {sent_message.message_id}: {e}", exc_info=True)
+        try:
+            # The sent message already carries the bot as its author; fall back to the cached identity
+            sent_user = sent_message.from_user or self.bot_identity.get()
+            if sent_user is None: # Channel posts carry no author and getMe failed; messages.user_id is NOT NULL
+                logging.warning(f"[{datetime.now()}] Sender: Bot identity unknown, message {sent_message.message_id} in chat {chat_id} is not saved.")
+                return sent_message.message_id
             self.db_manager.save_message(
                 telegram_message_id=sent_message.message_id,
-                user_id=self.bot.get_me().id,
-                username=self.bot.get_me().username,
+                user_id=sent_user.id,
+                username=sent_user.username,
                 message_content=text, # Save the original text/caption for internal use
                 message_date=datetime.utcnow(),
                 chat_id_to_save=chat_id,
                 is_bot_message=True,
-                bot_message_type=bot_message_type
+                bot_message_type=bot_message_type,
+                reply_to_message_id=telegram_message_id_to_reply
             )
-            return sent_message.message_id
         except Exception as e:
-            logging.error(f"[{datetime.now()}] Sender: Помилка при відправці повідомлення та збереженні ID: {e}", exc_info=True)
-            return None
+            logging.error(f"[{datetime.now()}] Sender: Помилка при збереженні надісланого повідомлення {sent_message.message_id}: {e}", exc_info=True)
+        return sent_message.message_id
 
 # Instantiate TelegramMessageSender
-telegram_sender = TelegramMessageSender(bot, db_manager)
+telegram_sender = TelegramMessageSender(bot, db_manager, bot_identity)
 
 
 # === Report Generators ===
@@ -1175,49 +4009,71 @@ def generate_morning_report_text():
     }
     day = weekday_ua.get(now.strftime("%A"), now.strftime("%A"))
     date_str = now.strftime("%d.%m.%Y")
+    sources = news_weather_service.get_morning_report_sources()
 
     report = (
         f"**Доброго ранку, шановні експерти\!**\n\n"
         f"**{escape_markdown_v2(day)} \\({escape_markdown_v2(date_str)}\\ року\\)**\n\n"
-        f"{news_weather_service.get_daily_weather_report()}\n"
-        f"{news_weather_service.get_official_usd_rate()}\n"
-        f"{news_weather_service.get_bitcoin_price()}\n\n"
-        f"{news_weather_service.get_top3_news_pravda()}\n\n"
+        f"{sources['weather']}\n"
+        f"{sources['usd_rate']}\n"
+        f"{sources['btc_price']}\n\n"
+        f"{sources['news']}\n\n"
         f"Всім гарного та мирного дня\! \U0000270C\ufe0f"
     )
     return report
 
-def _send_morning_report_content(chat_id):
-    """Generates and sends the morning report content."""
+def _send_morning_report_content(chat_id, report_text=None, raise_errors=False):
+    """
+    Generates and sends the morning report content; returns the sent message_id (None on failure).
+    `report_text` lets the fan-out generate the report once for all chats.
+    """
     logging.info(f"[{datetime.now()}] Report: Generating and sending morning report content.")
     try:
-        report_text = generate_morning_report_text()
-        telegram_sender.send_and_save_message(chat_id, report_text, parse_mode="MarkdownV2", bot_message_type='daily_report')
+        if report_text is None:
+            report_text = generate_morning_report_text()
+        message_id = telegram_sender.send_and_save_message(chat_id, report_text, parse_mode="MarkdownV2", bot_message_type='daily_report')
         logging.info(f"[{datetime.now()}] Report: Morning report content sent.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Error generating/sending morning report content: {e}", exc_info=True)
         bot_response = f"Виникла помилка при створенні ранкового звіту\\: {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='report_error')
 
-def generate_wordcloud_image(texts):
-    """Generates a word cloud image from a list of texts."""
-    wordcloud = WordCloud(width=800, height=400, min_word_length=4, background_color="white").generate(" ".join(texts))
-    img = io.BytesIO()
-    plt.figure(figsize=(10, 5))
-    plt.imshow(wordcloud, interpolation="bilinear")
-    plt.axis("off")
-    plt.savefig(img, format="PNG")
-    plt.close()
-    img.seek(0)
-    return img
-
-def _send_daily_report_content(chat_id):
-    """Generates and sends the daily activity report content."""
+wordcloud_renderer = WordCloudRenderer(
+    width=Config.WORDCLOUD_WIDTH,
+    height=Config.WORDCLOUD_HEIGHT,
+    image_format=Config.WORDCLOUD_IMAGE_FORMAT,
+    font_path=Config.WORDCLOUD_FONT_PATH,
+    mask_path=Config.WORDCLOUD_MASK_PATH
+)
+
+def generate_wordcloud_image(frequencies):
+    """Generates a word cloud image (BytesIO, encoded straight from WordCloud.to_image()) from {word: count}."""
+    return wordcloud_renderer.render_frequencies(frequencies)
+
+def _send_daily_report_content(chat_id, raise_errors=False, report_date=None):
+    """
+    Generates and sends the daily activity report content for `report_date` (default: today, UTC);
+    returns the report's message_id (None on failure).
+    With `raise_errors` only failures before the text report is sent are raised: once it is out, a retry
+    would post it twice, so a failed wordcloud is just logged.
+    """
     logging.info(f"[{datetime.now()}] Report: Generating and sending daily report content.")
     try:
-        today_utc = datetime.utcnow().date()
-        total_messages, top_users, bot_messages_count = db_manager.get_daily_stats()
-        texts_for_wordcloud = db_manager.get_all_texts_for_wordcloud()
+        today_utc = report_date or datetime.utcnow().date()
+        total_messages, top_users, bot_messages_count = db_manager.get_daily_stats(chat_id, today_utc)
+        wordcloud_frequencies = db_manager.get_word_frequencies(chat_id, today_utc, limit=Config.WORDCLOUD_MAX_WORDS)
+        if wordcloud_frequencies is None:
+            # word_freq is unreadable (not migrated yet); scan this chat's messages instead. An empty rollup means no words.
+            wordcloud_frequencies = db_manager.get_wordcloud_frequencies(
+                chat_id,
+                stop_words=Config.WORDCLOUD_STOP_WORDS,
+                max_words=Config.WORDCLOUD_MAX_DISTINCT_WORDS,
+                itersize=Config.WORDCLOUD_CURSOR_ITERSIZE,
+                day=today_utc
+            )
         daily_swear_count = db_manager.get_swear_count(chat_id, today_utc)
 
         report = f"\U0001F4CA Звіт за **{escape_markdown_v2(today_utc.strftime('%d.%m.%Y'))}**\\:\n\n"
@@ -1230,13 +4086,22 @@ def _send_daily_report_content(chat_id):
         else:
             report += "Немає активних користувачів, крім бота\\.\n"
 
-        bot_username = bot.get_me().username
         report += f"\nАктивність бота: **{escape_markdown_v2(str(bot_messages_count))}** повідомлень\n"
         report += f"\n\U0001F621 За сьогодні було виявлено **{escape_markdown_v2(str(daily_swear_count))}** матюків\\.\nСлідкуйте за мовою\\! 😉"
 
-        telegram_sender.send_and_save_message(chat_id, report, parse_mode="MarkdownV2", bot_message_type='daily_report')
+        report_message_id = telegram_sender.send_and_save_message(chat_id, report, parse_mode="MarkdownV2", bot_message_type='daily_report')
+        if report_message_id is None:
+            return None # Nothing went out: the caller may retry the whole report
+    except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
+        logging.error(f"[{datetime.now()}] Report: Error generating/sending daily report content: {e}", exc_info=True)
+        bot_response = f"Виникла помилка при створенні денного звіту\\: {escape_markdown_v2(str(e))}"
+        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='report_error')
+        return None
 
-        if texts_for_wordcloud:
+    try:
+        if wordcloud_frequencies:
             wordcloud_caption = f"**\U0001F308 Хмара слів за добу**"
             telegram_sender.send_and_save_message(
                 chat_id,
@@ -1244,88 +4109,220 @@ def _send_daily_report_content(chat_id):
                 parse_mode="MarkdownV2",
                 bot_message_type='wordcloud_image',
                 media_type='photo',
-                media_file=generate_wordcloud_image(texts_for_wordcloud)
+                media_file=generate_wordcloud_image(wordcloud_frequencies)
             )
         else:
             bot_response = "⚠️ Недостатньо повідомлень для WordCloud\\."
             telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='wordcloud_no_data')
         logging.info(f"[{datetime.now()}] Report: Daily report content sent.")
     except Exception as e:
-        logging.error(f"[{datetime.now()}] Report: Error generating/sending daily report content: {e}", exc_info=True)
-        bot_response = f"Виникла помилка при створенні денного звіту\\: {escape_markdown_v2(str(e))}"
-        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='report_error')
+        # The text report is already out, so this is not raised even for scheduled runs
+        logging.error(f"[{datetime.now()}] Report: Error generating/sending daily wordcloud: {e}", exc_info=True)
+        if not raise_errors:
+            bot_response = f"Виникла помилка при створенні хмари слів\\: {escape_markdown_v2(str(e))}"
+            telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='report_error')
+    return report_message_id
+
+def _send_wordcloud_content(chat_id, days=7, telegram_message_id_to_reply=None):
+    """Sends a wordcloud of the last `days` UTC days (including today), merged from the word_freq rollup."""
+    logging.info(f"[{datetime.now()}] Report: Generating and sending {days}-day wordcloud content.")
+    try:
+        end_date = datetime.utcnow().date()
+        start_date = end_date - timedelta(days=days - 1)
+        frequencies = db_manager.get_word_frequencies(chat_id, start_date, end_date, limit=Config.WORDCLOUD_MAX_WORDS)
+        if frequencies:
+            period = f"{start_date.strftime('%d.%m')} - {end_date.strftime('%d.%m.%Y')}"
+            telegram_sender.send_and_save_message(
+                chat_id,
+                f"**\U0001F308 Хмара слів за {escape_markdown_v2(period)}**",
+                parse_mode="MarkdownV2",
+                bot_message_type='wordcloud_image',
+                telegram_message_id_to_reply=telegram_message_id_to_reply,
+                media_type='photo',
+                media_file=generate_wordcloud_image(frequencies)
+            )
+        else:
+            bot_response = "⚠️ Недостатньо повідомлень для WordCloud\\."
+            telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='wordcloud_no_data', telegram_message_id_to_reply=telegram_message_id_to_reply)
+        logging.info(f"[{datetime.now()}] Report: {days}-day wordcloud content sent.")
+    except Exception as e:
+        logging.error(f"[{datetime.now()}] Report: Error generating/sending wordcloud content: {e}", exc_info=True)
+        bot_response = f"Виникла помилка при створенні хмари слів\\: {escape_markdown_v2(str(e))}"
+        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='report_error', telegram_message_id_to_reply=telegram_message_id_to_reply)
 
-def _send_random_fact_content(chat_id, telegram_message_id_to_reply=None):
-    """Generates and sends a random interesting fact."""
-    logging.info(f"[{datetime.now()}] Report: Generating and sending random fact content.")
+def _send_random_fact_content(chat_id, telegram_message_id_to_reply=None, fact=None, raise_errors=False):
+    """Sends the next random interesting fact from the fact pool (or `fact`, taken once by the fan-out); returns the message_id."""
+    logging.info(f"[{datetime.now()}] Report: Sending random fact content.")
     try:
-        generated_fact = openai_service.generate_random_fact()
+        generated_fact = fact if fact is not None else fact_pool.take("random")
         bot_response = f"\U0001F9D0 **Цікавий факт\\:**\n\n{escape_markdown_v2(generated_fact)}"
-        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='random_fact', telegram_message_id_to_reply=telegram_message_id_to_reply)
-        logging.info(f"[{datetime.now()}] Report: Sent generated random fact from OpenAI.")
+        message_id = telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='random_fact', telegram_message_id_to_reply=telegram_message_id_to_reply)
+        logging.info(f"[{datetime.now()}] Report: Sent random fact.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Unexpected error sending random fact: {e}", exc_info=True)
         bot_response = f"Виникла несподівана помилка при отриманні факту\\.\\ {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='fact_error', telegram_message_id_to_reply=telegram_message_id_to_reply)
 
-def _send_ukrainian_history_fact_content(chat_id, telegram_message_id_to_reply=None):
-    """Generates and sends a random Ukrainian historical fact."""
-    logging.info(f"[{datetime.now()}] Report: Generating and sending Ukrainian historical fact content.")
+def _send_ukrainian_history_fact_content(chat_id, telegram_message_id_to_reply=None, fact=None, raise_errors=False):
+    """Sends the next Ukrainian historical fact from the fact pool (or `fact`, taken once by the fan-out); returns the message_id."""
+    logging.info(f"[{datetime.now()}] Report: Sending Ukrainian historical fact content.")
     try:
-        generated_fact = openai_service.generate_ukrainian_history_fact()
+        generated_fact = fact if fact is not None else fact_pool.take("ukrainian_history")
         bot_response = f"\U0001F4DA **Вчіть історію\\:**\n\n{escape_markdown_v2(generated_fact)}"
-        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='ukrainian_history_fact', telegram_message_id_to_reply=telegram_message_id_to_reply)
-        logging.info(f"[{datetime.now()}] Report: Sent generated Ukrainian historical fact from OpenAI.")
+        message_id = telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='ukrainian_history_fact', telegram_message_id_to_reply=telegram_message_id_to_reply)
+        logging.info(f"[{datetime.now()}] Report: Sent Ukrainian historical fact.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Unexpected error sending Ukrainian historical fact: {e}", exc_info=True)
         bot_response = f"Виникла несподівана помилка при отриманні історичного факту\\.\\ {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='fact_error', telegram_message_id_to_reply=telegram_message_id_to_reply)
 
-def _send_ai_summary_content(chat_id, telegram_message_id_to_reply=None):
-    """Generates and sends the AI summary content."""
+def _send_ai_summary_content(chat_id, telegram_message_id_to_reply=None, raise_errors=False, summary_date=None):
+    """Generates and sends the AI summary content for `summary_date` (default: today, UTC); returns the sent message_id (None on failure)."""
     logging.info(f"[{datetime.now()}] Report: Generating and sending AI summary content.")
     try:
-        messages_for_summary = db_manager.get_messages_for_summary()
-        summary = openai_service.generate_summary(messages_for_summary)
+        summary = rolling_summarizer.daily_summary(chat_id, summary_date)
         bot_response = f"\U0001F4AC **Стислий огляд дня\\:**\n\n{escape_markdown_v2(summary)}"
-        telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='ai_summary', telegram_message_id_to_reply=telegram_message_id_to_reply)
+        message_id = telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='ai_summary', telegram_message_id_to_reply=telegram_message_id_to_reply)
         logging.info(f"[{datetime.now()}] Report: AI summary content sent.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Error generating/sending AI summary content: {e}", exc_info=True)
         bot_response = f"Виникла помилка при створенні підсумку\\: {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='summary_error', telegram_message_id_to_reply=telegram_message_id_to_reply)
 
-def _send_cashback_reminder_content(chat_id):
-    """Sends the cashback reminder message."""
+def _send_cashback_reminder_content(chat_id, raise_errors=False):
+    """Sends the cashback reminder message; returns the sent message_id (None on failure)."""
     logging.info(f"[{datetime.now()}] Report: Sending cashback reminder.")
     reminder_text = (
         f"\U0001F4B8 **Кешбек\!**\n\n"
         f"Не забудьте увімкнути кешбек в улюблених категоріях цього місяця\\! 😉"
     )
     try:
-        telegram_sender.send_and_save_message(chat_id, reminder_text, parse_mode="MarkdownV2", bot_message_type='cashback_reminder')
+        message_id = telegram_sender.send_and_save_message(chat_id, reminder_text, parse_mode="MarkdownV2", bot_message_type='cashback_reminder')
         logging.info(f"[{datetime.now()}] Report: Cashback reminder sent.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Error sending cashback reminder: {e}", exc_info=True)
         bot_response = f"Виникла помилка при відправці нагадування про кешбек\\: {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='reminder_error')
 
-def _send_monthly_payments_reminder_content(chat_id):
-    """Sends the monthly payments reminder message."""
+def _send_monthly_payments_reminder_content(chat_id, raise_errors=False):
+    """Sends the monthly payments reminder message; returns the sent message_id (None on failure)."""
     logging.info(f"[{datetime.now()}] Report: Sending monthly payments reminder.")
     reminder_text = (
         f"\U0001F4B3 **Останній день місяця\!**\n\n"
         f"Не забудьте оплатити інтернет та інші сервіси, які цього потребують\\."
     )
     try:
-        telegram_sender.send_and_save_message(chat_id, reminder_text, parse_mode="MarkdownV2", bot_message_type='monthly_payments_reminder')
+        message_id = telegram_sender.send_and_save_message(chat_id, reminder_text, parse_mode="MarkdownV2", bot_message_type='monthly_payments_reminder')
         logging.info(f"[{datetime.now()}] Report: Monthly payments reminder sent.")
+        return message_id
     except Exception as e:
+        if raise_errors: # Scheduled runs: let the job queue retry instead of posting the error
+            raise
         logging.error(f"[{datetime.now()}] Report: Error sending monthly payments reminder: {e}", exc_info=True)
         bot_response = f"Виникла помилка при відправці нагадування про оплату сервісів\\: {escape_markdown_v2(str(e))}"
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='reminder_error')
 
 
+# === Report Fan-out ===
+# report_type -> (produce() for content shared by every chat, or None for chat-specific reports;
+#                 deliver(chat_id, content, local_date) returning a truthy value once the report is sent;
+#                 local_date is the subscriber's own calendar day). Delivery errors
+# are raised rather than posted to the chat, so a retried run does not spam every chat with error messages.
+FANOUT_REPORTS = {
+    "morning": (generate_morning_report_text, lambda chat_id, report_text, _: _send_morning_report_content(chat_id, report_text=report_text, raise_errors=True)),
+    "random_fact": (lambda: fact_pool.take("random"), lambda chat_id, fact, _: _send_random_fact_content(chat_id, fact=fact, raise_errors=True)),
+    "ukrainian_history_fact": (lambda: fact_pool.take("ukrainian_history"), lambda chat_id, fact, _: _send_ukrainian_history_fact_content(chat_id, fact=fact, raise_errors=True)),
+    "daily": (None, lambda chat_id, _, local_date: _send_daily_report_content(chat_id, raise_errors=True, report_date=local_date)),
+    "summary": (None, lambda chat_id, _, local_date: _send_ai_summary_content(chat_id, raise_errors=True, summary_date=local_date)),
+}
+
+
+def subscription_run_at(local_time, timezone_name, local_date):
+    """UTC moment of a subscription's local time on local_date (DST-aware)."""
+    return datetime.combine(local_date, local_time, tzinfo=ZoneInfo(timezone_name)).astimezone(timezone.utc)
+
+
+class ReportFanout:
+    """
+    Delivers one scheduled report to every chat subscribed to it at the same moment.
+    Shared content (morning report, facts) is produced once per run and sent to the chats in parallel;
+    chat-specific reports (daily stats, summary) are built per chat. Each chat's delivery is recorded in
+    scheduled_job_executions_v2 under its own name, so a retried run only reaches the chats that missed it.
+    Sending speed is left to telegram_sender's rate limiter.
+    """
+    def __init__(self, db, reports, max_parallel_chats=8):
+        self.db = db
+        self.reports = reports
+        self.max_parallel_chats = max_parallel_chats
+
+    @staticmethod
+    def execution_name(report_type, subscription):
+        return f"{report_type}_{subscription['local_time']:%H%M}@{subscription['chat_id']}"
+
+    def recipients(self, report_type, run_at):
+        """Subscriptions to report_type whose local time falls on run_at, with the local date it is for."""
+        due = []
+        for subscription in self.db.get_chat_subscriptions(report_type):
+            try:
+                local_date = run_at.astimezone(ZoneInfo(subscription["timezone"])).date()
+                if subscription_run_at(subscription["local_time"], subscription["timezone"], local_date) == run_at:
+                    due.append((subscription, local_date))
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] Fanout: Skipping subscription of chat {subscription['chat_id']} to '{report_type}': {e}")
+        return due
+
+    def run(self, report_type, run_at):
+        """Sends the report to every chat due at run_at; raises if some chats failed, so the job is retried for them."""
+        produce, deliver = self.reports[report_type]
+        pending = []
+        for subscription, local_date in self.recipients(report_type, run_at):
+            name = self.execution_name(report_type, subscription)
+            if not self.db.has_job_executed_today(name, local_date):
+                pending.append((subscription["chat_id"], name, local_date))
+        if not pending:
+            logging.info(f"[{datetime.now()}] Fanout: No chats left for '{report_type}' at {run_at}.")
+            return 0
+
+        content = produce() if produce else None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(pending), self.max_parallel_chats), thread_name_prefix="fanout") as executor:
+            results = list(executor.map(lambda item: self._deliver(deliver, content, *item), pending))
+        failed = [chat_id for (chat_id, _, _), delivered in zip(pending, results) if not delivered]
+        logging.info(f"[{datetime.now()}] Fanout: '{report_type}' at {run_at} delivered to {len(pending) - len(failed)} of {len(pending)} chat(s).")
+        if failed:
+            raise RuntimeError(f"'{report_type}' was not delivered to chat(s) {failed}")
+        return len(pending)
+
+    def _deliver(self, deliver, content, chat_id, name, local_date):
+        # Recording first keeps two workers from sending to the same chat; the record is dropped if sending fails
+        recorded = self.db.record_job_execution(name, local_date)
+        if recorded is None:
+            return False # Could not claim the chat (DB error): not delivered, retried with the job
+        if not recorded:
+            return True # Already delivered by an earlier run or another worker
+        try:
+            delivered = deliver(chat_id, content, local_date)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Fanout: Error delivering '{name}': {e}", exc_info=True)
+            delivered = False
+        if not delivered:
+            self.db.forget_job_execution(name, local_date)
+        return bool(delivered)
+
+report_fanout = ReportFanout(db_manager, FANOUT_REPORTS, max_parallel_chats=Config.FANOUT_MAX_PARALLEL_CHATS)
+
+
 # === Flask Web Server ===
 app = Flask(__name__)
 
@@ -1360,19 +4357,101 @@ def set_webhook_with_retries(max_retries=5, retry_delay_seconds=5, initial_sleep
                 return False
     return False
 
+def format_expert_answer(expert_answer_raw):
+    """Wraps a raw expert answer into the MarkdownV2 reply shown in chat."""
+    return f"\U0001F9D1\u200D\U0001F3EB **Ось експертна думка з цього питання\\:**\n\n{escape_markdown_v2(expert_answer_raw)}"
+
+class ThrottledMessageEditor:
+    """Edits one message at most once per `min_interval_seconds`, skipping no-op edits and backing off on 429."""
+    def __init__(self, bot_instance, chat_id, message_id, min_interval_seconds, parse_mode="MarkdownV2"):
+        self.bot = bot_instance
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.min_interval_seconds = min_interval_seconds
+        self.parse_mode = parse_mode
+        self._last_text = None
+        self._next_edit_at = time.monotonic() # First tokens are shown right away
+
+    def update(self, text):
+        """Shows `text` if an edit is due. Intermediate edits are cosmetic: failures are logged, never raised."""
+        now = time.monotonic()
+        if text == self._last_text or now < self._next_edit_at:
+            return False
+        try:
+            self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, parse_mode=self.parse_mode)
+            self._last_text = text
+            self._next_edit_at = now + self.min_interval_seconds
+            return True
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", self.min_interval_seconds)
+                self._next_edit_at = now + retry_after
+                logging.warning(f"[{datetime.now()}] Streaming: Edit rate-limited in chat {self.chat_id}, next edit in {retry_after}s.")
+            else:
+                logging.warning(f"[{datetime.now()}] Streaming: Could not edit message {self.message_id} in chat {self.chat_id}: {e}")
+            return False
+        except Exception as e: # Connection errors, timeouts: skip this edit, the final one still goes out
+            logging.warning(f"[{datetime.now()}] Streaming: Could not edit message {self.message_id} in chat {self.chat_id}: {e}")
+            return False
+
+    def wait_until_ready(self):
+        """Sleeps until the next edit is allowed (used before the final edit)."""
+        delay = self._next_edit_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+EXPERT_ANSWER_PLACEHOLDER = "\U0001F9D1\u200D\U0001F3EB Думаю\\.\\.\\."
+STREAMING_CURSOR = " \u258C"
+
+def send_expert_answer(chat_id, query_text, telegram_message_id, chat_type, reply_to_message_id=None):
+    """
+    Answers with an expert opinion. In streaming mode a placeholder reply is edited as tokens arrive,
+    so the user waits only for the first tokens; the final text is saved through send_and_save_message.
+    """
+    if Config.EXPERT_ANSWER_STREAMING:
+        try:
+            reply_parameters = telebot.types.ReplyParameters(message_id=telegram_message_id, chat_id=chat_id, allow_sending_without_reply=True)
+            placeholder = bot.send_message(chat_id, EXPERT_ANSWER_PLACEHOLDER, parse_mode="MarkdownV2", reply_parameters=reply_parameters)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Streaming: Could not send placeholder, falling back to a single reply: {e}", exc_info=True)
+            placeholder = None
+
+        if placeholder:
+            edit_interval = Config.EXPERT_STREAM_GROUP_EDIT_INTERVAL_SECONDS if chat_type in ['group', 'supergroup'] else Config.EXPERT_STREAM_EDIT_INTERVAL_SECONDS
+            editor = ThrottledMessageEditor(bot, chat_id, placeholder.message_id, edit_interval)
+            answer_parts = []
+            try:
+                for text_chunk in openai_service.stream_expert_answer(chat_id, query_text, reply_to_message_id, telegram_message_id):
+                    answer_parts.append(text_chunk)
+                    editor.update(format_expert_answer("".join(answer_parts)) + STREAMING_CURSOR) # Never raises
+                expert_answer_raw = "".join(answer_parts)
+            except Exception as e: # Only LLM/stream errors get here
+                expert_answer_raw = openai_service.expert_answer_error_text(e)
+            editor.wait_until_ready()
+            final_text = format_expert_answer(expert_answer_raw)
+            if telegram_sender.send_and_save_message(chat_id, final_text, parse_mode="MarkdownV2", bot_message_type='expert_opinion', telegram_message_id_to_reply=telegram_message_id, edit_message_id=placeholder.message_id) is None:
+                # The placeholder still shows "Думаю..." or a partial answer: deliver the answer as a fresh reply
+                logging.warning(f"[{datetime.now()}] Streaming: Final edit of message {placeholder.message_id} in chat {chat_id} failed, sending a new reply.")
+                telegram_sender.send_and_save_message(chat_id, final_text, parse_mode="MarkdownV2", bot_message_type='expert_opinion', telegram_message_id_to_reply=telegram_message_id)
+            return
+
+    bot.send_chat_action(chat_id, "typing")
+    expert_answer_raw = openai_service.get_expert_answer(chat_id, query_text, reply_to_message_id, telegram_message_id)
+    escaped_expert_answer_full_message = format_expert_answer(expert_answer_raw)
+    telegram_sender.send_and_save_message(chat_id, escaped_expert_answer_full_message, parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id, bot_message_type='expert_opinion')
+
 def handle_swear_words(chat_id, effective_message_content, telegram_message_id):
     """Checks for swear words and updates count."""
     if effective_message_content:
-        cleaned_message = re.sub(r'[^\w\s]', '', effective_message_content.lower())
-        total_swears_in_message = sum(len(re.findall(pattern, cleaned_message)) for pattern in SWEAR_WORDS_REGEX_PATTERNS)
+        total_swears_in_message = swear_matcher.count(effective_message_content)
         if total_swears_in_message > 0:
             today_utc = datetime.utcnow().date()
             current_swear_count = db_manager.increment_swear_count(chat_id, today_utc, total_swears_in_message)
             bot_response_swear_count = f"\U0001F4A9 Лічильник матюків\\: **{escape_markdown_v2(str(current_swear_count))}**\\.\nСлідкуйте за мовою\\! 😉"
             telegram_sender.send_and_save_message(chat_id, bot_response_swear_count, parse_mode="MarkdownV2", bot_message_type='swear_counter', telegram_message_id_to_reply=telegram_message_id)
 
-def handle_forwarded_message(message_data, chat_id, telegram_message_id, effective_message_content):
-    """Handles forwarded messages for translation."""
+def build_forwarded_caption(message_data, translated_text_from_ai):
+    """Builds the MarkdownV2 caption for a translated forwarded message (source link, sender, translation)."""
     raw_forward_from_chat_name = 'невідомого джерела' # Default value
     raw_username = message_data.get('from', {}).get('username', 'невідомого користувача')
     original_message_link = "" # Initialize link
@@ -1395,15 +4474,6 @@ def handle_forwarded_message(message_data, chat_id, telegram_message_id, effecti
             user_name_parts.append(forward_from_user['last_name'])
         raw_forward_from_chat_name = 'від користувача ' + ' '.join(user_name_parts) if user_name_parts else 'від невідомого користувача'
 
-    translated_text_from_ai = ""
-    if effective_message_content:
-        bot.send_chat_action(chat_id, "typing")
-        try:
-            translated_text_from_ai = openai_service.translate_text(effective_message_content)
-        except Exception as e:
-            logging.error(f"[{datetime.now()}] Webhook: Помилка перекладу пересланого вмісту: {e}", exc_info=True)
-            translated_text_from_ai = f"Помилка перекладу: {e}"
-
     escaped_forward_from_chat_name = escape_markdown_v2(raw_forward_from_chat_name)
     escaped_username_for_display = escape_markdown_v2(raw_username)
     escaped_translated_text_from_ai_for_display = escape_markdown_v2(translated_text_from_ai)
@@ -1431,6 +4501,20 @@ def handle_forwarded_message(message_data, chat_id, telegram_message_id, effecti
     if len(base_caption_content) > MAX_CAPTION_LENGTH - 3:
         final_caption = base_caption_content[:MAX_CAPTION_LENGTH - 3] + "..."
         logging.warning(f"[{datetime.now()}] Webhook: Truncated combined raw content to {MAX_CAPTION_LENGTH - 3} chars and added '...'.")
+    return final_caption
+
+def handle_forwarded_message(message_data, chat_id, telegram_message_id, effective_message_content):
+    """Handles forwarded messages for translation."""
+    translated_text_from_ai = ""
+    if effective_message_content:
+        bot.send_chat_action(chat_id, "typing")
+        try:
+            translated_text_from_ai = openai_service.translate_text(effective_message_content)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Webhook: Помилка перекладу пересланого вмісту: {e}", exc_info=True)
+            translated_text_from_ai = f"Помилка перекладу: {e}"
+
+    final_caption = build_forwarded_caption(message_data, translated_text_from_ai)
 
     content_sent = False
 
@@ -1492,34 +4576,57 @@ def handle_forwarded_message(message_data, chat_id, telegram_message_id, effecti
         bot_response_private = "Отримано переслане повідомлення без тексту та медіа\\. Нічого перекладати або пересилати\\."
         telegram_sender.send_and_save_message(chat_id, bot_response_private, parse_mode="MarkdownV2", bot_message_type='no_content_forward', telegram_message_id_to_reply=telegram_message_id)
 
+def format_video_too_large(size_bytes):
+    """Builds the MarkdownV2 'video too large' reply; size_bytes is None when the download was cut off early."""
+    size_display = f"{size_bytes / (1024 * 1024):.2f}" if size_bytes else f"понад {Config.VIDEO_MAX_SIZE_MB}"
+    return f"Відео занадто велике \\({escape_markdown_v2(size_display)} МБ\\), не можу відправити\\. Макс\\. {Config.VIDEO_MAX_SIZE_MB} МБ\\."
+
+def remember_uploaded_video(source_url):
+    """Returns an on_sent callback that caches the file_id of an uploaded video for `source_url`."""
+    def _on_sent(sent_message):
+        if sent_message.video:
+            social_video_cache.store(source_url, telegram_file_id=sent_message.video.file_id)
+    return _on_sent
+
 def handle_social_media_link(chat_id, user_id, effective_message_content, telegram_message_id, chat_type): # Додано chat_type
     """Handles social media links for video download."""
     # Дозволити завантаження, якщо це груповий чат АБО це приватний чат І користувач є власником
     if chat_type in ['group', 'supergroup'] or (chat_type == 'private' and user_id == Config.OWNER_TELEGRAM_USER_ID):
         bot.send_chat_action(chat_id, "upload_video")
-        result = social_downloader.download_video(effective_message_content.strip())
+        source_url = normalize_social_url(effective_message_content)
+
+        # Це відео вже завантажувалося в Telegram: повторно надсилаємо file_id без RapidAPI і без трафіку
+        cached_file_id = social_video_cache.get_file_id(source_url)
+        if cached_file_id:
+            if telegram_sender.send_and_save_message(
+                chat_id, "", parse_mode="MarkdownV2",
+                bot_message_type='video_upload', telegram_message_id_to_reply=telegram_message_id,
+                media_type='video', media_file=cached_file_id
+            ):
+                logging.info(f"[{datetime.now()}] Webhook: Video for {source_url} served from cached file_id.")
+                return
+            social_video_cache.invalidate(source_url, telegram_file_id=True)
+
+        result = social_video_cache.get_resolved_url(source_url)
+        if not result:
+            result = social_downloader.download_video(effective_message_content.strip())
+            if result and result.startswith("http"):
+                social_video_cache.store(source_url, resolved_url=result)
         if result and result.startswith("http"):
             try:
-                video_resp = requests.get(result, stream=True, timeout=60)
-                video_bytes = io.BytesIO()
-                for chunk in video_resp.iter_content(chunk_size=8192):
-                    video_bytes.write(chunk)
-                video_bytes.seek(0)
-
-                file_size_mb = video_bytes.tell() / (1024 * 1024)
-                if file_size_mb > 50:
-                    bot_response = f"Відео занадто велике \\({escape_markdown_v2(f'{file_size_mb:.2f}')} МБ\\), не можу відправити\\. Макс\\. 50 МБ\\."
-                    telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='video_too_large', telegram_message_id_to_reply=telegram_message_id)
-                else:
-                    video_bytes.name = "video.mp4"
-                    # escaped_effective_message_content = escape_markdown_v2(effective_message_content) # Цей рядок більше не потрібен
+                video_file = social_downloader.fetch_video_file(result, Config.VIDEO_MAX_SIZE_MB * 1024 * 1024, Config.VIDEO_DOWNLOAD_CHUNK_SIZE)
+                with video_file:
                     telegram_sender.send_and_save_message(
                         chat_id, "", parse_mode="MarkdownV2", # Змінено: прибрано текст підпису
                         bot_message_type='video_upload', telegram_message_id_to_reply=telegram_message_id,
-                        media_type='video', media_file=video_bytes
+                        media_type='video', media_file=video_file, on_sent=remember_uploaded_video(source_url)
                     )
 
+            except VideoTooLargeError as e:
+                telegram_sender.send_and_save_message(chat_id, format_video_too_large(e.size_bytes), parse_mode="MarkdownV2", bot_message_type='video_too_large', telegram_message_id_to_reply=telegram_message_id)
             except requests.exceptions.RequestException as e:
+                # Посилання CDN могло протухнути раніше за TTL
+                social_video_cache.invalidate(source_url, resolved_url=True)
                 bot_response = f"Не вдалося завантажити відео через помилку\\: {escape_markdown_v2(str(e))}\\. Перевірте посилання або спробуйте пізніше\\."
                 telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='video_download_error', telegram_message_id_to_reply=telegram_message_id)
             except Exception as e:
@@ -1534,7 +4641,7 @@ def handle_social_media_link(chat_id, user_id, effective_message_content, telegr
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='permission_denied', telegram_message_id_to_reply=telegram_message_id)
         logging.info(f"[{datetime.now()}] Webhook: Video download rejected for non-owner in private chat.")
 
-def handle_bot_mention_command(chat_id, user_id, command_or_query_part, telegram_message_id, chat_type): # Додано chat_type
+def handle_bot_mention_command(chat_id, user_id, command_or_query_part, telegram_message_id, chat_type, reply_to_message_id=None): # Додано chat_type
     """Handles commands when the bot is explicitly mentioned."""
     # Дозволити експертну відповідь, якщо це груповий чат АБО це приватний чат І користувач є власником
     if chat_type in ['group', 'supergroup'] or (chat_type == 'private' and user_id == Config.OWNER_TELEGRAM_USER_ID):
@@ -1560,10 +4667,7 @@ def handle_bot_mention_command(chat_id, user_id, command_or_query_part, telegram
                 raw_error_message = "Некоректний формат команди\\.\nВикористовуйте\\: `@ваш_бот заплануй_анонс ГГ:ХХ Текст вашого анонсу`\nАбо\\: `@ваш_бот заплануй анонс ГГ:ХХ Текст вашого анонсу`\\.\nЦе ж елементарно, навіть ви мали б зрозуміти\\!"
                 telegram_sender.send_and_save_message(chat_id, raw_error_message, parse_mode="MarkdownV2", bot_message_type='announcement_format_error', telegram_message_id_to_reply=telegram_message_id)
         else:
-            bot.send_chat_action(chat_id, "typing")
-            expert_answer_raw = openai_service.get_expert_answer(chat_id, command_or_query_part)
-            escaped_expert_answer_full_message = f"\U0001F9D1\u200D\U0001F3EB **Ось експертна думка з цього питання\\:**\n\n{escape_markdown_v2(expert_answer_raw)}"
-            telegram_sender.send_and_save_message(chat_id, escaped_expert_answer_full_message, parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id, bot_message_type='expert_opinion')
+            send_expert_answer(chat_id, command_or_query_part, telegram_message_id, chat_type, reply_to_message_id)
     else:
         bot_response = "Вибачте, але я не відповідаю на запитання у приватних чатах від сторонніх користувачів, щоб заощадити кошти\\. Моя експертиза доступна лише для спеціальних запитів\\."
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id)
@@ -1572,7 +4676,7 @@ def handle_bot_mention_command(chat_id, user_id, command_or_query_part, telegram
 def handle_reply_to_bot_message(message_data, chat_id, user_id, effective_message_content, telegram_message_id, chat_type): # Додано chat_type
     """Handles replies to the bot's own messages."""
     reply_to_message = message_data['reply_to_message']
-    if 'from' in reply_to_message and reply_to_message['from']['id'] == bot.get_me().id:
+    if 'from' in reply_to_message and reply_to_message['from']['id'] == bot_identity.id:
         replied_message_info = db_manager.get_message_by_id(reply_to_message['message_id'])
         bot_msg_type = replied_message_info.get('bot_message_type') if replied_message_info else None
 
@@ -1595,10 +4699,7 @@ def handle_reply_to_bot_message(message_data, chat_id, user_id, effective_messag
         # Дозволити експертну відповідь, якщо це груповий чат АБО це приватний чат І користувач є власником
         if chat_type in ['group', 'supergroup'] or (chat_type == 'private' and user_id == Config.OWNER_TELEGRAM_USER_ID):
             logging.info(f"[{datetime.now()}] Webhook: Detected reply to bot's message (type: {bot_msg_type}). Activating expert conversation.")
-            bot.send_chat_action(chat_id, "typing")
-            expert_answer_raw = openai_service.get_expert_answer(chat_id, effective_message_content)
-            escaped_expert_answer_full_message = f"\U0001F9D1\u200D\U0001F3EB **Ось експертна думка з цього питання\\:**\n\n{escape_markdown_v2(expert_answer_raw)}"
-            telegram_sender.send_and_save_message(chat_id, escaped_expert_answer_full_message, parse_mode="MarkdownV2", bot_message_type='expert_opinion', telegram_message_id_to_reply=telegram_message_id)
+            send_expert_answer(chat_id, effective_message_content, telegram_message_id, chat_type, reply_to_message['message_id'])
         else:
             bot_response = "Вибачте, я можу відповідати експертною думкою в приватних чатах лише власнику\\. Це для економії ресурсів\\."
             telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='permission_denied', telegram_message_id_to_reply=telegram_message_id)
@@ -1608,10 +4709,7 @@ def handle_private_chat_message(chat_id, user_id, effective_message_content, tel
     """Handles messages in private chats."""
     logging.info(f"[{datetime.now()}] Webhook: Detected message in private chat. Activating expert conversation.")
     if user_id == Config.OWNER_TELEGRAM_USER_ID:
-        bot.send_chat_action(chat_id, "typing")
-        expert_answer_raw = openai_service.get_expert_answer(chat_id, effective_message_content)
-        escaped_expert_answer_full_message = f"\U0001F9D1\u200D\U0001F3EB **Ось експертна думка з цього питання\\:**\n\n{escape_markdown_v2(expert_answer_raw)}"
-        telegram_sender.send_and_save_message(chat_id, escaped_expert_answer_full_message, parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id, bot_message_type='expert_opinion')
+        send_expert_answer(chat_id, effective_message_content, telegram_message_id, 'private')
     else:
         bot_response = "Вибачте, але я не відповідаю на запитання у приватних чатах від сторонніх користувачів, щоб заощадити кошти\\. Моя експертиза доступна лише для спеціальних запитів\\."
         telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", telegram_message_id_to_reply=telegram_message_id)
@@ -1620,8 +4718,8 @@ def handle_private_chat_message(chat_id, user_id, effective_message_content, tel
 def handle_new_chat_members(message_data, chat_id, telegram_message_id):
     """Handles new chat members, especially the bot itself."""
     for member in message_data['new_chat_members']:
-        if member['id'] == bot.get_me().id:
-            bot_username = bot.get_me().username
+        if member['id'] == bot_identity.id:
+            bot_username = bot_identity.username
             raw_welcome_message = f"""
 Привіт\! Я ваш особистий асистент у цьому чаті\. Мій функціонал\:
 
@@ -1653,16 +4751,15 @@ def webhook():
         logging.info(f"[{datetime.now()}] Webhook: Successfully parsed Telegram Update into dict.")
 
         update_id = update_data.get('update_id')
-        if update_id:
-            if update_id in processed_updates:
-                logging.warning(f"[{datetime.now()}] Idempotency: Update with ID {update_id} already processed. Ignoring.")
-                return 'ok', 200 # Return immediately if already processed
-            else:
-                processed_updates[update_id] = time.time()
-                logging.info(f"[{datetime.now()}] Idempotency: Added update_id {update_id} to processed cache.")
+        if not register_update(update_id):
+            return 'ok', 200 # Return immediately if already processed
 
-        # Process the update in a separate thread to avoid webhook timeouts
-        threading.Thread(target=process_telegram_update, args=(update_data,)).start()
+        # Process the update on the worker pool to avoid webhook timeouts
+        if not update_dispatcher.submit(get_update_chat_key(update_data), update_data):
+            # Let Telegram redeliver the update later instead of dropping it
+            if update_id:
+                processed_updates.pop(update_id, None)
+            return 'busy', 429
 
     except json.JSONDecodeError as e:
         logging.error(f"[{datetime.now()}] Webhook: JSON decoding error: {e}. Raw data: {json_string[:200]}...", exc_info=True)
@@ -1671,8 +4768,26 @@ def webhook():
 
     return 'ok', 200 # Always return 'ok' quickly
 
+SOCIAL_MEDIA_LINK_MARKERS = ["instagram.com/reel", "facebook.com/share/r", "vt.tiktok.com", "facebook.com/reel/", "facebook.com/share/v/"]
+
+def is_social_media_link(effective_message_content):
+    """Checks whether the message contains a supported TikTok/Instagram/Facebook video link."""
+    return bool(effective_message_content) and any(x in effective_message_content.lower() for x in SOCIAL_MEDIA_LINK_MARKERS)
+
+def find_bot_mention(message_data, effective_message_content, bot_username):
+    """
+    Looks for an explicit @mention of the bot in the message entities.
+    Returns (is_mentioned, query_part) where query_part is the text after the mention.
+    """
+    bot_mention = f"@{bot_username}"
+    if effective_message_content and 'entities' in message_data:
+        for entity in message_data['entities']:
+            if entity['type'] == 'mention' and effective_message_content[entity['offset']:entity['offset']+entity['length']].lower() == bot_mention:
+                return True, effective_message_content[entity['offset'] + entity['length']:].strip()
+    return False, effective_message_content
+
 def process_telegram_update(update_data):
-    """Processes a Telegram update in a separate thread."""
+    """Processes a Telegram update on an update worker thread."""
     try:
         if 'message' in update_data and update_data['message']:
             message_data = update_data['message']
@@ -1683,6 +4798,7 @@ def process_telegram_update(update_data):
             username = message_data.get('from', {}).get('username')
             message_caption = message_data.get('caption')
             telegram_message_id = message_data.get('message_id')
+            reply_to_message_id = (message_data.get('reply_to_message') or {}).get('message_id')
 
             effective_message_content = message_text if message_text is not None else message_caption
 
@@ -1695,34 +4811,26 @@ def process_telegram_update(update_data):
                 message_content=effective_message_content,
                 message_date=datetime.utcfromtimestamp(message_data.get('date')),
                 chat_id_to_save=chat_id,
-                is_bot_message=False
+                is_bot_message=False,
+                reply_to_message_id=reply_to_message_id
             )
 
             handle_swear_words(chat_id, effective_message_content, telegram_message_id)
 
-            bot_username = bot.get_me().username.lower() if bot.get_me() else ""
-            bot_mention = f"@{bot_username}"
-
-            is_bot_explicitly_mentioned_in_text = False
-            mention_query_part = effective_message_content
-            if effective_message_content and 'entities' in message_data:
-                for entity in message_data['entities']:
-                    if entity['type'] == 'mention' and effective_message_content[entity['offset']:entity['offset']+entity['length']].lower() == bot_mention:
-                        is_bot_explicitly_mentioned_in_text = True
-                        mention_query_part = effective_message_content[entity['offset'] + entity['length']:].strip()
-                        break
+            bot_username = bot_identity.username.lower() if bot_identity.username else ""
+            is_bot_explicitly_mentioned_in_text, mention_query_part = find_bot_mention(message_data, effective_message_content, bot_username)
 
             # --- MODIFIED FORWARD LOGIC ---
             # Handle forwarded messages from both channels/groups and individual users
             if chat_type == 'private' and ('forward_from_chat' in message_data or 'forward_from' in message_data):
                 handle_forwarded_message(message_data, chat_id, telegram_message_id, effective_message_content)
             # --- END MODIFIED FORWARD LOGIC ---
-            elif effective_message_content and any(x in effective_message_content.lower() for x in ["instagram.com/reel", "facebook.com/share/r", "vt.tiktok.com", "facebook.com/reel/", "facebook.com/share/v/"]):
+            elif is_social_media_link(effective_message_content):
                 # Передача chat_type до handle_social_media_link
                 handle_social_media_link(chat_id, user_id, effective_message_content, telegram_message_id, chat_type)
             elif is_bot_explicitly_mentioned_in_text:
                 # Передача chat_type до handle_bot_mention_command
-                handle_bot_mention_command(chat_id, user_id, mention_query_part, telegram_message_id, chat_type)
+                handle_bot_mention_command(chat_id, user_id, mention_query_part, telegram_message_id, chat_type, reply_to_message_id)
             elif 'reply_to_message' in message_data:
                 # Передача chat_type до handle_reply_to_bot_message
                 handle_reply_to_bot_message(message_data, chat_id, user_id, effective_message_content, telegram_message_id, chat_type)
@@ -1753,6 +4861,24 @@ def process_telegram_update(update_data):
     except Exception as e:
         logging.error(f"[{datetime.now()}] Webhook: Error during asynchronous update processing: {e}", exc_info=True)
 
+def get_update_chat_key(update_data):
+    """Returns the chat id used to keep updates of one chat in order (falls back to the update id)."""
+    for key in ('message', 'edited_message', 'channel_post', 'my_chat_member', 'chat_member'):
+        chat = (update_data.get(key) or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+    callback_message = (update_data.get('callback_query') or {}).get('message') or {}
+    if callback_message.get('chat'):
+        return callback_message['chat'].get('id')
+    return f"update:{update_data.get('update_id')}"
+
+update_dispatcher = UpdateDispatcher(
+    process_telegram_update,
+    num_workers=Config.UPDATE_WORKERS,
+    max_pending=Config.UPDATE_QUEUE_MAX_SIZE,
+    submit_timeout_seconds=Config.UPDATE_SUBMIT_TIMEOUT_SECONDS
+)
+
 
 @app.route("/", methods=['GET'])
 def home():
@@ -1760,6 +4886,11 @@ def home():
     logging.info(f"[{datetime.now()}] Home: Received GET request on /.")
     return "Bot is running. Database connection and scheduler should be active.", 200
 
+@app.route("/stats/dispatcher", methods=['GET'])
+def dispatcher_stats_endpoint():
+    """Endpoint exposing update worker pool counters (backlog, overflow waits, rejections)."""
+    return jsonify(update_dispatcher.stats()), 200
+
 @app.route("/daily", methods=['GET'])
 def trigger_daily_report_endpoint():
     """Endpoint to manually trigger the daily report."""
@@ -1772,6 +4903,19 @@ def trigger_daily_report_endpoint():
         logging.error(f"[{datetime.now()}] Endpoint: Error in /daily endpoint: {e}", exc_info=True)
         return f"Error: {e}", 500
 
+@app.route("/wordcloud", methods=['GET'])
+def trigger_wordcloud_endpoint():
+    """Endpoint to manually trigger a multi-day wordcloud (?days=N, default 7)."""
+    logging.info(f"[{datetime.now()}] Endpoint: Received request for /wordcloud.")
+    try:
+        days = max(1, min(int(request.args.get("days", 7)), 366))
+        _send_wordcloud_content(Config.GROUP_REPORT_CHAT_ID, days)
+        logging.info(f"[{datetime.now()}] Endpoint: /wordcloud - {days}-day wordcloud sent.")
+        return "Wordcloud sent", 200
+    except Exception as e:
+        logging.error(f"[{datetime.now()}] Endpoint: Error in /wordcloud endpoint: {e}", exc_info=True)
+        return f"Error: {e}", 500
+
 @app.route("/morning", methods=['GET'])
 def trigger_morning_report_endpoint():
     """Endpoint to manually trigger the morning report."""
@@ -1833,46 +4977,167 @@ def trigger_cashback_reminder_endpoint():
         return f"Error: {e}", 500
 
 
+# === Announcement Dispatcher ===
+ANNOUNCEMENT_CLAIM_RETRY_SECONDS = 5 # After a DB error while claiming
+
+def send_scheduled_announcement(ann_id):
+    """
+    Claims a due announcement and sends it; the claim guarantees that only one process sends it.
+    Returns seconds after which to try this announcement again (not due yet by the DB clock, or the DB failed),
+    or None when there is nothing more to do for it.
+    """
+    status, claimed = db_manager.claim_announcement(ann_id)
+    if status == "not_due":
+        return max(claimed, 0.05)
+    if status == "error":
+        return ANNOUNCEMENT_CLAIM_RETRY_SECONDS
+    if status != "claimed":
+        return None
+    chat_id, message_text = claimed
+    # FIX: Removed double escaping. message_text is already escaped when saved to DB.
+    bot_response = f"\U0001F4E2 **Анонс\\!**\n\n{message_text}"
+    # None means the Telegram call itself failed; bookkeeping errors after a send still return the message_id
+    if telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='scheduled_announcement') is None:
+        db_manager.release_announcement(ann_id) # Picked up again on the next resync
+        logging.error(f"[{datetime.now()}] Announcements: Failed to send announcement ID {ann_id} to chat {chat_id}.")
+        return None
+    logging.info(f"[{datetime.now()}] Announcements: Announcement ID {ann_id} sent to chat {chat_id}.")
+    return None
+
+
+class AnnouncementDispatcher:
+    """
+    Sends announcements at their scheduled time instead of on the next poll.
+    Pending announcements are kept in a heap ordered by due time; the loop sleeps on the LISTEN connection
+    until the earliest one is due or a NOTIFY from the scheduled_announcements insert trigger adds a new one.
+    The DB is re-read after (re)connecting and every `resync_seconds`, so nothing depends on a single notification.
+    """
+    def __init__(self, db, send=send_scheduled_announcement, resync_seconds=300):
+        self.db = db
+        self.send = send
+        self.resync_seconds = resync_seconds
+        self._heap = [] # (due unix time, announcement id)
+        self._queued = set()
+
+    def _push(self, ann_id, due_at):
+        if ann_id not in self._queued:
+            heapq.heappush(self._heap, (due_at, ann_id))
+            self._queued.add(ann_id)
+
+    def reload(self):
+        for ann_id, schedule_datetime in self.db.get_pending_announcements():
+            self._push(ann_id, schedule_datetime.timestamp())
+
+    def _listen(self):
+        conn = self.db._connect() # Dedicated connection: it stays in LISTEN for the dispatcher's lifetime
+        if conn is None:
+            return None
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {ANNOUNCEMENTS_CHANNEL};")
+        logging.info(f"[{datetime.now()}] Announcements: Listening on '{ANNOUNCEMENTS_CHANNEL}'.")
+        return conn
+
+    def _dispatch_due(self):
+        while self._heap and self._heap[0][0] <= time.time():
+            _, ann_id = heapq.heappop(self._heap)
+            self._queued.discard(ann_id)
+            try:
+                retry_in = self.send(ann_id)
+                if retry_in is not None:
+                    self._push(ann_id, time.time() + retry_in)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] Announcements: Error sending announcement ID {ann_id}: {e}", exc_info=True)
+
+    def _wait(self, conn, timeout):
+        if not select.select([conn], [], [], timeout)[0]:
+            return
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            payload = json.loads(notify.payload)
+            self._push(payload["id"], float(payload["at"]))
+            logging.info(f"[{datetime.now()}] Announcements: Notified about announcement ID {payload['id']}.")
+
+    def run(self, stop_event):
+        """Runs until `stop_event` is set; reconnects and reloads after connection errors."""
+        conn = None
+        next_resync = 0.0
+        while not stop_event.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = self._listen()
+                    if conn is None:
+                        stop_event.wait(30)
+                        continue
+                    next_resync = 0.0 # Catch up on anything inserted while we were not listening
+                if time.monotonic() >= next_resync:
+                    self.reload()
+                    next_resync = time.monotonic() + self.resync_seconds
+                self._dispatch_due()
+                timeout = next_resync - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.time())
+                self._wait(conn, max(0.0, min(timeout, 5.0))) # Bounded so stop_event is noticed
+            except (psycopg2.Error, OSError) as e:
+                logging.error(f"[{datetime.now()}] Announcements: Listener connection failed, reconnecting: {e}", exc_info=True)
+                if conn is not None and not conn.closed:
+                    conn.close()
+                conn = None
+                stop_event.wait(5)
+        if conn is not None and not conn.closed:
+            conn.close()
+
+
 # === Scheduler Jobs (Content Generation Functions) ===
 # These functions are called by the scheduler_process.py,
 # which handles idempotency and scheduling logic.
+def run_report_job(send_content, chat_id):
+    """
+    Runs a _send_*_content function for the job queue: errors propagate and an unsent report raises,
+    so the worker records a failed attempt and retries it.
+    """
+    logging.info(f"[{datetime.now()}] Scheduler (main): Running {send_content.__name__} for chat {chat_id}.")
+    if send_content(chat_id, raise_errors=True) is None:
+        raise RuntimeError(f"{send_content.__name__}: message was not sent to chat {chat_id}")
+
 def job_morning(chat_id): # Modified to accept chat_id
-    logging.info(f"[{datetime.now()}] Scheduler (main): Running job_morning content generation.")
-    try:
-        _send_morning_report_content(chat_id)
-        logging.info(f"[{datetime.now()}] Scheduler (main): Morning report content sent.")
-    except Exception as e:
-        logging.error(f"[{datetime.now()}] Scheduler (main): Error in morning report content job: {e}", exc_info=True)
+    run_report_job(_send_morning_report_content, chat_id)
 
 def job_daily(chat_id):
-    logging.info(f"[{datetime.now()}] Scheduler (main): Running job_daily content generation.")
-    try:
-        _send_daily_report_content(chat_id)
-        logging.info(f"[{datetime.now()}] Scheduler (main): Daily report content sent.")
-    except Exception as e:
-        logging.error(f"[{datetime.now()}] Scheduler (main): Error in daily report content job: {e}", exc_info=True)
+    run_report_job(_send_daily_report_content, chat_id)
 
 def job_summary(chat_id):
-    logging.info(f"[{datetime.now()}] Scheduler (main): Running job_summary content generation.")
+    run_report_job(_send_ai_summary_content, chat_id)
+
+def job_update_rolling_summaries():
+    """Folds new messages into the per-chat rolling summaries."""
+    logging.info(f"[{datetime.now()}] Scheduler (main): Updating rolling summaries.")
     try:
-        _send_ai_summary_content(chat_id)
-        logging.info(f"[{datetime.now()}] Scheduler (main): GPT summary content sent.")
+        rolling_summarizer.run_pending()
     except Exception as e:
-        logging.error(f"[{datetime.now()}] Scheduler (main): Error in GPT summary content job: {e}", exc_info=True)
+        logging.error(f"[{datetime.now()}] Scheduler (main): Error updating rolling summaries: {e}", exc_info=True)
 
-def job_send_scheduled_announcements():
-    """Checks DB and sends scheduled announcements if due."""
-    logging.info(f"[{datetime.now()}] Scheduler (main): Checking for scheduled announcements.")
-    announcements_to_send = db_manager.get_scheduled_announcements_to_send()
-    for ann_id, chat_id, message_text in announcements_to_send:
+def job_refill_fact_pool():
+    """Tops up the pre-generated fact pools (runs off-peak)."""
+    logging.info(f"[{datetime.now()}] Scheduler (main): Refilling fact pools.")
+    failed = []
+    for kind in FactPool.KINDS:
         try:
-            # FIX: Removed double escaping. message_text is already escaped when saved to DB.
-            bot_response = f"\U0001F4E2 **Анонс\\!**\n\n{message_text}"
-            telegram_sender.send_and_save_message(chat_id, bot_response, parse_mode="MarkdownV2", bot_message_type='scheduled_announcement')
-            db_manager.mark_announcement_sent(ann_id)
-            logging.info(f"[{datetime.now()}] Scheduler (main): Announcement ID {ann_id} sent to chat {chat_id}.")
+            fact_pool.refill(kind)
         except Exception as e:
-            logging.error(f"[{datetime.now()}] Scheduler (main): Error sending announcement ID {ann_id}: {e}", exc_info=True)
+            logging.error(f"[{datetime.now()}] Scheduler (main): Error refilling '{kind}' fact pool: {e}", exc_info=True)
+            failed.append(kind)
+    if failed:
+        raise RuntimeError(f"Fact pool refill failed for {', '.join(failed)}") # Retried by the job queue
+
+def job_send_scheduled_announcements():
+    """Sends every due announcement once (polling fallback; scheduler_process uses AnnouncementDispatcher)."""
+    logging.info(f"[{datetime.now()}] Scheduler (main): Checking for scheduled announcements.")
+    now_utc = datetime.now(timezone.utc)
+    for ann_id, schedule_datetime in db_manager.get_pending_announcements():
+        if schedule_datetime > now_utc:
+            break
+        send_scheduled_announcement(ann_id)
 
 def job_cashback_reminder():
     logging.info(f"[{datetime.now()}] Scheduler (main): Running job_cashback_reminder content generation.")
@@ -1892,13 +5157,32 @@ def job_monthly_payments_reminder():
 
 
 # === Main Application Entry Point ===
-logging.info(f"[{datetime.now()}] Starting bot and initializing webhook...")
-
-db_manager.create_tables()
-
-set_webhook_with_retries()
-logging.info(f"[{datetime.now()}] Flask app configured to handle Gunicorn.")
-
-logging.info(f"[{datetime.now()}] Number of registered message_handlers: 0 (handled by direct webhook processing)")
-logging.info(f"[{datetime.now()}] Кількість зареєстрованих callback_query_handlers: 0")
+def start_background_services():
+    """Startup shared by every long-running process that sends or saves messages: bot identity, message write buffer."""
+    bot_identity.refresh()
+    if Config.MESSAGE_WRITE_BUFFER_ENABLED:
+        db_manager.enable_write_buffer(
+            Config.MESSAGE_WRITE_BATCH_SIZE,
+            Config.MESSAGE_WRITE_FLUSH_INTERVAL_MS,
+            Config.MESSAGE_WRITE_MAX_PENDING,
+            Config.MESSAGE_WRITE_SPILL_DIR
+        )
+
+def start_webhook_service(start_update_workers=True):
+    """Startup of a webhook server: schema, background services, idempotency cache cleaner, webhook registration."""
+    logging.info(f"[{datetime.now()}] Starting bot and initializing webhook...")
+    db_manager.create_tables()
+    start_background_services()
+    start_cache_cleaner()
+    if start_update_workers: # The ASGI app processes updates on its event loop instead
+        update_dispatcher.start()
+    set_webhook_with_retries()
+
+# Importing main must not reconfigure the live bot: only the Flask web process starts it here
+if Config.PROCESS_ROLE == "web":
+    start_webhook_service()
+    logging.info(f"[{datetime.now()}] Flask app configured to handle Gunicorn.")
+
+    logging.info(f"[{datetime.now()}] Number of registered message_handlers: 0 (handled by direct webhook processing)")
+    logging.info(f"[{datetime.now()}] Кількість зареєстрованих callback_query_handlers: 0")
 
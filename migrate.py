@@ -0,0 +1,42 @@
+# migrate.py
+# Застосовує міграції схеми БД (DB_MIGRATIONS з main.py) та перевіряє плани гарячих запитів.
+#
+# Використання:
+#   python migrate.py            # створити таблиці та застосувати нові міграції
+#   python migrate.py --explain  # додатково показати, які індекси використовує планувальник
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+os.environ["BOT_PROCESS"] = "cli" # Importing main must not touch the webhook or start background threads
+
+try:
+    from main import db_manager
+except ImportError as e:
+    logging.critical(f"[{datetime.now()}] CRITICAL: Failed to import necessary components from main.py: {e}")
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check query plans.")
+    parser.add_argument("--explain", action="store_true", help="Run EXPLAIN on hot queries and report index usage.")
+    args = parser.parse_args()
+
+    db_manager.create_tables() # Also applies pending migrations
+    if args.explain:
+        results = db_manager.explain_hot_queries()
+        for query_name, result in results.items():
+            status = "OK" if result["uses_expected_index"] else "NOT USED"
+            print(f"{query_name}: {status} (expected {result['expected']}, plan uses {result['indexes'] or 'seq scan'})")
+        if results and not all(r["uses_expected_index"] for r in results.values()):
+            sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,19 @@
 # scheduler_process.py
 # Цей файл містить логіку запуску планувальника.
+# Заплановані задачі ставляться в чергу job_queue у БД і виконуються пулом потоків.
+# Можна запускати кілька таких процесів одночасно: рядок черги забирає лише один воркер
+# (SELECT ... FOR UPDATE SKIP LOCKED), а зроблені запуски фіксуються в scheduled_job_executions_v2.
+# Звіти з chat_subscriptions розсилаються в усі підписані чати: одна задача на звіт і момент часу.
 
-import schedule
-import time
+import concurrent.futures
+import contextlib
 import logging
-from datetime import datetime, timedelta
 import os
+import socket
 import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 
 # Налаштування логування для окремого процесу планувальника
 logging.basicConfig(level=logging.INFO,
@@ -15,10 +22,14 @@ logging.basicConfig(level=logging.INFO,
 # !!! Важливо: Імпортуємо необхідні функції та об'єкти з main.py
 # Це дозволить scheduler_process.py використовувати вже існуючі функції
 # без дублювання коду.
+# Вебхук цей процес не чіпає: main лише оголошує об'єкти, потрібне запускаємо нижче самі.
+os.environ["BOT_PROCESS"] = "scheduler"
 try:
     from main import (
         db_manager, Config, # Import Config class
-        job_morning, job_summary, job_daily, job_send_scheduled_announcements,
+        job_morning, job_summary, job_daily, job_update_rolling_summaries, AnnouncementDispatcher, run_report_job,
+        job_refill_fact_pool, wordcloud_renderer, telegram_sender, TelegramRateLimiter, start_background_services,
+        report_fanout, subscription_run_at,
         _send_random_fact_content,
         _send_ukrainian_history_fact_content,
         _send_cashback_reminder_content,
@@ -38,86 +49,258 @@ if not DATABASE_URL:
 
 db_manager.database_url = DATABASE_URL # Переконаємося, що URL встановлено коректно
 db_manager.create_tables() # Створити таблиці, якщо їх немає (ідємпотентна операція)
+start_background_services() # Ідентичність бота та буфер запису повідомлень
+
+# Розсилка з цього процесу йде в десятки чатів, тож тримаємося лімітів Telegram
+telegram_sender.rate_limiter = TelegramRateLimiter(
+    global_per_second=Config.TELEGRAM_GLOBAL_MESSAGES_PER_SECOND,
+    private_chat_interval_seconds=Config.TELEGRAM_PRIVATE_CHAT_INTERVAL_SECONDS,
+    group_chat_interval_seconds=Config.TELEGRAM_GROUP_CHAT_INTERVAL_SECONDS
+)
+
+# Щоденний звіт рендериться тут: імпортуємо wordcloud і завантажуємо шрифт/маску заздалегідь, а не під час звіту
+try:
+    wordcloud_renderer.preload()
+except Exception as e:
+    logging.error(f"[{datetime.now()}] Scheduler: Failed to preload wordcloud renderer: {e}", exc_info=True)
+
+
+def is_first_day_of_month(day):
+    return day.day == 1
+
+def is_last_day_of_month(day):
+    return (day + timedelta(days=1)).day == 1
+
+
+# Handlers that can be queued; each takes the target chat_id and raises on failure, so the job is retried.
+# The key is stored in job_queue.handler.
+JOB_HANDLERS = {
+    "job_morning": job_morning,
+    "job_summary": job_summary,
+    "job_daily": job_daily,
+    "send_random_fact": lambda chat_id: run_report_job(_send_random_fact_content, chat_id),
+    "send_ukrainian_history_fact": lambda chat_id: run_report_job(_send_ukrainian_history_fact_content, chat_id),
+    "job_cashback_reminder": lambda chat_id: run_report_job(_send_cashback_reminder_content, chat_id),
+    "job_monthly_payments_reminder": lambda chat_id: run_report_job(_send_monthly_payments_reminder_content, chat_id),
+    "job_refill_fact_pool": lambda chat_id: job_refill_fact_pool(),
+}
 
-def scheduled_job_wrapper(job_func, job_name_base, slot_name=None, check_condition=None):
+# Daily slots, all times in UTC: (job_name_base, slot, "HH:MM", handler, condition(day) or None).
+# job_name_base + slot form the same job_name as before, so scheduled_job_executions_v2 history still counts.
+DAILY_JOBS = [
+    ("job_morning", None, "05:45", "job_morning", None),                                   # 08:45 Kyiv time
+    ("job_summary", None, "20:00", "job_summary", None),                                   # 23:00 Kyiv time
+    ("job_daily", None, "20:20", "job_daily", None),                                       # 23:20 Kyiv time
+    # Random facts (morning and evening)
+    ("send_random_fact", "morning", "07:30", "send_random_fact", None),                    # 10:30 Kyiv time
+    ("send_random_fact", "evening", "17:00", "send_random_fact", None),                    # 20:00 Kyiv time
+    # Ukrainian historical facts (morning and afternoon)
+    ("send_ukrainian_history_fact", "morning_ukraine_fact", "10:00", "send_ukrainian_history_fact", None),    # 13:00 Kyiv time
+    ("send_ukrainian_history_fact", "afternoon_ukraine_fact", "18:30", "send_ukrainian_history_fact", None), # 21:30 Kyiv time
+    # Monthly cashback reminder (1st of month) and payments reminder (last day of month)
+    ("job_cashback_reminder", None, "05:00", "job_cashback_reminder", is_first_day_of_month),                         # 08:00 Kyiv time
+    ("job_monthly_payments_reminder", "last_day_of_month", "18:00", "job_monthly_payments_reminder", is_last_day_of_month), # 21:00 Kyiv time
+    # Off-peak batch generation of the facts sent above; the send jobs only take one from the DB
+    ("job_refill_fact_pool", None, Config.FACT_POOL_REFILL_TIME_UTC, "job_refill_fact_pool", None),
+]
+
+# Legacy DAILY_JOBS handlers that have a fan-out report type: once GROUP_REPORT_CHAT_ID subscribes
+# to that type, the subscription replaces the hard-coded slot so the chat does not get it twice.
+LEGACY_REPORT_TYPES = {
+    "job_morning": "morning",
+    "job_summary": "summary",
+    "job_daily": "daily",
+    "send_random_fact": "random_fact",
+    "send_ukrainian_history_fact": "ukrainian_history_fact",
+}
+
+# job_queue.handler of a fan-out run is this prefix + report_type
+FANOUT_HANDLER_PREFIX = "fanout:"
+
+# Periodic maintenance jobs: (name, interval in seconds, func). They are idempotent, so each process
+# runs them on its own timer; an advisory lock only keeps two processes from running one at the same time.
+INTERVAL_JOBS = [
+    # Fold new messages into per-chat rolling summaries (every N messages, checked periodically)
+    ("job_update_rolling_summaries", Config.ROLLING_SUMMARY_POLL_MINUTES * 60, job_update_rolling_summaries),
+]
+
+PLANNER_INTERVAL_SECONDS = 60
+COMPLETE_JOB_RETRIES = 5
+
+
+def plan_jobs(now=None):
     """
-    Generic wrapper for scheduled jobs to handle idempotency and conditional execution.
-
-    Args:
-        job_func (callable): The actual function to execute (e.g., _send_random_fact_content).
-        job_name_base (str): Base name for the job (used for DB idempotency).
-        slot_name (str, optional): Specific slot for the job (e.g., "morning", "evening").
-                                   Forms part of the unique job name in DB.
-        check_condition (callable, optional): A function that returns True if the job should run,
-                                              False otherwise. Takes no arguments.
+    Queues today's daily slots and today's chat_subscriptions fan-out runs. Future slots wait in the queue;
+    slots missed while no worker was running are caught up if they are less than JOB_CATCH_UP_HOURS late.
+    Runs in every process; duplicates are no-ops.
     """
-    logging.info(f"[{datetime.now()}] Scheduler: Running wrapper for '{job_name_base}' (slot: {slot_name}).")
-    today_utc = datetime.utcnow().date()
+    now = now or datetime.now(timezone.utc)
+    today = now.date()
+    end_of_day = datetime.combine(today + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+    catch_up = timedelta(hours=Config.JOB_CATCH_UP_HOURS)
+    subscriptions = db_manager.get_chat_subscriptions()
+    group_subscribed_types = {sub["report_type"] for sub in subscriptions if sub["chat_id"] == Config.GROUP_REPORT_CHAT_ID}
 
-    if check_condition and not check_condition():
-        logging.info(f"[{datetime.now()}] Scheduler: Skipping '{job_name_base}' (slot: {slot_name}) due to check condition.")
-        return
+    for job_name_base, slot, at, handler, condition in DAILY_JOBS:
+        if condition and not condition(today):
+            continue
+        if LEGACY_REPORT_TYPES.get(handler) in group_subscribed_types:
+            continue
+        hour, minute = map(int, at.split(":"))
+        run_at = datetime.combine(today, datetime.min.time(), tzinfo=timezone.utc).replace(hour=hour, minute=minute)
+        # Handlers report on "today", so a run is never carried over into the next UTC day
+        expires_at = min(run_at + catch_up, end_of_day)
+        if expires_at <= now:
+            continue
+        job_name = f"{job_name_base}_{slot}" if slot else job_name_base
+        db_manager.enqueue_job(job_name, handler, today, run_at, expires_at, max_attempts=Config.JOB_MAX_ATTEMPTS)
+
+    # One fan-out run per report type and UTC moment, however many chats share it
+    for report_type, run_at in subscription_slots(subscriptions, today):
+        expires_at = min(run_at + catch_up, end_of_day)
+        if expires_at <= now:
+            continue
+        db_manager.enqueue_job(f"fanout_{report_type}_{run_at:%H%M}", f"{FANOUT_HANDLER_PREFIX}{report_type}", today, run_at, expires_at, max_attempts=Config.JOB_MAX_ATTEMPTS)
+    db_manager.expire_jobs()
 
-    if not db_manager.record_job_execution(job_name_base, today_utc, slot=slot_name):
-        logging.info(f"[{datetime.now()}] Report: Skipping '{job_name_base}' (slot: {slot_name}) as it was already executed today.")
-        return
 
+def subscription_slots(subscriptions, day):
+    """(report_type, UTC run_at) pairs falling on the UTC date `day` for the given subscriptions."""
+    slots = set()
+    for sub in subscriptions:
+        if sub["report_type"] not in report_fanout.reports:
+            logging.warning(f"[{datetime.now()}] Scheduler: Unknown report type '{sub['report_type']}' subscribed by chat {sub['chat_id']}.")
+            continue
+        # A local date can start on the previous UTC day or end on the next one
+        for local_date in (day - timedelta(days=1), day, day + timedelta(days=1)):
+            try:
+                run_at = subscription_run_at(sub["local_time"], sub["timezone"], local_date)
+            except Exception as e:
+                logging.error(f"[{datetime.now()}] Scheduler: Bad subscription of chat {sub['chat_id']} to '{sub['report_type']}': {e}")
+                break
+            if run_at.date() == day:
+                slots.add((sub["report_type"], run_at))
+    return sorted(slots)
+
+
+@contextlib.contextmanager
+def lease_heartbeat(job, worker_id):
+    """Keeps extending the job's lease while it runs, so a long job is not claimed and run by a second worker."""
+    stop = threading.Event()
+    interval = max(1, Config.JOB_LEASE_SECONDS / 3)
+
+    def beat():
+        while not stop.wait(interval):
+            if not db_manager.extend_job_lease(job["id"], worker_id, Config.JOB_LEASE_SECONDS):
+                logging.warning(f"[{datetime.now()}] Scheduler: Could not extend the lease of '{job['job_name']}'.")
+
+    thread = threading.Thread(target=beat, name=f"lease-{job['id']}", daemon=True)
+    thread.start()
     try:
-        job_func(Config.GROUP_REPORT_CHAT_ID) # Pass GROUP_REPORT_CHAT_ID to the content function
-        logging.info(f"[{datetime.now()}] Scheduler: Job '{job_name_base}' (slot: {slot_name}) executed successfully.")
-    except Exception as e:
-        logging.error(f"[{datetime.now()}] Scheduler: Error in job '{job_name_base}' (slot: {slot_name}): {e}", exc_info=True)
-
-
-# NEW: Wrapper for job_cashback_reminder to handle idempotency
-def job_cashback_reminder_wrapper():
-    """Wrapper for cashback reminder, runs only on the first day of the month."""
-    today_utc = datetime.utcnow().date()
-    def is_first_day_of_month():
-        return today_utc.day == 1
-    scheduled_job_wrapper(_send_cashback_reminder_content, "job_cashback_reminder", check_condition=is_first_day_of_month)
-
-
-# NEW: Wrapper for job_monthly_payments_reminder to handle idempotency and last day logic
-def job_monthly_payments_reminder_wrapper():
-    """Wrapper for monthly payments reminder, runs only on the last day of the month."""
-    today_utc = datetime.utcnow().date()
-    def is_last_day_of_month():
-        if today_utc.month == 12:
-            next_month_first_day = today_utc.replace(year=today_utc.year + 1, month=1, day=1)
-        else:
-            next_month_first_day = today_utc.replace(month=today_utc.month + 1, day=1)
-        last_day_of_current_month = next_month_first_day - timedelta(days=1)
-        return today_utc == last_day_of_current_month
-    scheduled_job_wrapper(_send_monthly_payments_reminder_content, "job_monthly_payments_reminder", slot_name="last_day_of_month", check_condition=is_last_day_of_month)
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish_job(job):
+    """
+    Marks a job done, retrying while the DB is unavailable. The run is recorded in scheduled_job_executions_v2
+    first, so if the row still cannot be closed, the next claim sees the record and completes it without re-running.
+    """
+    db_manager.record_job_execution(job["job_name"], job["execution_date"])
+    for attempt in range(COMPLETE_JOB_RETRIES):
+        if db_manager.complete_job(job["id"], job["job_name"], job["execution_date"]):
+            return True
+        time.sleep(Config.JOB_POLL_SECONDS * 2 ** attempt)
+    logging.error(f"[{datetime.now()}] Scheduler: Could not mark '{job['job_name']}' done; its execution record prevents a re-run.")
+    return False
+
+
+def run_claimed_job(job, worker_id):
+    """Runs one claimed job and records success, a retry, or the final failure."""
+    if db_manager.has_job_executed_today(job["job_name"], job["execution_date"]):
+        # An earlier attempt ran it but could not mark the row done
+        finish_job(job)
+        return
+    logging.info(f"[{datetime.now()}] Scheduler: {worker_id} running '{job['job_name']}' for {job['execution_date']} (attempt {job['attempts']}/{job['max_attempts']}).")
+    handler = JOB_HANDLERS.get(job["handler"])
+    with lease_heartbeat(job, worker_id):
+        try:
+            if job["handler"].startswith(FANOUT_HANDLER_PREFIX):
+                # slot_at, not run_at: a retry's run_at is moved by fail_job, the recipients are found by the planned slot
+                report_fanout.run(job["handler"][len(FANOUT_HANDLER_PREFIX):], job["slot_at"] or job["run_at"])
+            elif handler is None:
+                raise LookupError(f"Unknown job handler '{job['handler']}'")
+            else:
+                handler(Config.GROUP_REPORT_CHAT_ID) # Pass GROUP_REPORT_CHAT_ID to the content function
+        except Exception as e:
+            retry_delay = Config.JOB_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+            status = db_manager.fail_job(job["id"], repr(e), retry_delay)
+            logging.error(f"[{datetime.now()}] Scheduler: Job '{job['job_name']}' failed ({status}, retry in {retry_delay}s if pending): {e}", exc_info=True)
+            return
+        if finish_job(job):
+            logging.info(f"[{datetime.now()}] Scheduler: Job '{job['job_name']}' executed successfully.")
+
+
+def worker_loop(worker_id, stop_event):
+    """Claims and runs due jobs until stopped; sleeps JOB_POLL_SECONDS when the queue is empty."""
+    while not stop_event.is_set():
+        try:
+            job = db_manager.claim_job(worker_id, Config.JOB_LEASE_SECONDS)
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Scheduler: {worker_id} failed to claim a job: {e}", exc_info=True)
+            job = None
+        if job is None:
+            stop_event.wait(Config.JOB_POLL_SECONDS)
+            continue
+        run_claimed_job(job, worker_id)
+
+
+def run_locked(name, func):
+    """Runs a maintenance job unless another process is running it right now."""
+    with db_manager.try_advisory_lock(name) as acquired:
+        if not acquired:
+            logging.info(f"[{datetime.now()}] Scheduler: Skipping '{name}', another process is running it.")
+            return
+        try:
+            func()
+        except Exception as e:
+            logging.error(f"[{datetime.now()}] Scheduler: Error in '{name}': {e}", exc_info=True)
 
 
 def run_schedule():
-    """Configures and runs the scheduler jobs."""
-    # All times are in UTC
-    schedule.every().day.at("05:45").do(scheduled_job_wrapper, job_morning, "job_morning")            # 08:45 Kyiv time
-    schedule.every().day.at("20:00").do(scheduled_job_wrapper, job_summary, "job_summary")            # 23:00 Kyiv time
-    schedule.every().day.at("20:20").do(scheduled_job_wrapper, job_daily, "job_daily")              # 23:20 Kyiv time
-
-    # Schedule for random facts (morning and evening)
-    schedule.every().day.at("07:30").do(scheduled_job_wrapper, _send_random_fact_content, "send_random_fact", slot_name="morning")       # 10:30 Kyiv time
-    schedule.every().day.at("17:00").do(scheduled_job_wrapper, _send_random_fact_content, "send_random_fact", slot_name="evening")       # 20:00 Kyiv time
-
-    # Schedule for Ukrainian historical facts (morning and afternoon)
-    schedule.every().day.at("10:00").do(scheduled_job_wrapper, _send_ukrainian_history_fact_content, "send_ukrainian_history_fact", slot_name="morning_ukraine_fact") # 13:00 Kyiv time
-    schedule.every().day.at("18:30").do(scheduled_job_wrapper, _send_ukrainian_history_fact_content, "send_ukrainian_history_fact", slot_name="afternoon_ukraine_fact") # 21:30 Kyiv time
-
-    # Schedule for monthly cashback reminder (runs daily, but logic inside wrapper checks for 1st of month)
-    schedule.every().day.at("05:00").do(job_cashback_reminder_wrapper) # 05:00 UTC (08:00 Kyiv time)
-
-    # Schedule for monthly payments reminder (runs daily, but logic inside wrapper checks for last day of month)
-    schedule.every().day.at("18:00").do(job_monthly_payments_reminder_wrapper) # 18:00 UTC (21:00 Kyiv time)
-
-    schedule.every(5).minutes.do(job_send_scheduled_announcements) # Check announcements every 5 minutes
-    logging.info(f"[{datetime.now()}] Scheduler: Scheduler started. Jobs configured.")
-    while True:
-        schedule.run_pending()
-        time.sleep(30) # Check every 30 seconds for pending jobs
+    """Starts the queue workers and runs the planner and maintenance timers in the main thread."""
+    process_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = threading.Event()
+    workers = concurrent.futures.ThreadPoolExecutor(max_workers=Config.JOB_WORKER_THREADS, thread_name_prefix="job-worker")
+    for i in range(Config.JOB_WORKER_THREADS):
+        workers.submit(worker_loop, f"{process_id}/{i}", stop_event)
+    # Announcements go out at their exact minute; claims keep several scheduler processes from double-sending
+    announcement_dispatcher = AnnouncementDispatcher(db_manager, resync_seconds=Config.ANNOUNCEMENT_RESYNC_SECONDS)
+    threading.Thread(target=announcement_dispatcher.run, args=(stop_event,), name="announcement-dispatcher", daemon=True).start()
+    logging.info(f"[{datetime.now()}] Scheduler: {Config.JOB_WORKER_THREADS} queue worker(s) started as {process_id}. Jobs configured.")
+
+    next_interval_run = {name: time.monotonic() for name, _, _ in INTERVAL_JOBS}
+    next_plan = 0.0
+    try:
+        while True:
+            if time.monotonic() >= next_plan:
+                try:
+                    plan_jobs()
+                except Exception as e:
+                    logging.error(f"[{datetime.now()}] Scheduler: Error planning jobs: {e}", exc_info=True)
+                next_plan = time.monotonic() + PLANNER_INTERVAL_SECONDS
+
+            for name, interval, func in INTERVAL_JOBS:
+                if time.monotonic() >= next_interval_run[name]:
+                    next_interval_run[name] = time.monotonic() + interval
+                    run_locked(name, func)
+
+            time.sleep(1)
+    finally:
+        stop_event.set()
+        workers.shutdown(wait=True)
 
 if __name__ == "__main__":
     logging.info(f"[{datetime.now()}] Dedicated scheduler process started.")
@@ -0,0 +1,89 @@
+# subscriptions.py
+# Керування підписками чатів на заплановані звіти (таблиця chat_subscriptions).
+# Планувальник (scheduler_process.py) розсилає кожен звіт усім підписаним чатам у їхній місцевий час.
+#
+# Використання:
+#   python subscriptions.py list [--report morning]
+#   python subscriptions.py add -1001234567890 morning 08:45 [--timezone Europe/Kyiv]
+#   python subscriptions.py disable -1001234567890 morning 08:45   # enable — увімкнути знову; часовий пояс не змінюється
+#   python subscriptions.py remove -1001234567890 morning [08:45]
+#
+# Типи звітів: morning, daily, summary, random_fact, ukrainian_history_fact (див. FANOUT_REPORTS у main.py).
+
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+os.environ["BOT_PROCESS"] = "cli" # Importing main must not touch the webhook or start background threads
+
+try:
+    from main import db_manager, Config, FANOUT_REPORTS
+except ImportError as e:
+    logging.critical(f"[{datetime.now()}] CRITICAL: Failed to import necessary components from main.py: {e}")
+    sys.exit(1)
+
+
+def parse_local_time(value):
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected HH:MM, got '{value}'")
+
+
+def parse_timezone(value):
+    try:
+        ZoneInfo(value)
+    except Exception:
+        raise argparse.ArgumentTypeError(f"unknown timezone '{value}'")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage per-chat subscriptions to scheduled reports.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="Show subscriptions, including disabled ones.")
+    list_parser.add_argument("--report", choices=sorted(FANOUT_REPORTS))
+
+    add_parser = commands.add_parser("add", help="Subscribe a chat to a report at a local time (or change its timezone).")
+    add_parser.add_argument("chat_id", type=int)
+    add_parser.add_argument("report_type", choices=sorted(FANOUT_REPORTS))
+    add_parser.add_argument("local_time", type=parse_local_time, help="HH:MM in the chat's timezone")
+    add_parser.add_argument("--timezone", type=parse_timezone, default=Config.DEFAULT_SUBSCRIPTION_TIMEZONE)
+
+    for command in ("enable", "disable"):
+        command_parser = commands.add_parser(command, help=f"{command.capitalize()} an existing subscription; its timezone is kept.")
+        command_parser.add_argument("chat_id", type=int)
+        command_parser.add_argument("report_type", choices=sorted(FANOUT_REPORTS))
+        command_parser.add_argument("local_time", type=parse_local_time, help="HH:MM in the chat's timezone")
+
+    remove_parser = commands.add_parser("remove", help="Delete a chat's subscription (all times unless one is given).")
+    remove_parser.add_argument("chat_id", type=int)
+    remove_parser.add_argument("report_type", choices=sorted(FANOUT_REPORTS))
+    remove_parser.add_argument("local_time", type=parse_local_time, nargs="?")
+
+    args = parser.parse_args()
+    db_manager.create_tables() # Also applies pending migrations
+
+    if args.command == "list":
+        for sub in db_manager.get_chat_subscriptions(args.report, include_disabled=True):
+            state = "" if sub["enabled"] else " (disabled)"
+            print(f"{sub['chat_id']}\t{sub['report_type']}\t{sub['local_time']:%H:%M} {sub['timezone']}{state}")
+    elif args.command == "add":
+        if not db_manager.subscribe_chat(args.chat_id, args.report_type, args.local_time, args.timezone):
+            sys.exit(1)
+    elif args.command in ("enable", "disable"):
+        if not db_manager.set_subscription_enabled(args.chat_id, args.report_type, args.local_time, enabled=args.command == "enable"):
+            sys.exit(1)
+    else:
+        print(f"Removed {db_manager.unsubscribe_chat(args.chat_id, args.report_type, args.local_time)} subscription(s).")
+
+
+if __name__ == "__main__":
+    main()
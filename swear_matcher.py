@@ -0,0 +1,80 @@
+# swear_matcher.py
+# Лічильник матюків: усі шаблони компілюються один раз, повідомлення проходить один прохід по словах.
+
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Regular expressions for swear words
+SWEAR_WORDS_REGEX_PATTERNS = [
+    r'\bбл[яя]ть\b', r'\bху[ййиюяе]\b', r'\bп[іие]зд[ауеоіиь]\b',
+    r'\b[їие]б[аеи][тть]\b', r'\bсук[ауоие]\b', r'\bнаху[йяею]\b',
+    r'\bдрищ[іауое]?\b', r'\bкурв[ауоие]\b', r'\bг[іи]мн[оауе]\b',
+    r'\bлайн[оауое]\b', r'\bпадл[оауе]\b', r'\bганд[оо]н[ауоие]?\b',
+    r'\bмуд[аа]к[ауоие]?\b', r'\bвирод[оо]к[ауоие]?\b', r'\bсвол[оо]т[ауоие]\b',
+    r'\bгнид[ауоие]\b', r'\b[іие]д[іи][оо]т[ауоие]?\b', r'\bбовдур[ауоие]?\b',
+    r'\bп[іи]дор[ауоие]?\b', r'\bху[ййи]л[оауе]\b', r'\bпут[іи]н[ауоие]?\b',
+    r'\bп[ее][тту]ш[аа]р[уоие]\b', r'\bху[ййи]н[яяею]\b', r'\bд[ии][бб][іи]л[ауоие]?\b',
+    r'\bдаун[ауоие]?\b', r'\b[їие]бал[оауое]\b', r'\bза[їие]б[аа]в[ауоие]?\b',
+    r'\bза[їие]бал[оауое]\b', r'\bп[іи]зд[ее]ць\b', r'\bєб[аи][тть]\b',
+    r'\bйо[ба]ний?\b', r'\bтрах[аеи][тть]\b', r'\bшмар[ауоие]\b',
+    r'\bдристун[ауоие]?\b', r'\bчмо[шн]?[ик]?\b', r'\bлох[ауоие]?\b',
+    r'\bмуд[іи]л[оауое]\b', r'\bгандош[ауоие]\b', r'\bхер[ауоие]?\b',
+    r'\b[ауоие]ху[ййиюяе]\b', r'\b[їие]бан[ауоие][ауоие]?\b',
+    r'\b[їие]буч[ийаео]\b', r'\bбляха\b'
+]
+
+
+class SwearWordMatcher:
+    """
+    Counts swear-word hits in a message in a single pass.
+
+    Every pattern is a whole word (`\b...\b` around word characters only), so a pattern
+    can only ever match a complete token. The message is therefore split into tokens once,
+    each distinct token is checked against one combined alternation, and only the rare
+    tokens that match are resolved to the individual patterns. Results per token are cached,
+    so repeated words cost a dict lookup. Counts are identical to running `re.findall`
+    for every pattern separately.
+    """
+    _token_re = re.compile(r'\w+')
+    _punctuation_re = re.compile(r'[^\w\s]')
+
+    def __init__(self, patterns, token_cache_size=4096):
+        self.patterns = list(patterns)
+        self._compiled = [re.compile(self._strip_boundaries(p)) for p in self.patterns]
+        self._combined = re.compile("|".join(f"(?:{self._strip_boundaries(p)})" for p in self.patterns))
+        self._token_hits = lru_cache(maxsize=token_cache_size)(self._match_token)
+
+    @staticmethod
+    def _strip_boundaries(pattern):
+        """Turns r'\bxxx\b' into 'xxx'; tokens are matched with fullmatch instead."""
+        if not (pattern.startswith(r'\b') and pattern.endswith(r'\b')):
+            raise ValueError(f"Swear pattern must be a whole word wrapped in \\b: {pattern!r}")
+        return pattern[2:-2]
+
+    @classmethod
+    def normalize(cls, text):
+        """Lowercases the text and strips punctuation (same normalization as the old per-pattern loop)."""
+        return cls._punctuation_re.sub('', text.lower())
+
+    def _match_token(self, token):
+        """Returns the indices of all patterns matching the token."""
+        if not self._combined.fullmatch(token):
+            return ()
+        return tuple(i for i, compiled in enumerate(self._compiled) if compiled.fullmatch(token))
+
+    def count(self, text):
+        """Returns the total number of swear-word hits in the text."""
+        if not text:
+            return 0
+        return sum(len(self._token_hits(token)) for token in self._token_re.findall(self.normalize(text)))
+
+    def breakdown(self, text):
+        """Returns a Counter of hits per pattern (only patterns that matched)."""
+        hits = Counter()
+        if not text:
+            return hits
+        for token in self._token_re.findall(self.normalize(text)):
+            for index in self._token_hits(token):
+                hits[self.patterns[index]] += 1
+        return hits
@@ -0,0 +1,158 @@
+# wordcloud_renderer.py
+# Рендер хмари слів для щоденного звіту: WordCloud.to_image() кодується одразу в PNG/WebP,
+# без matplotlib (plt.figure/imshow/savefig) і без повторної растеризації.
+# wordcloud та Pillow імпортуються ліниво при першому рендері (або в preload()), шрифт і маска завантажуються один раз.
+# Модуль не має побічних ефектів при імпорті, тому його можна використовувати з бенчмарків.
+
+import io
+import logging
+import os
+import random
+import re
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Telegram shows photos at most 1280 px on the long side and recompresses anything larger,
+# so rendering above that only costs time and upload bytes.
+TELEGRAM_PHOTO_MAX_SIDE = 1280
+
+# Viridis-like palette, so the default colors stay the same without matplotlib's colormap lookup
+DEFAULT_PALETTE = ("#440154", "#482878", "#3e4989", "#31688e", "#26828e", "#1f9e89", "#35b779", "#6ece58", "#b5de2b")
+
+IMAGE_FORMATS = {
+    "PNG": {"extension": "png", "save_kwargs": {"compress_level": 6}},
+    "WEBP": {"extension": "webp", "save_kwargs": {"quality": 90, "method": 4}},
+}
+
+# Same token pattern WordCloud.process_text uses
+WORD_PATTERN = re.compile(r"\w[\w']+")
+
+# Typographic apostrophes (’ ʼ `) are folded into ' so "пам’ять" and "пам'ять" count as one word
+APOSTROPHES = "’ʼ`"
+APOSTROPHE_TABLE = str.maketrans(APOSTROPHES, "'" * len(APOSTROPHES))
+
+# Службові слова, займенники та розмовні частки, які нічого не кажуть про тему розмови.
+# Також використовується тригером word_freq (таблиця word_freq_stop_words синхронізується при старті).
+UKRAINIAN_STOP_WORDS = frozenset("""
+    але або аби адже аж акий ану атож без біля більш більше буде будемо будете будеш буду будуть був була були було бути
+    вам вас весь вже взагалі ви від він вона вони воно всі все всього втім вся де дещо для до дуже думаю його її їм їх
+    кажу каже коли кого кому котрий крім куди лише мабуть між мене мені мною може можна можу мої мій моя моє
+    навіть навіщо над нам нас наче наш наша наше наші нема немає нехай неї нього них нею ним ними ніби ніж нічого ну
+    обоє однак окрім оце отже отож поки після потім при про просто проте раз разом років сам сама саме самі свій своє
+    своя свої себе собі собою справді так така таке також такий такі там твій твоя твоє твої тебе тобі тобою теж тепер
+    тим тими тих того тоді той тому тут хоча хоч хто це цей ці цим цими цих цього цьому чей через чи чим чого чому
+    щоб щось як яка який яке які якщо якби якось ото ага угу окей типу знаєш знаю зараз щас треба
+""".split())
+
+
+def normalize_word(word):
+    """Lowercase with apostrophes unified; the same normalization the word_freq trigger applies in SQL."""
+    return word.lower().translate(APOSTROPHE_TABLE).strip("'")
+
+
+class WordFrequencyCounter:
+    """
+    Counts words incrementally with bounded memory: once more than 2 * `max_words` distinct words
+    are held, the rare tail is pruned back to the `max_words` most common ones.
+    A wordcloud only draws the top couple of hundred words, so pruning does not change the picture.
+    """
+    def __init__(self, max_words=5000, min_word_length=4, stop_words=()):
+        self.max_words = max_words
+        self.min_word_length = min_word_length
+        self.stop_words = frozenset(normalize_word(word) for word in stop_words)
+        self.counts = Counter()
+
+    def add(self, word):
+        word = normalize_word(word)
+        if len(word) < self.min_word_length or word in self.stop_words or not WORD_PATTERN.fullmatch(word):
+            return
+        self.counts[word] += 1
+        if len(self.counts) > 2 * self.max_words:
+            self.counts = Counter(dict(self.counts.most_common(self.max_words)))
+
+    def add_text(self, text):
+        for word in WORD_PATTERN.findall(text):
+            self.add(word)
+
+    def frequencies(self):
+        return dict(self.counts.most_common(self.max_words))
+
+
+class WordCloudRenderer:
+    """
+    Renders texts into an in-memory image ready for send_photo. One configured WordCloud is reused
+    between renders (guarded by a lock), with the font path resolved and the mask decoded only once.
+    """
+    def __init__(self, width=800, height=400, image_format="PNG",
+                 font_path=None, mask_path=None, min_word_length=4, background_color="white", palette=DEFAULT_PALETTE):
+        image_format = image_format.upper()
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported wordcloud image format: {image_format} (expected one of {', '.join(IMAGE_FORMATS)})")
+        scale = min(1.0, TELEGRAM_PHOTO_MAX_SIDE / max(width, height))
+        self.width = int(width * scale)
+        self.height = int(height * scale)
+        self.image_format = image_format
+        self.font_path = font_path
+        self.mask_path = mask_path
+        self.min_word_length = min_word_length
+        self.background_color = background_color
+        self.palette = palette
+        self._wordcloud = None
+        self._lock = threading.RLock() # render() holds it while preload() may take it again
+
+    def _color_func(self, word, font_size, position, orientation, random_state=None, **kwargs):
+        return (random_state or random).choice(self.palette)
+
+    def _load_mask(self):
+        import numpy as np
+        from PIL import Image
+        with Image.open(self.mask_path) as mask_image:
+            mask = np.array(mask_image.convert("L"))
+        # WordCloud derives the canvas from the mask, so keep it within Telegram's size as well
+        if max(mask.shape) > TELEGRAM_PHOTO_MAX_SIDE:
+            with Image.fromarray(mask) as mask_image:
+                mask_image.thumbnail((TELEGRAM_PHOTO_MAX_SIDE, TELEGRAM_PHOTO_MAX_SIDE))
+                mask = np.array(mask_image)
+        return mask
+
+    def preload(self):
+        """Imports the backend and builds the WordCloud (font, mask) ahead of the first render."""
+        with self._lock:
+            if self._wordcloud is not None:
+                return self._wordcloud
+            from wordcloud import WordCloud
+            if self.font_path and not os.path.isfile(self.font_path):
+                raise FileNotFoundError(f"Wordcloud font not found: {self.font_path}")
+            mask = self._load_mask() if self.mask_path else None
+            self._wordcloud = WordCloud(
+                width=self.width,
+                height=self.height,
+                font_path=self.font_path,
+                mask=mask,
+                min_word_length=self.min_word_length,
+                background_color=self.background_color,
+                color_func=self._color_func,
+                scale=1
+            )
+            logging.info(f"[{datetime.now()}] WordCloudRenderer: Ready ({self.width}x{self.height} {self.image_format}, font: {self.font_path or 'default'}, mask: {self.mask_path or 'none'}).")
+            return self._wordcloud
+
+    def render(self, texts):
+        """Returns a BytesIO with the encoded image; its `name` carries the file extension for Telegram."""
+        with self._lock:
+            image = self.preload().generate(" ".join(texts)).to_image()
+        return self._encode(image)
+
+    def render_frequencies(self, frequencies):
+        """Like render(), but from precomputed {word: count} (see WordFrequencyCounter)."""
+        with self._lock:
+            image = self.preload().generate_from_frequencies(frequencies).to_image()
+        return self._encode(image)
+
+    def _encode(self, image):
+        output = io.BytesIO()
+        image.save(output, format=self.image_format, **IMAGE_FORMATS[self.image_format]["save_kwargs"])
+        output.name = f"wordcloud.{IMAGE_FORMATS[self.image_format]['extension']}"
+        output.seek(0)
+        return output